@@ -0,0 +1,317 @@
+/*
+ * Optional compiled decoder backend for apptk.protobuf.
+ *
+ * Provides decode_varint() and scan_segment() with exactly the semantics of _py_decode_varint() and
+ * _py_scan_segment() in apptk/protobuf.py. apptk.protobuf registers this module as the "speedups" backend when it
+ * can be imported, and falls back to the pure-Python backend otherwise. See build.py.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <stdint.h>
+
+#define MAX_VARINT_LENGTH 10
+
+enum {
+    VARINT_OK = 0,
+    VARINT_TRUNCATED = -1,
+    VARINT_TOO_LONG = -2,
+};
+
+/*
+ * Read the varint at data[position]. The low 64 bits of the value go into *value and anything above that (only
+ * possible for a 10 byte varint) into *high, so that the caller can build the same (arbitrarily large) int as the
+ * Python implementation.
+ */
+static int
+read_varint(const uint8_t *data, Py_ssize_t end, Py_ssize_t position, uint64_t *value, uint64_t *high,
+            Py_ssize_t *length)
+{
+    uint64_t result = 0;
+    Py_ssize_t index;
+
+    for (index = 0; index < MAX_VARINT_LENGTH; index++) {
+        uint8_t byte;
+        if (position + index >= end) {
+            return VARINT_TRUNCATED;
+        }
+        byte = data[position + index];
+        if (index == MAX_VARINT_LENGTH - 1) {
+            result |= (uint64_t)(byte & 0x01) << 63;
+            *high = (byte & 0x7F) >> 1;
+        }
+        else {
+            result |= (uint64_t)(byte & 0x7F) << (7 * index);
+            *high = 0;
+        }
+        if (byte < 0x80) {
+            *value = result;
+            *length = index + 1;
+            return VARINT_OK;
+        }
+    }
+    return VARINT_TOO_LONG;
+}
+
+static PyObject *
+varint_to_long(uint64_t value, uint64_t high)
+{
+    PyObject *high_long, *shift, *shifted, *low, *result;
+
+    if (high == 0) {
+        return PyLong_FromUnsignedLongLong(value);
+    }
+
+    high_long = PyLong_FromUnsignedLongLong(high);
+    shift = PyLong_FromLong(64);
+    shifted = (high_long && shift) ? PyNumber_Lshift(high_long, shift) : NULL;
+    low = PyLong_FromUnsignedLongLong(value);
+    result = (shifted && low) ? PyNumber_Or(shifted, low) : NULL;
+    Py_XDECREF(high_long);
+    Py_XDECREF(shift);
+    Py_XDECREF(shifted);
+    Py_XDECREF(low);
+    return result;
+}
+
+static PyObject *
+decode_varint(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *keywords[] = {"buffer", "offset", NULL};
+    PyObject *buffer;
+    Py_ssize_t offset, length = 0;
+    Py_buffer view;
+    uint64_t value = 0, high = 0;
+    int status;
+    PyObject *value_long, *result;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "On:decode_varint", keywords, &buffer, &offset)) {
+        return NULL;
+    }
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "offset must not be negative");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE) < 0) {
+        return NULL;
+    }
+
+    status = read_varint((const uint8_t *)view.buf, view.len, offset, &value, &high, &length);
+    PyBuffer_Release(&view);
+
+    if (status == VARINT_TRUNCATED) {
+        PyErr_SetNone(PyExc_OverflowError);
+        return NULL;
+    }
+    if (status == VARINT_TOO_LONG) {
+        PyErr_Format(PyExc_ValueError, "Varint is longer than %d bytes at offset %zd", MAX_VARINT_LENGTH, offset);
+        return NULL;
+    }
+
+    value_long = varint_to_long(value, high);
+    if (value_long == NULL) {
+        return NULL;
+    }
+    result = Py_BuildValue("(Nn)", value_long, length);
+    return result;
+}
+
+/* Slice buffer[start:stop], copying straight out of the exported buffer for bytes. */
+static PyObject *
+slice_buffer(PyObject *buffer, const Py_buffer *view, Py_ssize_t start, Py_ssize_t stop)
+{
+    if (PyBytes_CheckExact(buffer)) {
+        return PyBytes_FromStringAndSize((const char *)view->buf + start, stop - start);
+    }
+    return PySequence_GetSlice(buffer, start, stop);
+}
+
+static int
+is_decoding_error(void)
+{
+    return PyErr_ExceptionMatches(PyExc_IndexError) || PyErr_ExceptionMatches(PyExc_ValueError) ||
+           PyErr_ExceptionMatches(PyExc_OverflowError);
+}
+
+static PyObject *
+scan_segment(PyObject *module, PyObject *args, PyObject *kwargs)
+{
+    static char *keywords[] = {"buffer", "offset", "data_cls", "value_types", NULL};
+    PyObject *buffer, *data_cls, *value_types;
+    Py_ssize_t offset, checkpoint, end, length;
+    Py_buffer view;
+    const uint8_t *data;
+    PyObject *types[8] = {NULL};
+    PyObject *VARINT = NULL, *STRING = NULL, *FIXED32 = NULL, *FIXED64 = NULL;
+    PyObject *items = NULL, *result = NULL;
+    int wire_type;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OnOO:scan_segment", keywords, &buffer, &offset, &data_cls,
+                                     &value_types)) {
+        return NULL;
+    }
+    if (offset < 0) {
+        PyErr_SetString(PyExc_ValueError, "offset must not be negative");
+        return NULL;
+    }
+    if (PyObject_GetBuffer(buffer, &view, PyBUF_SIMPLE) < 0) {
+        return NULL;
+    }
+    data = (const uint8_t *)view.buf;
+    end = view.len;
+
+    /* value_types.get(wire_type) for every possible wire type, looked up once. */
+    for (wire_type = 0; wire_type < 8; wire_type++) {
+        PyObject *key = PyLong_FromLong(wire_type);
+        if (key == NULL) {
+            goto done;
+        }
+        types[wire_type] = PyObject_GetItem(value_types, key);
+        Py_DECREF(key);
+        if (types[wire_type] == NULL) {
+            if (!PyErr_ExceptionMatches(PyExc_KeyError)) {
+                goto done;
+            }
+            PyErr_Clear();
+        }
+    }
+    VARINT = types[0];
+    FIXED64 = types[1];
+    STRING = types[2];
+    FIXED32 = types[5];
+    if (VARINT == NULL || FIXED64 == NULL || STRING == NULL || FIXED32 == NULL) {
+        PyErr_SetString(PyExc_KeyError, "value_types must map wire types 0, 1, 2 and 5");
+        goto done;
+    }
+
+    items = PyList_New(0);
+    if (items == NULL) {
+        goto done;
+    }
+
+    checkpoint = offset;
+    while (offset < end) {
+        uint64_t tag = 0, tag_high = 0, value = 0, value_high = 0;
+        PyObject *value_type, *value_obj = NULL, *field_no = NULL, *item;
+        int status;
+
+        checkpoint = offset;
+        status = read_varint(data, end, offset, &tag, &tag_high, &length);
+        if (status != VARINT_OK) {
+            goto stop;
+        }
+        offset += length;
+
+        value_type = types[tag & 0x07];
+
+        if (value_type != NULL && value_type == VARINT) {
+            if (read_varint(data, end, offset, &value, &value_high, &length) != VARINT_OK) {
+                goto stop;
+            }
+            offset += length;
+            value_obj = varint_to_long(value, value_high);
+        }
+        else if (value_type != NULL && value_type == STRING) {
+            if (read_varint(data, end, offset, &value, &value_high, &length) != VARINT_OK) {
+                goto stop;
+            }
+            offset += length;
+            if (value_high != 0 || value > (uint64_t)(end - offset)) {
+                goto stop;
+            }
+            value_obj = slice_buffer(buffer, &view, offset, offset + (Py_ssize_t)value);
+            offset += (Py_ssize_t)value;
+        }
+        else if (value_type != NULL && (value_type == FIXED32 || value_type == FIXED64)) {
+            Py_ssize_t size = value_type == FIXED32 ? 4 : 8;
+            if (offset + size > end) {
+                goto stop;
+            }
+            value_obj = slice_buffer(buffer, &view, offset, offset + size);
+            offset += size;
+        }
+        else {
+            /* Unknown wire type. */
+            goto stop;
+        }
+
+        if (value_obj == NULL) {
+            goto error;
+        }
+
+        if (tag_high == 0) {
+            field_no = PyLong_FromUnsignedLongLong(tag >> 3);
+        }
+        else {
+            PyObject *tag_long = varint_to_long(tag, tag_high);
+            PyObject *three = PyLong_FromLong(3);
+            field_no = (tag_long && three) ? PyNumber_Rshift(tag_long, three) : NULL;
+            Py_XDECREF(tag_long);
+            Py_XDECREF(three);
+        }
+        if (field_no == NULL) {
+            Py_DECREF(value_obj);
+            goto error;
+        }
+
+        item = PyObject_CallFunctionObjArgs(data_cls, field_no, value_obj, value_type, NULL);
+        Py_DECREF(field_no);
+        Py_DECREF(value_obj);
+        if (item == NULL) {
+            goto error;
+        }
+        if (PyList_Append(items, item) < 0) {
+            Py_DECREF(item);
+            goto done;
+        }
+        Py_DECREF(item);
+        continue;
+
+    error:
+        /* Like the Python implementation: decoding errors end the segment, anything else propagates. */
+        if (is_decoding_error()) {
+            PyErr_Clear();
+            goto stop;
+        }
+        goto done;
+    }
+
+    goto finish;
+
+stop:
+    /* Everything from the start of the field that couldn't be decoded is left over. */
+    offset = checkpoint;
+
+finish:
+    result = Py_BuildValue("(On)", items, offset);
+
+done:
+    for (wire_type = 0; wire_type < 8; wire_type++) {
+        Py_XDECREF(types[wire_type]);
+    }
+    Py_XDECREF(items);
+    PyBuffer_Release(&view);
+    return result;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"decode_varint", (PyCFunction)(void (*)(void))decode_varint, METH_VARARGS | METH_KEYWORDS,
+     "decode_varint(buffer, offset) -> (value, length)\n\nCompiled equivalent of _py_decode_varint()."},
+    {"scan_segment", (PyCFunction)(void (*)(void))scan_segment, METH_VARARGS | METH_KEYWORDS,
+     "scan_segment(buffer, offset, data_cls, value_types) -> (items, offset)\n\n"
+     "Compiled equivalent of _py_scan_segment()."},
+    {NULL, NULL, 0, NULL},
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "apptk._protobuf_speedups",
+    "Optional compiled decoder backend for apptk.protobuf.",
+    -1,
+    speedups_methods,
+};
+
+PyMODINIT_FUNC
+PyInit__protobuf_speedups(void)
+{
+    return PyModule_Create(&speedups_module);
+}
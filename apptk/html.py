@@ -1,11 +1,142 @@
+import codecs
+from collections import defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from enum import Enum
+from functools import lru_cache
+from html.parser import HTMLParser
 import itertools
-from typing import Union
+import os
+import re
+from typing import Callable, Iterable, Iterator, Mapping, NamedTuple, Optional, Union
 
 try:
     import bs4
+    import soupsieve
 except ImportError:
-    raise RuntimeError("Library `BeautifulSoup4` is required to use `apptk.html`.")
+    bs4 = None
+    soupsieve = None
+
+try:
+    import lxml.etree
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# lxml's CSS support is a separate package, and only CSS selectors evaluated against lxml documents need it.
+try:
+    from lxml import cssselect as lxml_cssselect
+except ImportError:
+    lxml_cssselect = None
+
+if bs4 is None and lxml is None:
+    raise RuntimeError("Library `BeautifulSoup4` or `lxml` is required to use `apptk.html`.")
+
+
+class Backend(Enum):
+    LXML = "lxml"
+    BS4 = "bs4"
+
+
+def parse_html(markup: Union[str, bytes], backend: Optional[Backend] = None):
+    """
+    Parse markup into a document that Selectors can be run against.
+
+    :param markup: The HTML to parse.
+    :param backend: (optional) Which tree to build: an lxml.html document or a BeautifulSoup. (Defaults to lxml when it
+                    is installed, since evaluating selectors against it is several times faster, unless `cssselect`
+                    is missing and BeautifulSoup4 can be used instead)
+    """
+    if backend is None:
+        use_lxml = lxml is not None and (lxml_cssselect is not None or bs4 is None)
+        backend = Backend.LXML if use_lxml else Backend.BS4
+
+    if backend is Backend.LXML:
+        if lxml is None:
+            raise RuntimeError("Backend `lxml` requires the `lxml` library to be installed.")
+        return lxml.html.document_fromstring(markup)
+
+    if bs4 is None:
+        raise RuntimeError("Backend `bs4` requires the `BeautifulSoup4` library to be installed.")
+    return bs4.BeautifulSoup(markup, "lxml" if lxml is not None else "html.parser")
+
+
+def is_lxml_element(element) -> bool:
+    return lxml is not None and isinstance(element, lxml.etree._Element)
+
+
+# Elements whose content isn't part of the text of the elements around them. bs4 parses it into its own string types
+# (Script, Stylesheet, TemplateString), which get_text() leaves out; the lxml and streaming paths skip it to match.
+TEXTLESS_ELEMENTS = frozenset({"script", "style", "template"})
+
+
+def _iter_lxml_text(element: "lxml.etree._Element") -> Iterator[str]:
+    """Yield the text nodes inside element, in document order, leaving out those of TEXTLESS_ELEMENTS descendants."""
+    if element.text:
+        yield element.text
+    for child in element:
+        # Comments and processing instructions have a non-str tag, and only their tail is text.
+        if isinstance(child.tag, str) and child.tag not in TEXTLESS_ELEMENTS:
+            yield from _iter_lxml_text(child)
+        if child.tail:
+            yield child.tail
+
+
+@lru_cache(maxsize=1024)
+def compile_css(path: str) -> "soupsieve.SoupSieve":
+    """
+    Compile a CSS selector with soupsieve, caching the result.
+
+    bs4's select()/select_one() compile their selector on every call. Compiling once and re-using the compiled object
+    across documents skips the parsing step.
+    """
+    return soupsieve.compile(path)
+
+
+@lru_cache(maxsize=1024)
+def compile_lxml_css(path: str) -> "lxml.cssselect.CSSSelector":
+    """Compile a CSS selector into an lxml CSSSelector (i.e. an XPath expression), caching the result."""
+    if lxml_cssselect is None:
+        raise RuntimeError("CSS selectors on lxml documents require the `cssselect` library to be installed.")
+    return lxml_cssselect.CSSSelector(path, translator="html")
+
+
+@lru_cache(maxsize=1024)
+def compile_xpath(path: str) -> "lxml.etree.XPath":
+    """Compile an XPath expression with lxml, caching the result."""
+    return lxml.etree.XPath(path)
+
+
+def _get_css_keys(compiled: "soupsieve.SoupSieve") -> Optional[list[tuple[str, str]]]:
+    """
+    Return ("id" / "class" / "tag", lowercased value) pairs, one per comma-separated alternative of compiled, such that
+    an element can only match compiled if it has one of them. Return None if some alternative doesn't require any.
+
+    This reads soupsieve's parsed selector, in which each alternative is the compound selector for the matched element
+    itself (its ancestors and siblings are in `relation`).
+    """
+    keys = []
+    try:
+        for alternative in compiled.selectors:
+            tag = alternative.tag
+            if alternative.ids:
+                keys.append(("id", alternative.ids[0].lower()))
+            elif alternative.classes:
+                keys.append(("class", alternative.classes[0].lower()))
+            elif tag is not None and tag.prefix is None and tag.name != "*":
+                keys.append(("tag", tag.name.lower()))
+            else:
+                return None
+    except AttributeError:
+        return None
+    return keys
+
+
+def _css_matcher(compiled: "soupsieve.SoupSieve", scope: "bs4.element.Tag") -> Callable[["bs4.element.Tag"], bool]:
+    """Return a function matching elements under scope against compiled."""
+    css_match = getattr(getattr(soupsieve, "css_match", None), "CSSMatch", None)
+    if css_match is None:
+        return compiled.match
+    return css_match(compiled.selectors, scope, compiled.namespaces, compiled.flags).match
 
 
 class Selector:
@@ -13,11 +144,21 @@ class Selector:
         CSS = "css"
         XPATH = "xpath"
 
+    class TextMode(Enum):
+        # All of the text inside the element, including that of its descendants (i.e. element.text). Like bs4's
+        # get_text(), the content of descendant TEXTLESS_ELEMENTS (<script>, <style>, <template>) is left out.
+        ALL = "all"
+        # Only the text nodes that are direct children of the element.
+        DIRECT = "direct"
+        # Only the first text node inside the element that isn't just whitespace.
+        FIRST = "first"
+
     path_type: PathType
     paths: list[str] = None
     attribute: str = None
     strip_trailing_whitespace: bool = True
     strip_leading_whitespace: bool = True
+    text_mode: TextMode = TextMode.ALL
 
     def __init__(
         self,
@@ -26,19 +167,22 @@ class Selector:
         attribute: str = None,
         strip_trailing_whitespace: bool = True,
         strip_leading_whitespace: bool = True,
+        text_mode: TextMode = TextMode.ALL,
     ):
         self.paths = [path] if isinstance(path, str) else path
         self.path_type = path_type
         self.attribute = attribute
         self.strip_leading_whitespace = strip_leading_whitespace
         self.strip_trailing_whitespace = strip_trailing_whitespace
+        self.text_mode = text_mode
 
-    def get_attribute(self, element: bs4.element.Tag) -> str:
+    def get_attribute(self, element: Union["bs4.element.Tag", "lxml.etree._Element", str]) -> str:
         """
         Extract the defined attribute's value from the passed in element.
 
         Extract the value of the attribute set by self.attribute from element. If self.attribute is None, then we just
-        convert the body of element to text and return that.
+        convert the body of element to text (as selected by self.text_mode) and return that. XPath expressions can also
+        select strings directly (e.g. `//a/@href`), which are returned as-is.
 
         The result is stripped of leading/trailing whitespace depending on the values of self.strip_leading_whitespace
         and self.strip_trailing_whitespace, respectively.
@@ -46,21 +190,620 @@ class Selector:
         :param element: The element
         :return: The value of the attribute or the text of the element.
         """
-        result = element.get(self.attribute) if self.attribute else element.text
+        if isinstance(element, str):
+            result = str(element)
+        elif self.attribute:
+            result = element.get(self.attribute)
+        else:
+            result = self.get_text(element)
+
+        if self.strip_leading_whitespace and self.strip_trailing_whitespace:
+            return result.strip()
         if self.strip_leading_whitespace:
-            result = result.lstrip()
+            return result.lstrip()
         if self.strip_trailing_whitespace:
-            result = result.rstrip()
+            return result.rstrip()
         return result
 
-    def parse(self, html: bs4.element.Tag, use_attribute: bool = True) -> list[Union[str, bs4.element.Tag]]:
-        return [
-            self.get_attribute(element) if use_attribute else element
-            for element in itertools.chain.from_iterable(html.select(path) for path in self.paths)
-        ]
+    def get_text(self, element: Union["bs4.element.Tag", "lxml.etree._Element"]) -> str:
+        """Return the text of element, as selected by self.text_mode."""
+        if is_lxml_element(element):
+            if self.text_mode is Selector.TextMode.ALL:
+                return "".join(_iter_lxml_text(element))
+            if self.text_mode is Selector.TextMode.DIRECT:
+                return (element.text or "") + "".join(child.tail or "" for child in element)
+            return next((text for text in _iter_lxml_text(element) if not text.isspace()), "")
 
-    def parse_one(self, html: bs4.element.Tag, use_attribute: bool = True):
+        if self.text_mode is Selector.TextMode.ALL:
+            return element.text
+        if self.text_mode is Selector.TextMode.DIRECT:
+            # element.strings are the strings get_text() includes (e.g. not comments, but Script inside a <script>).
+            return "".join(text for text in element.strings if text.parent is element)
+        return next((text for text in element.strings if not text.isspace()), "")
+
+    def iter_values(self, elements: Iterable) -> Iterator[str]:
+        """
+        Yield get_attribute() of each of elements.
+
+        When several paths match the same element, its value is only extracted once. The memo is keyed on id(): the
+        elements are kept referenced alongside their values, so an id can't be re-used by another element while the
+        memo is alive.
+        """
+        memo = {}
+        for element in elements:
+            key = id(element)
+            if key not in memo:
+                memo[key] = (element, self.get_attribute(element))
+            yield memo[key][1]
+
+    def select(self, html, path: str) -> list:
+        """
+        Return the elements (or, for XPath, possibly strings) path matches in html.
+
+        lxml documents are queried with lxml's compiled CSSSelector/XPath objects, BeautifulSoup ones with soupsieve.
+        XPath needs an lxml document.
+        """
+        if is_lxml_element(html):
+            compiled = compile_xpath(path) if self.path_type is Selector.PathType.XPATH else compile_lxml_css(path)
+            return compiled(html)
+        if self.path_type is Selector.PathType.XPATH:
+            raise ValueError("XPath selectors can only be evaluated against lxml documents (see parse_html()).")
+        return compile_css(path).select(html)
+
+    def select_one(self, html, path: str):
+        if is_lxml_element(html):
+            return next(iter(self.select(html, path)), None)
+        if self.path_type is Selector.PathType.XPATH:
+            raise ValueError("XPath selectors can only be evaluated against lxml documents (see parse_html()).")
+        element = compile_css(path).select_one(html)
+        # Matches parse_one()'s original behaviour of skipping empty bs4 Tags (which are falsy).
+        return element if element else None
+
+    def iter_parse(self, html, use_attribute: bool = True) -> Iterator:
+        """
+        Yield the values (or the elements) matched by each of self.paths in turn, without building a list.
+
+        BeautifulSoup documents are matched lazily, so stopping early also stops the search.
+        """
+        if is_lxml_element(html) or self.path_type is Selector.PathType.XPATH:
+            elements = itertools.chain.from_iterable(self.select(html, path) for path in self.paths)
+        else:
+            elements = itertools.chain.from_iterable(compile_css(path).iselect(html) for path in self.paths)
+        return self.iter_values(elements) if use_attribute else elements
+
+    def parse(self, html, use_attribute: bool = True) -> list:
+        return list(self.iter_parse(html, use_attribute=use_attribute))
+
+    def parse_one(self, html, use_attribute: bool = True):
         for path in self.paths:
-            element = html.select_one(path)
-            if element:
+            element = self.select_one(html, path)
+            if element is not None:
                 return self.get_attribute(element) if use_attribute else element
+
+
+class SelectorSet:
+    """
+    A named group of Selectors that are evaluated together.
+
+    Calling parse() on each of a page's Selectors walks the whole tree once per path, and tries every element against
+    the path. For BeautifulSoup documents, a SelectorSet walks the tree once. Each path is indexed by the id, class or
+    tag name an element needs in order to match it, so an element is only tried against the (pre-compiled) paths it
+    could match. Identical paths are only matched once. lxml documents are instead queried with each Selector's
+    compiled CSSSelector/XPath, since lxml evaluates those in C anyway.
+
+    Paths that use `:scope` depend on the element select() was called on, so they're matched with a separate select()
+    instead.
+
+        extractor = SelectorSet({"title": Selector("h1"), "links": Selector("a", attribute="href")})
+        extractor.extract_one(soup)  # {"title": "...", "links": "..."}
+        extractor.extract(soup)  # {"title": ["..."], "links": ["...", ...]}
+    """
+
+    selectors: dict[str, Selector]
+
+    def __init__(self, selectors: Mapping[str, Selector]):
+        self.selectors = dict(selectors)
+        # (name, path index, path) for every path of every Selector.
+        self._paths = [
+            (name, index, path)
+            for name, selector in self.selectors.items()
+            for index, path in enumerate(selector.paths)
+        ]
+        self._matchers = None
+        self._scoped = None
+        self._matchers_by_key = None
+        self._unkeyed_matchers = None
+
+    def _compile_bs4_matchers(self) -> None:
+        # Identical paths (e.g. shared between Selectors) are only matched once.
+        targets = {}
+        for name, index, path in self._paths:
+            if self.selectors[name].path_type is Selector.PathType.XPATH:
+                raise ValueError("XPath selectors can only be evaluated against lxml documents (see parse_html()).")
+            targets.setdefault(path, []).append((name, index))
+
+        self._scoped = []
+        self._matchers = []
+        # Matcher numbers by the tag name, id or class an element needs to have for the matcher's path to match it.
+        # Paths without one (e.g. `*` or `:is(a, b)`) are tried against every element.
+        self._matchers_by_key = {"tag": defaultdict(list), "id": defaultdict(list), "class": defaultdict(list)}
+        self._unkeyed_matchers = []
+        for path, path_targets in targets.items():
+            compiled = compile_css(path)
+            if ":scope" in path:
+                self._scoped.append((compiled, path_targets))
+                continue
+            number = len(self._matchers)
+            self._matchers.append((compiled, path_targets))
+            keys = _get_css_keys(compiled)
+            if keys is None:
+                self._unkeyed_matchers.append(number)
+            else:
+                for kind, value in keys:
+                    self._matchers_by_key[kind][value].append(number)
+
+    def _iter_candidates(self, element: "bs4.element.Tag") -> Iterator[int]:
+        """Yield the number of every matcher that could match element (possibly more than once)."""
+        by_key = self._matchers_by_key
+        yield from self._unkeyed_matchers
+        yield from by_key["tag"].get(element.name.lower(), ())
+        element_id = element.get("id")
+        if element_id and by_key["id"]:
+            yield from by_key["id"].get(element_id.lower(), ())
+        classes = element.get("class")
+        if classes and by_key["class"]:
+            for class_name in classes.split() if isinstance(classes, str) else classes:
+                yield from by_key["class"].get(class_name.lower(), ())
+
+    def _match(self, html, first_only: bool) -> dict[str, list[list]]:
+        """
+        Return, per Selector, a list of the elements matched by each of its paths, in document order.
+
+        With first_only, at most one element is collected per path and (for BeautifulSoup documents) the traversal
+        stops as soon as every path has one.
+        """
+        matches = {name: [[] for _path in selector.paths] for name, selector in self.selectors.items()}
+
+        if is_lxml_element(html):
+            for name, index, path in self._paths:
+                selector = self.selectors[name]
+                if first_only:
+                    element = selector.select_one(html, path)
+                    matches[name][index] = [element] if element is not None else []
+                else:
+                    matches[name][index] = selector.select(html, path)
+            return matches
+
+        if self._matchers is None:
+            self._compile_bs4_matchers()
+
+        for compiled, targets in self._scoped:
+            if first_only:
+                element = compiled.select_one(html)
+                found = [element] if element is not None else []
+            else:
+                found = compiled.select(html)
+            for name, index in targets:
+                matches[name][index] = list(found)
+
+        # One soupsieve matcher per path for the whole walk, as select() uses internally. SoupSieve.match() would set
+        # one up (which includes finding the document root) for every element.
+        matchers = [(_css_matcher(compiled, html), targets) for compiled, targets in self._matchers]
+        done = [False] * len(matchers)
+        remaining = len(matchers)
+        for element in html.descendants if remaining else ():
+            if not isinstance(element, bs4.element.Tag):
+                continue
+            tried = set()
+            for number in self._iter_candidates(element):
+                if number in tried or done[number]:
+                    continue
+                tried.add(number)
+                match, targets = matchers[number]
+                if match(element):
+                    for name, index in targets:
+                        matches[name][index].append(element)
+                    if first_only:
+                        done[number] = True
+                        remaining -= 1
+            if first_only and not remaining:
+                break
+
+        return matches
+
+    @staticmethod
+    def _found(element) -> bool:
+        # Selector.parse_one() skips empty bs4 Tags (which are falsy). lxml elements warn when used as a bool.
+        return element is not None and (is_lxml_element(element) or isinstance(element, str) or bool(element))
+
+    def extract(self, html, use_attribute: bool = True) -> dict[str, list]:
+        """
+        Evaluate every Selector against html, as Selector.parse() would.
+
+        :param html: The document (or element) to extract from.
+        :param use_attribute: (optional) Return the extracted values instead of the elements. (Defaults to True)
+        :return: A dict of the Selector's name to the list of matches.
+        """
+        return {
+            name: list(
+                self.selectors[name].iter_values(itertools.chain.from_iterable(path_matches))
+                if use_attribute
+                else itertools.chain.from_iterable(path_matches)
+            )
+            for name, path_matches in self._match(html, first_only=False).items()
+        }
+
+    def extract_one(self, html, use_attribute: bool = True) -> dict[str, Optional[object]]:
+        """
+        Evaluate every Selector against html, as Selector.parse_one() would.
+
+        :param html: The document (or element) to extract from.
+        :param use_attribute: (optional) Return the extracted values instead of the elements. (Defaults to True)
+        :return: A dict of the Selector's name to the first match, or None if nothing matched.
+        """
+        results = {}
+        for name, path_matches in self._match(html, first_only=True).items():
+            element = next((elements[0] for elements in path_matches if elements and self._found(elements[0])), None)
+            if element is not None and use_attribute:
+                element = self.selectors[name].get_attribute(element)
+            results[name] = element
+        return results
+
+
+# Elements that never have an end tag.
+VOID_ELEMENTS = frozenset(
+    {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "param", "source", "track", "wbr"}
+)
+
+# Elements whose end tag is commonly left out. Opening one of these while the same element is still open closes the
+# open one first (e.g. `<li>one<li>two`).
+AUTO_CLOSED_ELEMENTS = frozenset({"li", "p", "option", "tr", "td", "th", "dt", "dd"})
+
+_COMPOUND_RE = re.compile(r"(?P<tag>[a-zA-Z][\w-]*|\*)?(?P<rest>(?:[.#][\w-]+|\[[^\]]+\])*)")
+_COMPOUND_PART_RE = re.compile(r"([.#])([\w-]+)|\[\s*([\w-]+)\s*(?:=\s*(\"[^\"]*\"|'[^']*'|[^\]\s]+)\s*)?\]")
+
+
+class SimpleSelector(NamedTuple):
+    """One compound selector (e.g. `a.external[href]`) and the combinator joining it to the previous one."""
+
+    combinator: Optional[str]
+    tag: Optional[str]
+    id: Optional[str]
+    classes: frozenset
+    attributes: tuple
+
+    def matches(self, tag: str, attrs: dict) -> bool:
+        if self.tag is not None and self.tag != tag:
+            return False
+        if self.id is not None and attrs.get("id") != self.id:
+            return False
+        if self.classes and not self.classes.issubset((attrs.get("class") or "").split()):
+            return False
+        for name, value in self.attributes:
+            if name not in attrs or (value is not None and attrs[name] != value):
+                return False
+        return True
+
+
+@lru_cache(maxsize=1024)
+def compile_simple_css(path: str) -> tuple[tuple[SimpleSelector, ...], ...]:
+    """
+    Compile the subset of CSS that StreamingExtractor supports.
+
+    That is tag, `.class`, `#id`, `[attr]` and `[attr=value]` compounds, joined by descendant (` `) or child (`>`)
+    combinators, with `,` separating alternatives.
+
+    :return: A tuple of alternatives, each a tuple of SimpleSelectors.
+    :raises ValueError: If path uses anything outside of that subset.
+    """
+    alternatives = []
+    for alternative in path.split(","):
+        steps = []
+        combinator = None
+        for token in alternative.replace(">", " > ").split():
+            if token == ">":
+                if not steps or combinator == ">":
+                    raise ValueError(f"Unsupported selector for streaming extraction: {path}")
+                combinator = ">"
+                continue
+
+            match = _COMPOUND_RE.fullmatch(token)
+            if not match or not token:
+                raise ValueError(f"Unsupported selector for streaming extraction: {path}")
+
+            id_ = None
+            classes = set()
+            attributes = []
+            for prefix, name, attribute, value in _COMPOUND_PART_RE.findall(match.group("rest")):
+                if prefix == "#":
+                    id_ = name
+                elif prefix == ".":
+                    classes.add(name)
+                else:
+                    attributes.append((attribute.lower(), value.strip("\"'") if value else None))
+
+            tag = match.group("tag")
+            steps.append(
+                SimpleSelector(
+                    combinator=(combinator or " ") if steps else None,
+                    tag=tag.lower() if tag and tag != "*" else None,
+                    id=id_,
+                    classes=frozenset(classes),
+                    attributes=tuple(attributes),
+                )
+            )
+            combinator = None
+
+        if not steps or combinator is not None:
+            raise ValueError(f"Unsupported selector for streaming extraction: {path}")
+        alternatives.append(tuple(steps))
+    return tuple(alternatives)
+
+
+def _matches_steps(steps: tuple[SimpleSelector, ...], stack: list, position: int) -> bool:
+    """Check whether steps (right to left) match the element at stack[position] and its ancestors."""
+    step = steps[-1]
+    tag, attrs = stack[position][:2]
+    if not step.matches(tag, attrs):
+        return False
+    if len(steps) == 1:
+        return True
+    if step.combinator == ">":
+        return position > 0 and _matches_steps(steps[:-1], stack, position - 1)
+    return any(_matches_steps(steps[:-1], stack, ancestor) for ancestor in range(position - 1, -1, -1))
+
+
+class StreamingExtractor(HTMLParser):
+    """
+    Evaluate Selectors against HTML as it arrives, without building a tree.
+
+    Only the currently open elements (and the text of the elements being extracted) are kept in memory, so memory use
+    stays flat no matter how large the page is. The catch is that only a subset of CSS is supported (see
+    compile_simple_css()), and that values come out in document order rather than grouped per Selector path. Values of
+    attributes are produced as soon as the element opens, text when the element closes.
+
+    Example::
+        extractor = StreamingExtractor({"links": Selector("a", attribute="href")})
+        for chunk in response.iter_content(chunk_size=65536):
+            for name, value in extractor.feed(chunk):
+                handle(name, value)
+        extractor.close()
+    """
+
+    def __init__(self, selectors: Mapping[str, Selector], encoding: str = "utf-8") -> None:
+        """
+        Initialize the extractor.
+
+        :param selectors: The named Selectors to evaluate. They must be CSS Selectors.
+        :param encoding: (optional) The encoding used to decode bytes chunks. (Defaults to utf-8)
+        :raises ValueError: If one of the Selectors isn't supported.
+        """
+        super().__init__(convert_charrefs=True)
+        self.selectors = dict(selectors)
+        self._compiled = []
+        for name, selector in self.selectors.items():
+            if selector.path_type is not Selector.PathType.CSS:
+                raise ValueError(f"Selector {name!r}: only CSS selectors can be used for streaming extraction.")
+            alternatives = itertools.chain.from_iterable(compile_simple_css(path) for path in selector.paths)
+            self._compiled.append((name, selector, tuple(alternatives)))
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+        # (tag, attrs, captures) for each open element, where captures holds the text being collected for the
+        # Selectors that matched it.
+        self._stack = []
+        self._captures = []
+        self._results = []
+        # The pieces of the text node being read. HTMLParser can hand one text node over in several handle_data()
+        # calls (e.g. when it is split across chunks), so TextMode.FIRST only looks at it once the next tag ends it.
+        self._text = []
+        # The stack positions of the open TEXTLESS_ELEMENTS. Their content is only text to captures inside them.
+        self._textless = []
+        # The innermost of those when the text node being read started, i.e. the position captures need to be at.
+        self._text_min_position = 0
+
+    def feed(self, chunk: Union[str, bytes]) -> list[tuple[str, str]]:
+        """
+        Add a chunk of the document.
+
+        :param chunk: The next chunk of the document.
+        :return: The (Selector name, value) pairs completed by this chunk.
+        """
+        super().feed(self._decoder.decode(chunk) if isinstance(chunk, bytes) else chunk)
+        return self._take_results()
+
+    def close(self) -> list[tuple[str, str]]:
+        """
+        Finish the document, closing any elements that are still open.
+
+        :return: The remaining (Selector name, value) pairs.
+        """
+        super().feed(self._decoder.decode(b"", final=True))
+        super().close()
+        self._end_text()
+        while self._stack:
+            self._pop()
+        return self._take_results()
+
+    def _take_results(self) -> list[tuple[str, str]]:
+        results, self._results = self._results, []
+        return results
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self._end_text()
+        if tag in AUTO_CLOSED_ELEMENTS and self._stack and self._stack[-1][0] == tag:
+            self._pop()
+
+        attrs = dict(attrs)
+        captures = []
+        self._stack.append((tag, attrs, captures))
+        position = len(self._stack) - 1
+        if tag in TEXTLESS_ELEMENTS:
+            self._textless.append(position)
+
+        for name, selector, alternatives in self._compiled:
+            if not any(_matches_steps(steps, self._stack, position) for steps in alternatives):
+                continue
+            if selector.attribute:
+                value = attrs.get(selector.attribute)
+                if value is not None:
+                    self._results.append((name, selector.get_attribute(value)))
+            else:
+                capture = (name, selector, [], position)
+                captures.append(capture)
+                self._captures.append(capture)
+
+        if tag in VOID_ELEMENTS:
+            self._pop()
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, Optional[str]]]) -> None:
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self._pop()
+
+    def handle_endtag(self, tag: str) -> None:
+        self._end_text()
+        # Stray end tags are ignored, and end tags close any elements inside them that were left open.
+        for position in range(len(self._stack) - 1, -1, -1):
+            if self._stack[position][0] == tag:
+                while len(self._stack) > position:
+                    self._pop()
+                return
+
+    def handle_data(self, data: str) -> None:
+        depth = len(self._stack) - 1
+        min_position = self._textless[-1] if self._textless else 0
+        wants_text_node = False
+        for _name, selector, parts, position in self._captures:
+            if position < min_position:
+                continue
+            if selector.text_mode is Selector.TextMode.ALL:
+                parts.append(data)
+            elif selector.text_mode is Selector.TextMode.DIRECT:
+                if depth == position:
+                    parts.append(data)
+            elif not parts:
+                wants_text_node = True
+        if wants_text_node:
+            self._text_min_position = min_position
+            self._text.append(data)
+
+    def handle_comment(self, data: str) -> None:
+        self._end_text()
+
+    def handle_decl(self, decl: str) -> None:
+        self._end_text()
+
+    def handle_pi(self, data: str) -> None:
+        self._end_text()
+
+    def unknown_decl(self, data: str) -> None:
+        self._end_text()
+
+    def _end_text(self) -> None:
+        """Finish the text node being read, making it the value of TextMode.FIRST captures still without one."""
+        if not self._text:
+            return
+        text = "".join(self._text)
+        self._text = []
+        if text.isspace():
+            return
+        for _name, selector, parts, position in self._captures:
+            if selector.text_mode is Selector.TextMode.FIRST and not parts and position >= self._text_min_position:
+                parts.append(text)
+
+    def _pop(self) -> None:
+        _tag, _attrs, captures = self._stack.pop()
+        if self._textless and self._textless[-1] == len(self._stack):
+            self._textless.pop()
+        if captures:
+            # Captures are compared by identity: two nested matches can have equal text so far.
+            self._captures = [capture for capture in self._captures if all(capture is not c for c in captures)]
+        for name, selector, parts, _position in captures:
+            self._results.append((name, selector.get_attribute("".join(parts))))
+
+
+def iter_extract(
+    chunks: Iterable[Union[str, bytes]], selectors: Mapping[str, Selector], encoding: str = "utf-8"
+) -> Iterator[tuple[str, str]]:
+    """
+    Stream (Selector name, value) pairs out of a document, e.g. response.iter_content() or an open file.
+
+    See StreamingExtractor.
+
+    :param chunks: The document, in chunks.
+    :param selectors: The named Selectors to evaluate.
+    :param encoding: (optional) The encoding used to decode bytes chunks. (Defaults to utf-8)
+    """
+    extractor = StreamingExtractor(selectors, encoding=encoding)
+    for chunk in chunks:
+        yield from extractor.feed(chunk)
+    yield from extractor.close()
+
+
+# The SelectorSet each extract_many() worker process evaluates, set up once per process by _init_extract_worker().
+_worker_selector_set: Optional[SelectorSet] = None
+
+
+def _init_extract_worker(selectors: Mapping[str, Selector]) -> None:
+    global _worker_selector_set
+    _worker_selector_set = SelectorSet(selectors)
+
+
+def _extract_document(markup: Union[str, bytes], first_only: bool, backend: Optional[Backend]) -> dict:
+    document = parse_html(markup, backend=backend)
+    if first_only:
+        return _worker_selector_set.extract_one(document)
+    return _worker_selector_set.extract(document)
+
+
+def extract_many(
+    documents: Iterable[Union[str, bytes]],
+    selectors: Mapping[str, Selector],
+    workers: Optional[int] = None,
+    max_pending: Optional[int] = None,
+    first_only: bool = False,
+    backend: Optional[Backend] = None,
+) -> Iterator[dict]:
+    """
+    Parse many documents and evaluate the same named Selectors against each, in a process pool.
+
+    Parsing and extraction are CPU-bound, so this spreads them over several processes. The Selectors are sent to each
+    worker once, the raw documents go out one at a time and only the extracted strings come back: parsed trees are
+    never pickled.
+
+    Example::
+        >>> selectors = {"title": Selector("h1"), "links": Selector("a", attribute="href")}
+        >>> for result in extract_many(pages, selectors, workers=8):
+        ...     handle(result["title"], result["links"])
+
+    :param documents: An iterable of raw HTML documents.
+    :param selectors: The named Selectors to evaluate.
+    :param workers: (optional) The number of worker processes. (Defaults to os.cpu_count())
+    :param max_pending: (optional) The maximum number of documents submitted to the pool at any time, which keeps
+                        memory bounded for long iterables. (Defaults to 4 * workers)
+    :param first_only: (optional) Extract like SelectorSet.extract_one() instead of SelectorSet.extract().
+                       (Defaults to False)
+    :param backend: (optional) Passed on to parse_html().
+    :return: The {name: result} dict of each document, in the order of documents.
+    """
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+    documents = iter(documents)
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=_init_extract_worker, initargs=(dict(selectors),)
+    ) as pool:
+        queue: deque[Future] = deque()
+
+        def submit_next() -> bool:
+            for markup in documents:
+                queue.append(pool.submit(_extract_document, markup, first_only, backend))
+                return True
+            return False
+
+        while len(queue) < max_pending and submit_next():
+            pass
+
+        while queue:
+            future = queue.popleft()
+            submit_next()
+            yield future.result()
@@ -1,10 +1,32 @@
+import asyncio
+from bisect import bisect_left
+import bz2
+from collections import Counter, defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from copy import copy
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
 from enum import Enum
+from functools import lru_cache
+import hashlib
+from http.cookiejar import Cookie, CookieJar
+import json
+import lzma
+import os
 from pathlib import Path
+import random
+import sqlite3
 from tempfile import NamedTemporaryFile
-from typing import Union
+import threading
+import time
+from typing import Callable, Iterable, Iterator, NamedTuple, Optional, Union
+from urllib.parse import urlsplit
+import zlib
 
 try:
     import requests
+    from requests.adapters import HTTPAdapter
+    import urllib3
 except ImportError:
     raise RuntimeError("Library `requests` is required to use `apptk.http`.")
 
@@ -13,6 +35,16 @@ try:
 except ImportError:
     cloudscraper = None
 
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # This default headers are "hard-coded" and will always apply to Client instances. They've been defined at this
 # top-level to indicate that there is no intention that they should be over-ridden
 DEFAULT_HEADERS = {
@@ -20,6 +52,19 @@ DEFAULT_HEADERS = {
 }
 
 
+# Ranged downloads keep their progress in a sidecar file named after the download, saved at most this many seconds
+# apart (and whenever the download stops).
+DOWNLOAD_STATE_SUFFIX = ".download-state"
+DOWNLOAD_STATE_SAVE_INTERVAL = 1.0
+
+# AsyncHttpClient.download_file() collects this many bytes before handing them to a worker thread to write.
+ASYNC_WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+# Status codes that can be cached without explicit freshness information (RFC 7231 section 6.1).
+CACHEABLE_STATUS_CODES = frozenset({200, 203, 204, 300, 301, 308, 404, 405, 410, 414, 501})
+
+
 class HttpMethod(Enum):
     OPTIONS = "options"
     GET = "get"
@@ -32,6 +77,956 @@ class HttpMethod(Enum):
     PATCH = "patch"
 
 
+def to_http_method(method: Union[HttpMethod, str]) -> HttpMethod:
+    """
+    Convert a method name (e.g. "get") to a HttpMethod.
+
+    :raises ValueError: If method is not a valid HttpMethod.
+    """
+    if isinstance(method, HttpMethod):
+        return method
+
+    try:
+        return HttpMethod[method.upper()]
+    except KeyError:
+        raise ValueError(f"Not a valid HttpMethod: {method}")
+
+
+class HttpCache:
+    """
+    An on-disk HTTP response cache backed by SQLite.
+
+    Responses are stored according to their Cache-Control / Expires headers and served without a request while fresh.
+    Stale responses with an ETag or Last-Modified header are revalidated with a conditional request, so an unchanged
+    resource only costs a 304. Once the stored bodies add up to more than max_size bytes, the least recently used
+    responses are evicted.
+
+    The hits, misses and revalidations counters record how each cacheable request was served.
+    """
+
+    hits: int
+    misses: int
+    revalidations: int
+
+    def __init__(self, path: Union[str, Path], max_size: int = 256 * 1024 * 1024) -> None:
+        """
+        Open (or create) the cache.
+
+        :param path: The path of the SQLite database.
+        :param max_size: (optional) The maximum total size of the stored bodies, in bytes. (Defaults to 256 MiB)
+        """
+        self.path = path
+        self.max_size = max_size
+        self.hits = self.misses = self.revalidations = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "url TEXT PRIMARY KEY, status INTEGER, reason TEXT, headers TEXT, vary TEXT, body BLOB, size INTEGER, "
+            "expires_at REAL, accessed_at REAL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidations": self.revalidations}
+
+    def _count(self, name: str) -> None:
+        """Increment the counter called name. The cache is shared by every thread using the client."""
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def close(self) -> None:
+        self._db.close()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+
+    def get(self, request: requests.PreparedRequest) -> Optional[dict]:
+        """Return the stored response for request (fresh or not), or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT status, reason, headers, vary, body, expires_at FROM responses WHERE url = ?", (request.url,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), request.url))
+
+        status, reason, headers, vary, body, expires_at = row
+        vary = json.loads(vary)
+        if any(request.headers.get(name) != value for name, value in vary.items()):
+            return None
+
+        return {
+            "status": status,
+            "reason": reason,
+            "headers": json.loads(headers),
+            "body": body,
+            "expires_at": expires_at,
+        }
+
+    def store(self, request: requests.PreparedRequest, response: requests.Response) -> bool:
+        """
+        Store response if it is cacheable.
+
+        :return: True if the response was stored.
+        """
+        if response.status_code not in CACHEABLE_STATUS_CODES:
+            return False
+
+        cache_control = parse_cache_control(response.headers.get("Cache-Control", ""))
+        vary_names = [name.strip() for name in response.headers.get("Vary", "").split(",") if name.strip()]
+        if "no-store" in cache_control or "*" in vary_names:
+            return False
+
+        expires_at = get_expires_at(response.headers, cache_control)
+        has_validator = "ETag" in response.headers or "Last-Modified" in response.headers
+        if expires_at <= time.time() and not has_validator:
+            return False
+
+        # The body is stored decoded, so the headers describing the encoded body no longer apply.
+        headers = {
+            name: value
+            for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        }
+        vary = {name: request.headers.get(name) for name in vary_names}
+        body = response.content
+        now = time.time()
+
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    request.url,
+                    response.status_code,
+                    response.reason,
+                    json.dumps(headers),
+                    json.dumps(vary),
+                    body,
+                    len(body),
+                    expires_at,
+                    now,
+                ),
+            )
+            self._evict()
+
+        return True
+
+    def refresh(self, request: requests.PreparedRequest, not_modified: requests.Response) -> Optional[dict]:
+        """Update a stored response with the headers of a 304 response to a conditional request, and return it."""
+        entry = self.get(request)
+        if entry is None:
+            return None
+
+        entry["headers"].update(
+            (name, value)
+            for name, value in not_modified.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        )
+        cache_control = parse_cache_control(entry["headers"].get("Cache-Control", ""))
+        entry["expires_at"] = get_expires_at(requests.structures.CaseInsensitiveDict(entry["headers"]), cache_control)
+
+        with self._lock:
+            self._db.execute(
+                "UPDATE responses SET headers = ?, expires_at = ? WHERE url = ?",
+                (json.dumps(entry["headers"]), entry["expires_at"], request.url),
+            )
+
+        return entry
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total <= self.max_size:
+            return
+
+        evict = []
+        for url, size in self._db.execute("SELECT url, size FROM responses ORDER BY accessed_at"):
+            if total <= self.max_size:
+                break
+            evict.append((url,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE url = ?", evict)
+
+
+def parse_cache_control(value: str) -> dict[str, Optional[str]]:
+    """Parse a Cache-Control header into a {directive: argument} dict (argument is None for bare directives)."""
+    directives = {}
+    for directive in value.split(","):
+        name, _sep, argument = directive.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"') if argument else None
+    return directives
+
+
+def get_expires_at(headers, cache_control: dict[str, Optional[str]]) -> float:
+    """Return the timestamp at which a response stops being fresh (0 if it must always be revalidated)."""
+    if "no-cache" in cache_control:
+        return 0
+
+    max_age = cache_control.get("max-age")
+    if max_age is not None:
+        try:
+            return time.time() + int(max_age)
+        except ValueError:
+            return 0
+
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            expires_at = parsedate_to_datetime(expires).timestamp()
+            date = parsedate_to_datetime(headers["Date"]).timestamp() if "Date" in headers else time.time()
+        except (TypeError, ValueError, IndexError):
+            return 0
+        return time.time() + (expires_at - date)
+
+    return 0
+
+
+@dataclass
+class RetryPolicy:
+    """
+    How HttpClient retries failed requests.
+
+    Requests are retried when they fail to connect / time out, or when the response status is in status_forcelist.
+    The n-th retry waits backoff_factor * 2 ** n seconds (capped at max_backoff), reduced by a random amount of up to
+    jitter * 100 percent so that many clients don't retry in lockstep. A Retry-After header on the response takes
+    precedence if respect_retry_after is set, unless it asks for more than max_backoff seconds, in which case the
+    response is not retried at all.
+    """
+
+    max_retries: int = 3
+    backoff_factor: float = 0.5
+    max_backoff: float = 60.0
+    jitter: float = 0.5
+    status_forcelist: frozenset[int] = frozenset({429, 500, 502, 503, 504})
+    allowed_methods: frozenset[str] = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE", "TRACE"})
+    respect_retry_after: bool = True
+    retry_connection_errors: bool = True
+
+    def should_retry(self, method: str, attempt: int, response: Optional[requests.Response] = None) -> bool:
+        """
+        Return True if attempt number `attempt` (starting at 0) of a request should be retried.
+
+        :param method: The request method.
+        :param attempt: The number of retries already made.
+        :param response: (optional) The response, or None if the request failed to complete.
+        """
+        if attempt >= self.max_retries or method.upper() not in self.allowed_methods:
+            return False
+        if response is None:
+            return self.retry_connection_errors
+        if response.status_code not in self.status_forcelist:
+            return False
+        if self.respect_retry_after:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None and retry_after > self.max_backoff:
+                return False
+        return True
+
+    def get_backoff(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """Return how many seconds to wait before retry number attempt + 1."""
+        if self.respect_retry_after and response is not None:
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(self.max_backoff, retry_after)
+
+        backoff = min(self.max_backoff, self.backoff_factor * (2**attempt))
+        return backoff * (1 - self.jitter * random.random())
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Return the number of seconds a Retry-After header value (delay-seconds or HTTP-date) asks for, if valid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+class RateLimiter:
+    """
+    A thread-safe, per-host token bucket rate limiter that adapts to throttling.
+
+    Each host starts at `rate` requests per second. A throttling response (see throttle_status_codes) multiplies the
+    host's rate by decrease_factor, and every successful (1xx-3xx) response adds increase back on, up to max_rate.
+    Other errors leave the rate alone. This settles around the highest rate a host accepts without hand-tuned sleeps.
+    """
+
+    throttle_status_codes = frozenset({429, 503})
+
+    def __init__(
+        self,
+        rate: float = 10.0,
+        burst: Optional[float] = None,
+        min_rate: float = 0.1,
+        max_rate: Optional[float] = None,
+        increase: float = 0.1,
+        decrease_factor: float = 0.5,
+    ) -> None:
+        """
+        Initialize the limiter.
+
+        :param rate: (optional) The initial requests per second allowed for each host. (Defaults to 10)
+        :param burst: (optional) The bucket size, i.e. how many requests can go out at once. (Defaults to rate)
+        :param min_rate: (optional) The rate never drops below this. (Defaults to 0.1)
+        :param max_rate: (optional) The rate never rises above this. (Defaults to rate)
+        :param increase: (optional) Requests per second added after each successful response. (Defaults to 0.1)
+        :param decrease_factor: (optional) The rate is multiplied by this on a throttling response. (Defaults to 0.5)
+        """
+        self.initial_rate = rate
+        self.burst = burst or rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.increase = increase
+        self.decrease_factor = decrease_factor
+        self._lock = threading.Lock()
+        self._buckets: dict[str, list[float]] = {}  # host -> [rate, tokens, updated_at]
+
+    def _get_bucket(self, host: str) -> list[float]:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = [self.initial_rate, min(self.burst, self.initial_rate), time.monotonic()]
+        return bucket
+
+    def get_rate(self, host: str) -> float:
+        with self._lock:
+            return self._get_bucket(host)[0]
+
+    def acquire(self, host: str) -> None:
+        """Block until a request to host is allowed."""
+        while True:
+            with self._lock:
+                bucket = self._get_bucket(host)
+                rate, tokens, updated_at = bucket
+                now = time.monotonic()
+                tokens = min(self.burst, tokens + (now - updated_at) * rate)
+                if tokens >= 1:
+                    bucket[1:] = [tokens - 1, now]
+                    return
+                bucket[1:] = [tokens, now]
+                wait_for = (1 - tokens) / rate
+            time.sleep(wait_for)
+
+    def update(self, host: str, status_code: int) -> None:
+        """Adjust the rate for host based on the status of a response."""
+        with self._lock:
+            bucket = self._get_bucket(host)
+            if status_code in self.throttle_status_codes:
+                bucket[0] = max(self.min_rate, bucket[0] * self.decrease_factor)
+                bucket[1] = min(bucket[1], 0)
+            elif status_code < 400:
+                bucket[0] = min(self.max_rate, bucket[0] + self.increase)
+
+
+# Histogram bucket upper bounds for request timings (seconds) and transfer sizes (bytes).
+TIMING_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SIZE_BUCKETS = tuple(2**exponent for exponent in range(8, 31, 2))
+THROUGHPUT_BUCKETS = tuple(2**exponent for exponent in range(10, 34, 2))
+
+
+@dataclass
+class RequestTiming:
+    """
+    What happened during a single request.
+
+    connect covers DNS resolution, the TCP connect and the TLS handshake together, and is None when a pooled
+    connection was reused. ttfb is the time from sending the (last, if retried) attempt until its response headers
+    arrived, connect included. For streamed responses the body hasn't been read yet when this is recorded, so total is the
+    time until the response headers and bytes_in is None.
+    """
+
+    method: str
+    url: str
+    host: str
+    status: Optional[int]
+    total: float
+    ttfb: Optional[float] = None
+    connect: Optional[float] = None
+    bytes_out: int = 0
+    bytes_in: Optional[int] = None
+    retries: int = 0
+    reused_connection: bool = False
+    from_cache: bool = False
+    error: Optional[str] = None
+
+
+class Instrumentation:
+    """
+    The interface HttpClient reports requests and downloads to. The methods here do nothing; override them.
+
+    Methods are called from whichever thread made the request, so implementations need to be thread-safe.
+    """
+
+    def record_request(self, timing: RequestTiming) -> None:
+        pass
+
+    def record_download(self, url: str, size: int, seconds: float) -> None:
+        pass
+
+
+class Histogram:
+    """A thread-safe histogram over fixed buckets (upper bounds), with a running count and sum."""
+
+    def __init__(self, buckets: Iterable[float]) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Return the upper bound of the bucket holding the q-th quantile (inf if it is past the last bucket)."""
+        with self._lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "buckets": dict(zip(self.buckets + (float("inf"),), self.counts)),
+                "count": self.count,
+                "sum": self.sum,
+            }
+
+
+class HttpMetrics(Instrumentation):
+    """
+    Instrumentation that aggregates requests into per-host, in-process histograms and counters.
+
+    Use snapshot() to dump the current values or to_prometheus() to expose them in the Prometheus text format.
+    """
+
+    histogram_buckets = {
+        "connect_seconds": TIMING_BUCKETS,
+        "ttfb_seconds": TIMING_BUCKETS,
+        "total_seconds": TIMING_BUCKETS,
+        "bytes_out": SIZE_BUCKETS,
+        "bytes_in": SIZE_BUCKETS,
+        "download_bytes_per_second": THROUGHPUT_BUCKETS,
+    }
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.histograms: dict[tuple[str, str], Histogram] = {}
+        self.counters: Counter = Counter()
+
+    def observe(self, name: str, host: str, value: float) -> None:
+        histogram = self.histograms.get((name, host))
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault((name, host), Histogram(self.histogram_buckets[name]))
+        histogram.observe(value)
+
+    def increment(self, name: str, host: str, label: str = "", value: int = 1) -> None:
+        with self._lock:
+            self.counters[(name, host, label)] += value
+
+    def record_request(self, timing: RequestTiming) -> None:
+        host = timing.host
+        self.increment("requests", host, str(timing.status) if timing.status is not None else timing.error or "")
+        if timing.retries:
+            self.increment("retries", host, value=timing.retries)
+        if timing.from_cache:
+            self.increment("cache_hits", host)
+            return
+
+        self.increment("connections", host, "reused" if timing.reused_connection else "new")
+        self.observe("total_seconds", host, timing.total)
+        self.observe("bytes_out", host, timing.bytes_out)
+        if timing.ttfb is not None:
+            self.observe("ttfb_seconds", host, timing.ttfb)
+        if timing.connect is not None:
+            self.observe("connect_seconds", host, timing.connect)
+        if timing.bytes_in is not None:
+            self.observe("bytes_in", host, timing.bytes_in)
+
+    def record_download(self, url: str, size: int, seconds: float) -> None:
+        host = urlsplit(url).netloc
+        self.increment("download_bytes", host, value=size)
+        self.observe("download_bytes_per_second", host, size / seconds if seconds > 0 else float("inf"))
+
+    def snapshot(self) -> dict:
+        """Return {"histograms": {name: {host: ...}}, "counters": {name: {host: {label: value}}}}."""
+        with self._lock:
+            histograms = list(self.histograms.items())
+            counters = list(self.counters.items())
+
+        result: dict = {"histograms": defaultdict(dict), "counters": defaultdict(lambda: defaultdict(dict))}
+        for (name, host), histogram in histograms:
+            result["histograms"][name][host] = histogram.snapshot()
+        for (name, host, label), value in counters:
+            result["counters"][name][host][label] = value
+        return json.loads(json.dumps(result))
+
+    def to_prometheus(self, prefix: str = "apptk_http_") -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            counters = sorted(self.counters.items())
+
+        for (name, host, label), value in counters:
+            labels = f'host="{host}"' + (f',label="{label}"' if label else "")
+            lines.append(f"{prefix}{name}_total{{{labels}}} {value}")
+
+        for (name, host), histogram in histograms:
+            snapshot = histogram.snapshot()
+            cumulative = 0
+            for bound, count in snapshot["buckets"].items():
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'{prefix}{name}_bucket{{host="{host}",le="{le}"}} {cumulative}')
+            lines.append(f'{prefix}{name}_count{{host="{host}"}} {snapshot["count"]}')
+            lines.append(f'{prefix}{name}_sum{{host="{host}"}} {snapshot["sum"]}')
+
+        return "\n".join(lines) + "\n"
+
+
+# Connections opened by an instrumented HttpAdapter's pools record how long connect() took here, so that the adapter
+# can tell a new connection from a reused one and report the connect time.
+_connection_timing = threading.local()
+
+
+class _TimedConnectionMixin:
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            _connection_timing.connect = time.perf_counter() - start
+
+
+@lru_cache(maxsize=None)
+def _timed_pool_class(pool_cls: type) -> type:
+    """Return a subclass of pool_cls whose connections (of the pool's own ConnectionCls) time connect()."""
+    if issubclass(pool_cls.ConnectionCls, _TimedConnectionMixin):
+        return pool_cls
+    connection_cls = type(
+        f"_Timed{pool_cls.ConnectionCls.__name__}", (_TimedConnectionMixin, pool_cls.ConnectionCls), {}
+    )
+    return type(f"_Timed{pool_cls.__name__}", (pool_cls,), {"ConnectionCls": connection_cls})
+
+
+def _install_timed_pools(manager: "urllib3.PoolManager") -> None:
+    """Make manager's pools time how long their connections take to connect."""
+    manager.pool_classes_by_scheme = {
+        scheme: _timed_pool_class(pool_cls) for scheme, pool_cls in manager.pool_classes_by_scheme.items()
+    }
+
+
+def _request_size(request: requests.PreparedRequest) -> int:
+    """Return the approximate number of bytes request takes up on the wire."""
+    size = len(request.method or "") + len(request.path_url) + 12
+    size += sum(len(name) + len(value) + 4 for name, value in request.headers.items())
+    if isinstance(request.body, (bytes, str)):
+        size += len(request.body)
+    elif request.headers.get("Content-Length", "").isdigit():
+        size += int(request.headers["Content-Length"])
+    return size
+
+
+class HttpAdapter(HTTPAdapter):
+    """
+    The transport adapter mounted by HttpClient.
+
+    On top of HTTPAdapter, it serves GET requests out of an optional HttpCache (streamed requests, e.g.
+    download_file(), bypass the cache), paces requests with an optional RateLimiter and retries failed requests
+    according to an optional RetryPolicy. The adapter is shared by every thread using the client, and so are the
+    limiter's per-host rates.
+
+    Every request (including cache hits and failures) is reported to an optional Instrumentation as a RequestTiming.
+    """
+
+    def __init__(
+        self,
+        *args,
+        cache: Optional[HttpCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        **kwargs,
+    ) -> None:
+        self.cache = cache
+        self.retry_policy = retry_policy
+        self.rate_limiter = rate_limiter
+        self.instrumentation = instrumentation
+        super().__init__(*args, **kwargs)
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        if self.instrumentation is not None:
+            _install_timed_pools(self.poolmanager)
+
+    def proxy_manager_for(self, *args, **kwargs):
+        manager = super().proxy_manager_for(*args, **kwargs)
+        if self.instrumentation is not None:
+            _install_timed_pools(manager)
+        return manager
+
+    def _send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        """Send request over the network, applying the rate limiter and retry policy."""
+        policy = self.retry_policy
+        limiter = self.rate_limiter
+        host = urlsplit(request.url).netloc
+        attempt = 0
+
+        while True:
+            if limiter is not None:
+                limiter.acquire(host)
+
+            _connection_timing.connect = None
+            sent_at = time.perf_counter()
+            try:
+                response = super().send(request, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if policy is None or not policy.should_retry(request.method, attempt):
+                    raise
+                time.sleep(policy.get_backoff(attempt))
+                attempt += 1
+                continue
+
+            if limiter is not None:
+                limiter.update(host, response.status_code)
+
+            if policy is not None and policy.should_retry(request.method, attempt, response):
+                backoff = policy.get_backoff(attempt, response)
+                response.close()
+                time.sleep(backoff)
+                attempt += 1
+                continue
+
+            # HTTPAdapter.send() returns as soon as the status line and headers have been read. (requests only sets
+            # response.elapsed after the adapter has returned, so that can't be used instead.)
+            response.ttfb = time.perf_counter() - sent_at
+            response.retries = attempt
+            return response
+
+    def send(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return self._send_cached(request, stream=stream, **kwargs)
+
+        start = time.perf_counter()
+        timing = RequestTiming(
+            method=request.method, url=request.url, host=urlsplit(request.url).netloc, status=None, total=0.0
+        )
+        timing.bytes_out = _request_size(request)
+        _connection_timing.connect = None
+
+        try:
+            response = self._send_cached(request, stream=stream, **kwargs)
+        except Exception as exc:
+            timing.total = time.perf_counter() - start
+            timing.error = exc.__class__.__name__
+            timing.connect = _connection_timing.connect
+            instrumentation.record_request(timing)
+            raise
+
+        timing.status = response.status_code
+        timing.from_cache = getattr(response, "from_cache", False)
+        timing.retries = getattr(response, "retries", 0)
+        if not timing.from_cache:
+            timing.ttfb = getattr(response, "ttfb", None)
+            timing.connect = _connection_timing.connect
+            timing.reused_connection = timing.connect is None
+            if not stream:
+                # The session would read the body right after this anyway. Reading it here means total and bytes_in
+                # cover the whole transfer (as it was on the wire, i.e. before any Content-Encoding is undone).
+                content = response.content
+                raw_tell = getattr(response.raw, "tell", None)
+                timing.bytes_in = raw_tell() if raw_tell is not None else len(content)
+        timing.total = time.perf_counter() - start
+        instrumentation.record_request(timing)
+        return response
+
+    def _send_cached(self, request: requests.PreparedRequest, stream: bool = False, **kwargs) -> requests.Response:
+        cache = self.cache
+        request_cache_control = parse_cache_control(request.headers.get("Cache-Control", ""))
+        if cache is None or stream or request.method != "GET" or "no-store" in request_cache_control:
+            return self._send(request, stream=stream, **kwargs)
+
+        entry = cache.get(request)
+        if entry is not None and entry["expires_at"] > time.time() and "no-cache" not in request_cache_control:
+            cache._count("hits")
+            return self._build_cached_response(request, entry)
+
+        conditional_request = request
+        if entry is not None:
+            validators = {}
+            if "ETag" in entry["headers"]:
+                validators["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                validators["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+            if validators:
+                conditional_request = request.copy()
+                conditional_request.headers.update(validators)
+
+        response = self._send(conditional_request, stream=stream, **kwargs)
+
+        if response.status_code == 304 and conditional_request is not request:
+            entry = cache.refresh(request, response)
+            if entry is not None:
+                cache._count("revalidations")
+                response.close()
+                return self._build_cached_response(request, entry)
+
+        cache._count("misses")
+        cache.store(request, response)
+        return response
+
+    def _build_cached_response(self, request: requests.PreparedRequest, entry: dict) -> requests.Response:
+        response = requests.Response()
+        response.status_code = entry["status"]
+        response.reason = entry["reason"]
+        response.headers = requests.structures.CaseInsensitiveDict(entry["headers"])
+        response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+        response._content = entry["body"]
+        response._content_consumed = True
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        response.from_cache = True
+        return response
+
+
+if cloudscraper is not None:
+
+    class _CloudscraperHttpAdapter(HttpAdapter, cloudscraper.CipherSuiteAdapter):
+        """An HttpAdapter that also applies cloudscraper's TLS settings (see cloudscraper.CipherSuiteAdapter)."""
+
+
+class DownloadTooLargeError(ValueError):
+    """Raised by HttpClient.download_file() when a download goes over its max_size."""
+
+
+class _RangeIgnoredError(Exception):
+    """A Range request got the whole resource back, so download_file() starts over with a single stream."""
+
+
+class TruncatedStreamError(ValueError):
+    """Raised by iter_decompress() (and so HttpClient.download_file()) when a compressed body ends too early."""
+
+
+class DownloadResult(NamedTuple):
+    filename: Union[str, Path]
+    digests: dict[str, str]
+
+
+# The streaming decompressors download_file(decompress=...) supports. zstd needs the `zstandard` library.
+DECOMPRESSORS = ("gzip", "deflate", "bz2", "xz", "zstd")
+
+
+def get_decompressor(name: str):
+    """
+    Return a streaming decompressor (an object with decompress(data) and possibly flush()) for a DECOMPRESSORS name.
+
+    :raises ValueError: If name isn't supported.
+    """
+    if name == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if name == "deflate":
+        # HTTP's "deflate" is the zlib format (RFC 9110 8.4.1.2), not a raw deflate stream.
+        return zlib.decompressobj()
+    if name == "bz2":
+        return bz2.BZ2Decompressor()
+    if name == "xz":
+        return lzma.LZMADecompressor()
+    if name == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Decompressing zstd requires the `zstandard` library to be installed.")
+        return zstandard.ZstdDecompressor().decompressobj()
+    raise ValueError(f"Unsupported decompressor: {name} (supported: {', '.join(DECOMPRESSORS)})")
+
+
+def iter_decompress(name: str, chunks: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    """
+    Decompress a body compressed with name (one of DECOMPRESSORS), yielding the output in pieces of at most
+    max_length bytes.
+
+    Output is only produced as it is consumed, so a small, highly compressed body (a "compression bomb") is never
+    expanded in memory further than the consumer has asked for.
+
+    :raises ValueError: If name isn't supported.
+    :raises TruncatedStreamError: (while iterating) If the chunks end before the compressed stream does.
+    """
+    decompressor = get_decompressor(name)
+    if name == "zstd":
+        return _iter_decompress_zstd(chunks, max_length)
+    return _iter_decompress(decompressor, chunks, max_length)
+
+
+def _iter_decompress(decompressor, chunks: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    for chunk in chunks:
+        data = chunk
+        while True:
+            output = decompressor.decompress(data, max_length)
+            if output:
+                yield output
+            if hasattr(decompressor, "needs_input"):
+                # bz2 / lzma keep the input they haven't decompressed yet and ask for more once they are done with it.
+                data = b""
+                if decompressor.needs_input or decompressor.eof:
+                    break
+            else:
+                # zlib hands back the input it hasn't decompressed yet. A full output buffer can also mean that there
+                # is more output pending for the input it has already taken.
+                data = decompressor.unconsumed_tail
+                if not data and len(output) < max_length:
+                    break
+
+    if not decompressor.eof:
+        raise TruncatedStreamError("The compressed stream ended early.")
+    if hasattr(decompressor, "flush"):
+        output = decompressor.flush()
+        if output:
+            yield output
+
+
+def _iter_decompress_zstd(chunks: Iterable[bytes], max_length: int) -> Iterator[bytes]:
+    # zstandard's decompressobj() has no output limit, but read_to_iter() fills one write_size buffer at a time. It
+    # stops quietly when its input runs out mid-frame though, so the frame's structure is followed on the side.
+    tracker = _ZstdFrameTracker()
+
+    def tracked_chunks() -> Iterator[bytes]:
+        for chunk in chunks:
+            tracker.feed(chunk)
+            yield chunk
+
+    yield from zstandard.ZstdDecompressor().read_to_iter(_ChunkReader(tracked_chunks()), write_size=max_length)
+    if not tracker.complete:
+        raise TruncatedStreamError("The compressed stream ended early.")
+
+
+class _ZstdFrameTracker:
+    """
+    Follow the headers of the first zstd frame in a stream (RFC 8878 3.1.1) to tell whether all of it arrived.
+
+    Block contents are only counted, not looked at.
+    """
+
+    _FRAME_MAGIC = 0xFD2FB528
+    _SKIPPABLE_MAGIC_MASK = 0xFFFFFFF0
+    _SKIPPABLE_MAGIC = 0x184D2A50
+
+    def __init__(self) -> None:
+        self.complete = False
+        # "magic" -> "frame header" -> "block" (one per block) -> "checksum" (if the frame has one) -> complete.
+        self._state = "magic"
+        self._has_checksum = False
+        self._skip = 0
+        self._pending = b""
+
+    def feed(self, data: bytes) -> None:
+        data = self._pending + data if self._pending else data
+        self._pending = b""
+        position = 0
+        while not self.complete:
+            if self._skip:
+                step = min(self._skip, len(data) - position)
+                self._skip -= step
+                position += step
+                if self._skip:
+                    return
+                continue
+
+            if self._state == "checksum":
+                self._skip = 4
+                self._state = "done"
+                continue
+            if self._state == "done":
+                self.complete = True
+                return
+
+            consumed = self._parse_header(data, position)
+            if consumed is None:
+                self._pending = data[position:]
+                return
+            position += consumed
+
+    def _parse_header(self, data: bytes, position: int) -> Optional[int]:
+        """Parse the header at data[position:] for the current state. Return its length, or None if it's incomplete."""
+        available = len(data) - position
+
+        if self._state == "magic":
+            if available < 4:
+                return None
+            magic = int.from_bytes(data[position : position + 4], "little")
+            if magic == self._FRAME_MAGIC:
+                self._state = "frame header"
+                return 4
+            if magic & self._SKIPPABLE_MAGIC_MASK == self._SKIPPABLE_MAGIC:
+                if available < 8:
+                    return None
+                self._skip = int.from_bytes(data[position + 4 : position + 8], "little")
+                return 8
+            # Not zstd at all. That's for the decompressor to report.
+            self.complete = True
+            return 0
+
+        if self._state == "frame header":
+            if available < 1:
+                return None
+            descriptor = data[position]
+            single_segment = descriptor & 0x20
+            self._has_checksum = bool(descriptor & 0x04)
+            content_size_length = (1 if single_segment else 0, 2, 4, 8)[descriptor >> 6]
+            length = 1 + (0 if single_segment else 1) + (0, 1, 2, 4)[descriptor & 0x03] + content_size_length
+            if available < length:
+                return None
+            self._state = "block"
+            return length
+
+        if available < 3:
+            return None
+        header = int.from_bytes(data[position : position + 3], "little")
+        block_type = (header >> 1) & 0x03
+        # An RLE block's content is the single byte that gets repeated.
+        self._skip = 1 if block_type == 1 else header >> 3
+        if header & 0x01:
+            self._state = "checksum" if self._has_checksum else "done"
+        return 3
+
+
+class _ChunkReader:
+    """A minimal read()-only file object over an iterable of bytes chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        self._chunks = iter(chunks)
+        self._buffer = b""
+
+    def read(self, size: int = -1) -> bytes:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                return b""
+            self._buffer = chunk
+        if size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
 class HttpClient:
     """
     A wrapper around requests.Session with app-specific additions.
@@ -41,13 +1036,48 @@ class HttpClient:
     1) Additional initialization that is specific to this app.
 
     2) Provide custom wrappers for handling things like failed requests so that we can apply the
-       same handling across the entire app in a central location.
+       same handling across the entire app in a central location (see RetryPolicy and RateLimiter).
     """
 
     _headers: dict = None
     _session: requests.Session = None
 
-    def __init__(self, headers: dict = None, use_cloudscraper: bool = False) -> None:
+    def __init__(
+        self,
+        headers: dict = None,
+        use_cloudscraper: bool = False,
+        pool_connections: int = 10,
+        pool_maxsize: int = 10,
+        pool_block: bool = False,
+        max_per_host: Optional[int] = None,
+        cache: Optional[HttpCache] = None,
+        retry_policy: Optional[RetryPolicy] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        cookies: Optional[Union[CookieJar, str, Path]] = None,
+    ) -> None:
+        """
+        Initialize the client.
+
+        :param headers: (optional) Headers to send with every request, on top of DEFAULT_HEADERS and self._headers.
+        :param use_cloudscraper: (optional) Use a cloudscraper session instead of a plain requests.Session.
+        :param pool_connections: (optional) The number of per-host connection pools to keep around. (Defaults to 10)
+        :param pool_maxsize: (optional) The maximum number of connections kept open to a single host. Should be at
+                             least the concurrency used with fetch_many(). (Defaults to 10)
+        :param pool_block: (optional) If True, requests wait for a free connection instead of opening an extra one
+                           that is thrown away afterwards when a host's pool is full. (Defaults to False)
+        :param max_per_host: (optional) The default per-host concurrency cap for fetch_many(). (Defaults to no cap)
+        :param cache: (optional) An HttpCache to serve GET requests from. (Defaults to no caching)
+        :param retry_policy: (optional) How to retry failed requests. (Defaults to no retries)
+        :param rate_limiter: (optional) A RateLimiter to pace requests to each host with. (Defaults to no limit)
+        :param instrumentation: (optional) Where to report request timings and download throughput to, e.g. an
+                                HttpMetrics instance. (Defaults to no instrumentation)
+        :param cookies: (optional) A CookieJar, or the path to a Netscape-format cookie file to load with
+                        load_cookie_jar(), to start the session's cookies from.
+        """
+        self.max_per_host = max_per_host
+        self.instrumentation = instrumentation
+
         if use_cloudscraper:
             if cloudscraper is None:
                 raise RuntimeError("Option `use_cloudscraper` requires the `cloudscraper` library to be installed.")
@@ -57,43 +1087,596 @@ class HttpClient:
         else:
             self._session = requests.Session()
 
+        adapter_kwargs = {
+            "pool_connections": pool_connections,
+            "pool_maxsize": pool_maxsize,
+            "pool_block": pool_block,
+            "cache": cache,
+            "retry_policy": retry_policy,
+            "rate_limiter": rate_limiter,
+            "instrumentation": instrumentation,
+        }
+        adapter = HttpAdapter(**adapter_kwargs)
+        self._session.mount("http://", adapter)
+
+        if use_cloudscraper:
+            # The scraper's own HTTPS adapter carries the cipher suite and ECDH curve settings that get past the bot
+            # checks, so its SSL context is kept rather than replaced by a plain HttpAdapter.
+            scraper_adapter = self._session.adapters["https://"]
+            adapter = _CloudscraperHttpAdapter(
+                ssl_context=scraper_adapter.ssl_context,
+                source_address=scraper_adapter.source_address,
+                cipherSuite=scraper_adapter.cipherSuite,
+                ecdhCurve=scraper_adapter.ecdhCurve,
+                server_hostname=scraper_adapter.server_hostname,
+                **adapter_kwargs,
+            )
+        self._session.mount("https://", adapter)
+
         self._session.headers.update(DEFAULT_HEADERS)
         self._session.headers.update(self._headers or {})
         self._session.headers.update(headers or {})
 
+        if isinstance(cookies, CookieJar):
+            self._session.cookies.update(cookies)
+        elif cookies is not None:
+            load_cookie_jar(cookies, jar=self._session.cookies)
+
     def __getattr__(self, item):
         return getattr(self._session, item)
 
-    def download_file(self, url: str, filename: Union[str, Path], method: Union[HttpMethod, str] = "get", **kwargs):
+    def _get_method_func(self, method: Union[HttpMethod, str]) -> Callable[..., requests.Response]:
+        return getattr(self._session, to_http_method(method).value)
+
+    def fetch_many(
+        self,
+        urls: Iterable[str],
+        concurrency: int = 10,
+        max_per_host: Optional[int] = None,
+        method: Union[HttpMethod, str] = "get",
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> Iterator[tuple[str, Union[requests.Response, Exception]]]:
+        """
+        Request many URLs concurrently, yielding (url, response) tuples as the responses complete.
+
+        Requests run on a thread pool that shares this client's session (and so its connection pools). A URL whose host
+        already has max_per_host requests in flight is held back until one of them completes, so a slow host doesn't
+        tie up the worker threads.
+
+        :param urls: The URLs to request.
+        :param concurrency: (optional) The maximum number of requests in flight. (Defaults to 10)
+        :param max_per_host: (optional) The maximum number of requests in flight to a single host.
+                             (Defaults to self.max_per_host)
+        :param method: (optional) The HTTP method to use. (Defaults to GET)
+        :param return_exceptions: (optional) If True, a failed request yields (url, exception) instead of raising.
+                                  (Defaults to False)
+        :param kwargs: Passed on to each request.
+        """
+        method_func = self._get_method_func(method)
+        max_per_host = max_per_host or self.max_per_host
+        max_backlog = 4 * concurrency
+        urls = iter(urls)
+        backlog: dict[str, deque] = defaultdict(deque)
+        backlog_size = 0
+        exhausted = False
+        in_flight: Counter = Counter()
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+
+        def has_capacity(host: str) -> bool:
+            return len(pending) < concurrency and (not max_per_host or in_flight[host] < max_per_host)
+
+        def submit(url: str, host: str) -> None:
+            in_flight[host] += 1
+            pending[executor.submit(method_func, url, **kwargs)] = (url, host)
+
+        def fill() -> None:
+            nonlocal backlog_size, exhausted
+
+            for host in list(backlog):
+                queue = backlog[host]
+                while queue and has_capacity(host):
+                    submit(queue.popleft(), host)
+                    backlog_size -= 1
+                if not queue:
+                    del backlog[host]
+
+            while not exhausted and len(pending) < concurrency and backlog_size < max_backlog:
+                try:
+                    url = next(urls)
+                except StopIteration:
+                    exhausted = True
+                    break
+
+                host = urlsplit(url).netloc
+                if has_capacity(host):
+                    submit(url, host)
+                else:
+                    backlog[host].append(url)
+                    backlog_size += 1
+
+        try:
+            fill()
+            while pending:
+                done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+                results = []
+                for future in done:
+                    url, host = pending.pop(future)
+                    in_flight[host] -= 1
+                    try:
+                        results.append((url, future.result()))
+                    except Exception as exc:  # pylint: disable=broad-except
+                        if not return_exceptions:
+                            raise
+                        results.append((url, exc))
+
+                # Refill before handing back results so requests keep flowing while the caller processes them.
+                fill()
+                yield from results
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def download_file(
+        self,
+        url: str,
+        filename: Union[str, Path],
+        method: Union[HttpMethod, str] = "get",
+        chunk_size: int = 8192,
+        parts: int = 1,
+        resume: bool = False,
+        hashes: Iterable[str] = (),
+        decompress: Optional[str] = None,
+        max_size: Optional[int] = None,
+        **kwargs,
+    ):
+        """
+        Download url into filename.
+
+        With parts > 1 and/or resume=True, a GET download uses HTTP Range requests: the file is preallocated, split into
+        parts that are fetched in parallel and written in place with os.pwrite(). Progress is kept in a sidecar file
+        (filename + DOWNLOAD_STATE_SUFFIX) so that an interrupted download can pick up where it left off when called
+        again with resume=True. A file without a sidecar, or one whose resource has changed since (its ETag or
+        Last-Modified no longer matches the sidecar), is downloaded again from the start. Weak ETags don't count. If
+        the server doesn't advertise `Accept-Ranges: bytes` or a Content-Length, or answers a Range request with the
+        whole resource, this falls back to a plain single-connection download.
+
+        hashes, decompress and max_size are applied to the chunks as they arrive, so the file is only written once
+        and never re-read. They need the body in order, so they can't be combined with parts > 1 or resume=True.
+
+        :param url: The URL to download.
+        :param filename: Where to write the body.
+        :param method: (optional) The HTTP method to use. Ranged downloads are only used for GET. (Defaults to GET)
+        :param chunk_size: (optional) The size of the chunks read from the response. (Defaults to 8192)
+        :param parts: (optional) The number of ranges to fetch in parallel. (Defaults to 1)
+        :param resume: (optional) Continue a previously interrupted download of the same resource. (Defaults to False)
+        :param hashes: (optional) hashlib algorithm names (e.g. "sha256") to compute digests of the written file with.
+        :param decompress: (optional) Decompress the body while writing it. One of DECOMPRESSORS, e.g. "gzip". If the
+                           body ends before the compressed stream does, TruncatedStreamError is raised (and the file
+                           removed).
+        :param max_size: (optional) Abort with DownloadTooLargeError (and remove the file) once more than this many
+                         bytes would be written.
+        :param kwargs: Passed on to each request.
+        :return: The filename, or a DownloadResult of the filename and {algorithm: hex digest} if hashes were given.
+        """
         kwargs["stream"] = True
+        method = to_http_method(method)
+        hashes = tuple(hashes)
+        start = time.perf_counter()
+
+        has_stages = bool(hashes or decompress or max_size is not None)
+        if has_stages and (parts > 1 or resume):
+            raise ValueError("hashes, decompress and max_size can't be combined with parts > 1 or resume=True.")
+
+        if (parts > 1 or resume) and method is HttpMethod.GET:
+            state = self._get_download_state(url, filename, parts, resume, kwargs)
+            if state is not None:
+                try:
+                    size = self._download_ranges(url, filename, state, chunk_size, kwargs)
+                except _RangeIgnoredError:
+                    pass
+                else:
+                    self._record_download(url, size, start)
+                    return filename
+
+        hashers = [hashlib.new(name) for name in hashes]
+        if decompress:
+            # Fail on an unsupported name (or a missing library) before making the request.
+            get_decompressor(decompress)
+
+        with self._get_method_func(method)(url, **kwargs) as response:
+            response.raise_for_status()
+
+            content_length = response.headers.get("Content-Length", "")
+            if max_size is not None and not decompress and content_length.isdigit() and int(content_length) > max_size:
+                raise DownloadTooLargeError(
+                    f"{url} is {content_length} bytes, which is over the {max_size} byte limit."
+                )
+
+            received = 0
+            written = 0
+
+            def write(f, data: bytes) -> None:
+                nonlocal written
+                if not data:
+                    return
+                written += len(data)
+                if max_size is not None and written > max_size:
+                    raise DownloadTooLargeError(f"{url} is over the {max_size} byte limit.")
+                for hasher in hashers:
+                    hasher.update(data)
+                f.write(data)
+
+            def receive() -> Iterator[bytes]:
+                nonlocal received
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    received += len(chunk)
+                    yield chunk
 
-        if isinstance(method, str):
             try:
-                method = HttpMethod[method.upper()]
-            except KeyError:
-                raise ValueError(f"Not a valid HttpMethod: {method}")
+                with open(filename, "wb") as f:
+                    # Decompressed output is written chunk_size bytes at a time, so max_size is enforced before a
+                    # compression bomb gets expanded in memory.
+                    for data in iter_decompress(decompress, receive(), chunk_size) if decompress else receive():
+                        write(f, data)
+            except (DownloadTooLargeError, TruncatedStreamError):
+                os.unlink(filename)
+                raise
+
+            self._record_download(url, received, start)
+
+            if hashes:
+                return DownloadResult(filename, {name: hasher.hexdigest() for name, hasher in zip(hashes, hashers)})
+            return filename
+
+    def _record_download(self, url: str, size: int, start: float) -> None:
+        if self.instrumentation is not None:
+            self.instrumentation.record_download(url, size, time.perf_counter() - start)
+
+    def _get_download_state(self, url: str, filename: Union[str, Path], parts: int, resume: bool, kwargs: dict):
+        """Return the ranges left to download, or None if the server doesn't support ranged downloads."""
+        headers = {**(kwargs.get("headers") or {}), "Accept-Encoding": "identity"}
+        head_kwargs = {key: value for key, value in kwargs.items() if key not in ("stream", "headers")}
+        head_kwargs.setdefault("allow_redirects", True)
+        response = self._session.head(url, headers=headers, **head_kwargs)
+        response.raise_for_status()
+
+        length = response.headers.get("Content-Length")
+        if response.headers.get("Accept-Ranges", "").lower() != "bytes" or not length or not length.isdigit():
+            return None
+
+        length = int(length)
+        # Servers ignore If-Range with a weak ETag (RFC 9110 13.1.5), so only a strong one or Last-Modified will do.
+        etag = response.headers.get("ETag")
+        validator = etag if etag and not etag.startswith("W/") else response.headers.get("Last-Modified")
+        state_path = Path(f"{filename}{DOWNLOAD_STATE_SUFFIX}")
+
+        if resume:
+            try:
+                state = json.loads(state_path.read_text())
+            except (OSError, ValueError):
+                state = None
+
+            # The bytes already on disk can only be trusted if they were downloaded (and recorded in the state file)
+            # while the resource had the validator it has now. Anything else, including a file at filename without a
+            # state file, is downloaded again from scratch.
+            if (
+                state
+                and validator
+                and state["url"] == url
+                and state["length"] == length
+                and state["validator"] == validator
+                and os.path.exists(filename)
+            ):
+                return state
+
+        part_size = -(-length // max(1, parts))
+        ranges = [[start, min(start + part_size, length) - 1, start] for start in range(0, length, part_size or 1)]
+        return {"url": url, "length": length, "validator": validator, "parts": ranges, "new": True}
+
+    def _download_ranges(self, url: str, filename: Union[str, Path], state: dict, chunk_size: int, kwargs: dict):
+        """Download the ranges left in state, and return the number of bytes downloaded."""
+        state_path = Path(f"{filename}{DOWNLOAD_STATE_SUFFIX}")
+        lock = threading.Lock()
+        stop = threading.Event()
+        last_saved = [time.monotonic()]
+        initial_offsets = sum(offset for _start, _end, offset in state["parts"])
+
+        def save_state() -> None:
+            with lock:
+                tmp_path = state_path.with_name(state_path.name + ".tmp")
+                tmp_path.write_text(json.dumps({key: value for key, value in state.items() if key != "new"}))
+                os.replace(tmp_path, state_path)
+                last_saved[0] = time.monotonic()
+
+        def download_part(fd: int, part: list) -> None:
+            start, end, offset = part
+            if offset > end:
+                return
+
+            headers = {
+                **(kwargs.get("headers") or {}),
+                "Range": f"bytes={offset}-{end}",
+                "Accept-Encoding": "identity",
+            }
+            if state["validator"]:
+                headers["If-Range"] = state["validator"]
+
+            with self._session.get(url, **{**kwargs, "headers": headers}) as response:
+                response.raise_for_status()
+                if response.status_code != 206:
+                    # The server doesn't do ranges after all, or (with If-Range) the resource has changed.
+                    raise _RangeIgnoredError()
+
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if stop.is_set():
+                        return
+                    os.pwrite(fd, chunk, offset)
+                    offset += len(chunk)
+                    part[2] = offset
+                    if time.monotonic() - last_saved[0] > DOWNLOAD_STATE_SAVE_INTERVAL:
+                        save_state()
+
+            if offset <= end:
+                raise OSError(f"Range {start}-{end} of {url} ended early at byte {offset}.")
+
+        flags = os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0)
+        if state.get("new"):
+            flags |= os.O_TRUNC
+
+        fd = os.open(filename, flags, 0o644)
+        try:
+            os.ftruncate(fd, state["length"])
+            save_state()
+
+            with ThreadPoolExecutor(max_workers=len(state["parts"]) or 1) as executor:
+                futures = [executor.submit(download_part, fd, part) for part in state["parts"]]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    stop.set()
+                    for future in futures:
+                        future.cancel()
+                    raise
+                finally:
+                    save_state()
+        except _RangeIgnoredError:
+            # What is on disk can't be resumed from, so it's not worth keeping track of.
+            state_path.unlink()
+            raise
+        finally:
+            os.close(fd)
+
+        state_path.unlink()
+        return sum(offset for _start, _end, offset in state["parts"]) - initial_offsets
+
+
+class AsyncHttpClient:
+    """
+    An asyncio counterpart to HttpClient, wrapping aiohttp.ClientSession.
+
+    Headers are set up the same way as HttpClient: DEFAULT_HEADERS, then the _headers class attribute, then the headers
+    passed in. Connections are kept alive and pooled by the session's connector, so many requests can be in flight on
+    a single event loop.
+
+    The session is created on first use (it has to be created inside the running event loop). Close the client when
+    done with it, or use it as an async context manager::
+
+        async with AsyncHttpClient() as client:
+            async with client.get(url) as response:
+                body = await response.read()
+    """
+
+    _headers: dict = None
+    _session: "aiohttp.ClientSession" = None
 
-        method_func = getattr(self._session, method.value)
+    def __init__(
+        self, headers: dict = None, limit: int = 100, limit_per_host: int = 0, base_url: Optional[str] = None, **kwargs
+    ) -> None:
+        """
+        Initialize the client.
 
-        with method_func(url, **kwargs) as response:
+        :param headers: (optional) Headers to send with every request, on top of DEFAULT_HEADERS and self._headers.
+        :param limit: (optional) The maximum number of open connections. 0 means no limit. (Defaults to 100)
+        :param limit_per_host: (optional) The maximum number of open connections to a single host. 0 means no limit.
+                               (Defaults to 0)
+        :param base_url: (optional) Passed on to aiohttp.ClientSession, e.g. to point the client at a local stand-in
+                         server in tests.
+        :param kwargs: Passed on to aiohttp.ClientSession.
+        """
+        if aiohttp is None:
+            raise RuntimeError("AsyncHttpClient requires the `aiohttp` library to be installed.")
+
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._base_url = base_url
+        self._session_kwargs = kwargs
+        self.headers = {**DEFAULT_HEADERS, **(self._headers or {}), **(headers or {})}
+
+    @property
+    def session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host)
+            kwargs = dict(self._session_kwargs)
+            if self._base_url is not None:
+                kwargs["base_url"] = self._base_url
+            self._session = aiohttp.ClientSession(headers=self.headers, connector=connector, **kwargs)
+        return self._session
+
+    def __getattr__(self, item):
+        return getattr(self.session, item)
+
+    async def __aenter__(self) -> "AsyncHttpClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def download_file(
+        self,
+        url: str,
+        filename: Union[str, Path],
+        method: Union[HttpMethod, str] = "get",
+        chunk_size: int = 8192,
+        **kwargs,
+    ):
+        """
+        Download url into filename.
+
+        File I/O (open, write and close) runs in the loop's default executor so that disk writes don't stall the other
+        requests on the event loop. The body is written ASYNC_WRITE_BUFFER_SIZE bytes at a time, and the next part of
+        the body is received while the previous one is being written.
+
+        :param url: The URL to download.
+        :param filename: Where to write the body.
+        :param method: (optional) The HTTP method to use. (Defaults to GET)
+        :param chunk_size: (optional) The size of the chunks read from the response. (Defaults to 8192)
+        :param kwargs: Passed on to the request.
+        :return: The filename.
+        """
+        method = to_http_method(method)
+        loop = asyncio.get_running_loop()
+
+        async with self.session.request(method.value.upper(), url, **kwargs) as response:
             response.raise_for_status()
 
-            with open(filename, "wb") as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    # If you have chunk encoded response uncomment if
-                    # and set chunk_size parameter to None.
-                    # if chunk:
-                    f.write(chunk)
+            f = await loop.run_in_executor(None, open, filename, "wb")
+            pending_write = None
+            buffer = bytearray()
+            try:
+                async for chunk in response.content.iter_chunked(chunk_size):
+                    buffer += chunk
+                    if len(buffer) >= ASYNC_WRITE_BUFFER_SIZE:
+                        if pending_write is not None:
+                            await pending_write
+                        pending_write = loop.run_in_executor(None, f.write, bytes(buffer))
+                        buffer.clear()
+                if pending_write is not None:
+                    await pending_write
+                    pending_write = None
+                if buffer:
+                    await loop.run_in_executor(None, f.write, bytes(buffer))
+            finally:
+                if pending_write is not None:
+                    # Don't close the file under a write that's still running (e.g. when the download failed).
+                    await asyncio.gather(pending_write, return_exceptions=True)
+                await loop.run_in_executor(None, f.close)
 
             return filename
 
 
+# Parsed cookie files, keyed by path and invalidated by the file's (mtime, size). See load_cookie_jar().
+_cookie_file_cache: dict[str, tuple[tuple[int, int], list[Cookie]]] = {}
+_cookie_file_cache_lock = threading.Lock()
+
+
+def parse_cookie_file(path: Union[str, Path]) -> list[Cookie]:
+    """
+    Parse a Netscape-format (cookies.txt) cookie file in a single pass.
+
+    Unlike MozillaCookieJar, this understands the `#HttpOnly_` prefix that browsers and curl write in front of
+    HttpOnly cookies. Expired cookies are skipped.
+
+    :raises ValueError: If a line doesn't have the 7 tab-separated fields the format calls for.
+    """
+    now = time.time()
+    cookies = []
+
+    with open(path, "r") as fh:
+        for line_no, line in enumerate(fh, start=1):
+            line = line.rstrip("\r\n")
+            rest = {}
+
+            if line.startswith("#HttpOnly_"):
+                line = line[10:]
+                rest["HttpOnly"] = None
+            elif line.startswith(("#", "$")) or not line.strip():
+                continue
+
+            fields = line.split("\t")
+            if len(fields) != 7:
+                raise ValueError(f"{path}:{line_no}: Expected 7 tab-separated fields, got {len(fields)}.")
+            domain, domain_specified, cookie_path, secure, expires, name, value = fields
+
+            # curl writes 0 for session cookies where MozillaCookieJar writes an empty field. Accept both.
+            expires = int(expires) if expires and expires != "0" else None
+            if expires is not None and expires <= now:
+                continue
+
+            # As in MozillaCookieJar: a cookie without a name is stored with its value as the name.
+            if name == "":
+                name, value = value, None
+
+            cookies.append(
+                Cookie(
+                    version=0,
+                    name=name,
+                    value=value,
+                    port=None,
+                    port_specified=False,
+                    domain=domain,
+                    domain_specified=domain_specified == "TRUE",
+                    domain_initial_dot=domain.startswith("."),
+                    path=cookie_path,
+                    path_specified=cookie_path != "",
+                    secure=secure == "TRUE",
+                    expires=expires,
+                    discard=expires is None,
+                    comment=None,
+                    comment_url=None,
+                    rest=rest,
+                )
+            )
+
+    return cookies
+
+
+def load_cookie_jar(path: Union[str, Path], jar: Optional[CookieJar] = None) -> CookieJar:
+    """
+    Load a Netscape-format cookie file into a CookieJar.
+
+    The parsed cookies are cached in-process, keyed by the file's path and mtime, so loading the same file again (e.g.
+    once per worker) only costs a stat() until the file changes.
+
+    :param path: The cookie file.
+    :param jar: (optional) The jar to add the cookies to, e.g. a session's cookies. (Defaults to a new CookieJar)
+    :return: The jar.
+    """
+    path = os.fspath(path)
+    stat = os.stat(path)
+    key = (stat.st_mtime_ns, stat.st_size)
+
+    with _cookie_file_cache_lock:
+        cached = _cookie_file_cache.get(path)
+
+    if cached is not None and cached[0] == key:
+        cookies = cached[1]
+    else:
+        cookies = parse_cookie_file(path)
+        with _cookie_file_cache_lock:
+            _cookie_file_cache[path] = (key, cookies)
+
+    if jar is None:
+        jar = CookieJar()
+    # Cookies are copied so that one jar updating a cookie doesn't leak into the others loaded from the same file.
+    for cookie in cookies:
+        jar.set_cookie(copy(cookie))
+    return jar
+
+
 def fix_cookie_jar_file(orig_cookiejarfile):
     """
     Strip #HttpOnly from cookies since MozillaCookieJar doesn't support it.
 
     This bug was fixed in 2020, but doesn't look like it's in Python 3.9.
 
+    Prefer load_cookie_jar(), which reads #HttpOnly_ cookies directly without writing a temporary file.
+
     Source: https://github.com/python/cpython/issues/46443#issuecomment-1093410833
     """
     with NamedTemporaryFile(mode="w+", delete=False) as cookiejar_fh:
@@ -1,6 +1,16 @@
 """Utilities related to images."""
 
-import imghdr
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import io
+import itertools
+import os
+from typing import BinaryIO, Iterable, Iterator, NamedTuple, Optional, Union
+
+try:
+    import imghdr
+except ImportError:
+    # imghdr was removed in Python 3.13. detect_image_type() doesn't need it.
+    imghdr = None
 
 MIMETYPE_TO_EXTENSION_MAP = {
     "image/png": ".png",
@@ -48,17 +58,13 @@ def check_if_jpeg(data: bytes) -> bool:
 
     :param data: The contents of the image file (or at least just the header information)
     """
-    JPEG_MARK = (
-        b"\xff\xd8\xff\xdb\x00C\x00\x08\x06\x06\x07\x06\x05\x08\x07\x07\x07"
-        b"\t\t\x08\n\x0c\x14\r\x0c\x0b\x0b\x0c\x19\x12\x13\x0f"
-    )
     return (
-        # JPEG data in JFIF format
-        b"JFIF" in data[:23]
-        # JPEG with small header
-        or (len(data) >= 32 and 67 == data[5] and data[:32] == JPEG_MARK)
+        # JPEG start-of-image marker. This also covers JPEGs with a small header (which start with b"\xff\xd8\xff\xdb").
+        data[:2] == b"\xff\xd8"
         # JPEG data in JFIF or Exif format
-        or (data[6:10] in (b"JFIF", b"Exif") or data[:2] == b"\xff\xd8")
+        or data[6:10] in (b"JFIF", b"Exif")
+        # JPEG data in JFIF format, with a small header
+        or b"JFIF" in data[:23]
     )
 
 
@@ -67,7 +73,12 @@ def patch_imghdr():
     Monkey patch in additional test for JPEG to imghdr to deal with buggy detection.
 
     Source: https://stackoverflow.com/questions/36870661/imghdr-python-cant-detec-type-of-some-images-image-extension
+
+    Prefer detect_image_type(), which doesn't need imghdr (removed in Python 3.13).
     """
+    if imghdr is None:
+        raise RuntimeError("patch_imghdr() requires the `imghdr` module, which was removed in Python 3.13.")
+
     test_map = {
         "jpeg": check_if_jpeg,
         "mng": check_if_mng,
@@ -79,3 +90,276 @@ def patch_imghdr():
                 return file_type
 
     imghdr.tests.append(check)
+
+
+# How many bytes of a file detect_image_type() reads. Binary formats need far less, this is for SVG.
+HEADER_SIZE = 256
+
+
+class ImageType(NamedTuple):
+    format: str
+    mimetype: str
+    extension: str
+
+
+def _image_type(format: str, mimetype: str) -> ImageType:
+    return ImageType(format, mimetype, MIMETYPE_TO_EXTENSION_MAP[mimetype])
+
+
+PNG = _image_type("png", "image/png")
+JPEG = _image_type("jpeg", "image/jpeg")
+WEBP = _image_type("webp", "image/webp")
+GIF = _image_type("gif", "image/gif")
+SVG = _image_type("svg", "image/svg+xml")
+DJVU = _image_type("djvu", "image/vnd.djvu")
+ICO = _image_type("ico", "image/vnd.microsoft.icon")
+TIFF = _image_type("tiff", "image/tiff")
+JP2 = _image_type("jp2", "image/jp2")
+BMP = _image_type("bmp", "image/bmp")
+MNG = _image_type("mng", "image/x-mng")
+
+SignatureType = tuple[bytes, Optional[tuple[int, bytes]], ImageType]
+
+
+def _build_signature_table(signatures: list[SignatureType]) -> dict[int, tuple[SignatureType, ...]]:
+    table = {}
+    for signature in signatures:
+        table.setdefault(signature[0][0], []).append(signature)
+    return {first_byte: tuple(entries) for first_byte, entries in table.items()}
+
+
+# The signatures of the binary formats, keyed by their first byte so that detecting a type is one dict lookup and
+# (usually) one prefix comparison. Each entry is (prefix, (offset, bytes) that must also be present or None, type).
+IMAGE_SIGNATURES = _build_signature_table(
+    [
+        (b"\x89PNG\r\n\x1a\n", None, PNG),
+        (b"\x8aMNG\r\n\x1a\n", None, MNG),
+        (b"\xff\xd8", None, JPEG),
+        (b"GIF87a", None, GIF),
+        (b"GIF89a", None, GIF),
+        (b"RIFF", (8, b"WEBP"), WEBP),
+        (b"BM", None, BMP),
+        (b"II*\x00", None, TIFF),
+        (b"MM\x00*", None, TIFF),
+        (b"\x00\x00\x01\x00", None, ICO),
+        (b"\x00\x00\x00\x0cjP  \r\n\x87\n", None, JP2),
+        (b"AT&TFORM", (12, b"DJV"), DJVU),
+    ]
+)
+
+ImageSource = Union[bytes, bytearray, memoryview, str, os.PathLike, BinaryIO]
+
+
+def read_image_header(source: ImageSource, size: int = HEADER_SIZE) -> bytes:
+    """
+    Return (up to) the first size bytes of source.
+
+    :param source: The image data, a path to the image file, or a binary stream. Streams are left where they were:
+                   they're peek()ed at if they can be, otherwise they're read from and seeked back.
+    :param size: (optional) The number of bytes to read. (Defaults to HEADER_SIZE)
+    :raises ValueError: If source is a stream that can be neither peeked at nor seeked.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source[:size])
+
+    if isinstance(source, (str, os.PathLike)):
+        if not hasattr(os, "pread"):
+            with open(source, "rb") as fh:
+                return fh.read(size)
+        fd = os.open(source, os.O_RDONLY)
+        try:
+            return os.pread(fd, size, 0)
+        finally:
+            os.close(fd)
+
+    if isinstance(source, io.BufferedReader):
+        # peek() returns at most one buffer's worth (and may return more than size).
+        header = source.peek(size)[:size]
+        if len(header) == size or not source.seekable():
+            return header
+
+    if source.seekable():
+        position = source.tell()
+        try:
+            return source.read(size)
+        finally:
+            source.seek(position)
+
+    raise ValueError("Can't read the header of a stream that can be neither peeked at nor seeked.")
+
+
+def _is_svg(header: bytes) -> bool:
+    text = header.lstrip(b"\xef\xbb\xbf \t\r\n")
+    return text[:1] == b"<" and b"<svg" in text
+
+
+def detect_image_type(source: ImageSource, header_size: int = HEADER_SIZE) -> Optional[ImageType]:
+    """
+    Detect the type of an image from its first few bytes.
+
+    This covers every type in MIMETYPE_TO_EXTENSION_MAP using a single lookup in IMAGE_SIGNATURES (plus a check for
+    SVG markup), rather than running a list of tests like imghdr.what() does.
+
+    :param source: The image data, a path to the image file, or a binary stream (see read_image_header()).
+    :param header_size: (optional) How many bytes to read from files and streams. (Defaults to HEADER_SIZE)
+    :return: The ImageType, or None if the type wasn't recognized.
+    """
+    header = read_image_header(source, header_size)
+    if not header:
+        return None
+
+    for prefix, extra, image_type in IMAGE_SIGNATURES.get(header[0], ()):
+        if header.startswith(prefix) and (extra is None or header[extra[0] : extra[0] + len(extra[1])] == extra[1]):
+            return image_type
+
+    return SVG if _is_svg(header) else None
+
+
+# Other file extensions that are in common use for the types in MIMETYPE_TO_EXTENSION_MAP.
+EXTENSION_ALIASES = {
+    ".jpg": frozenset({".jpg", ".jpeg", ".jpe", ".jfif"}),
+    ".tiff": frozenset({".tiff", ".tif"}),
+    ".djvu": frozenset({".djvu", ".djv"}),
+}
+
+# The number of paths classify_images() hands to a worker thread at a time.
+CLASSIFY_BATCH_SIZE = 64
+
+
+def iter_files(root: Union[str, os.PathLike], follow_symlinks: bool = False) -> Iterator[str]:
+    """
+    Yield the path of every file under root, walking the tree with os.scandir().
+
+    scandir() returns the file type along with each name, so (unlike os.walk() + os.path.isfile()) no extra stat()
+    call is made per file. Each directory is listed in full before any of its files are yielded: whether entries added
+    during a scandir() are returned is unspecified, so files renamed while the walk is under way (e.g. by
+    classify_images(fix_extensions=True)) could otherwise come up a second time.
+
+    :param root: The directory to walk.
+    :param follow_symlinks: (optional) Follow symlinks to files and directories. (Defaults to False)
+    """
+    directories = [os.fspath(root)]
+    while directories:
+        with os.scandir(directories.pop()) as scan:
+            entries = list(scan)
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=follow_symlinks):
+                directories.append(entry.path)
+            elif entry.is_file(follow_symlinks=follow_symlinks):
+                yield entry.path
+
+
+def has_correct_extension(path: Union[str, os.PathLike], image_type: ImageType) -> bool:
+    extension = os.path.splitext(path)[1].lower()
+    return extension in EXTENSION_ALIASES.get(image_type.extension, (image_type.extension,))
+
+
+def fix_extension(path: Union[str, os.PathLike], image_type: ImageType) -> str:
+    """
+    Rename path so that its extension matches image_type, unless it already does.
+
+    Nothing is overwritten: if the new name is taken, the file is left where it is.
+
+    :return: The path of the file after the rename.
+    """
+    path = os.fspath(path)
+    if has_correct_extension(path, image_type):
+        return path
+
+    new_path = os.path.splitext(path)[0] + image_type.extension
+    try:
+        # Unlike os.rename(), which silently replaces an existing file, linking fails if new_path is taken. Checking
+        # for it beforehand would race with the other classify_images() threads renaming a file to the same name.
+        os.link(path, new_path)
+    except FileExistsError:
+        return path
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # No hard links on this file system: claim new_path by creating it exclusively, then move the file over it.
+        try:
+            os.close(os.open(new_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        except FileExistsError:
+            return path
+        try:
+            os.replace(path, new_path)
+        except OSError:
+            os.unlink(new_path)
+            raise
+        return new_path
+
+    os.unlink(path)
+    return new_path
+
+
+def _classify_batch(
+    paths: list[str], header_size: int, fix_extensions: bool, return_exceptions: bool
+) -> list[tuple[str, Union[Optional[ImageType], Exception]]]:
+    results = []
+    for path in paths:
+        try:
+            image_type = detect_image_type(path, header_size)
+            if fix_extensions and image_type is not None:
+                path = fix_extension(path, image_type)
+        except OSError as exc:
+            if not return_exceptions:
+                raise
+            results.append((path, exc))
+            continue
+        results.append((path, image_type))
+    return results
+
+
+def classify_images(
+    paths: Union[str, os.PathLike, Iterable[Union[str, os.PathLike]]],
+    workers: Optional[int] = None,
+    fix_extensions: bool = False,
+    return_exceptions: bool = False,
+    header_size: int = HEADER_SIZE,
+) -> Iterator[tuple[str, Union[Optional[ImageType], Exception]]]:
+    """
+    Detect the type of many image files, yielding (path, image_type) tuples as they complete.
+
+    Only the first header_size bytes of each file are read (see detect_image_type()). Reading is I/O bound, so the
+    files are spread over a thread pool, a batch of CLASSIFY_BATCH_SIZE paths at a time. At most a few batches per
+    thread are queued up, so huge directory trees are streamed through rather than listed up front.
+
+    Example::
+        >>> for path, image_type in classify_images("downloads", fix_extensions=True):
+        ...     if image_type is None:
+        ...         print(f"{path} isn't an image")
+
+    :param paths: A directory to classify every file under (see iter_files()), or an iterable of file paths.
+    :param workers: (optional) The number of threads. (Defaults to 4 * os.cpu_count(), up to 64)
+    :param fix_extensions: (optional) Rename files whose extension doesn't match their type (see fix_extension()).
+                           The yielded path is the one after the rename. (Defaults to False)
+    :param return_exceptions: (optional) If True, a file that can't be read yields (path, exception) instead of
+                              raising. (Defaults to False)
+    :param header_size: (optional) How many bytes to read from each file. (Defaults to HEADER_SIZE)
+    :return: (path, ImageType or None) tuples, in the order they complete.
+    """
+    if isinstance(paths, (str, os.PathLike)):
+        paths = iter_files(paths)
+    workers = workers or min(64, 4 * (os.cpu_count() or 1))
+    max_pending = 2 * workers
+    paths = iter(paths)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = set()
+
+        def submit_next() -> bool:
+            batch = [os.fspath(path) for path in itertools.islice(paths, CLASSIFY_BATCH_SIZE)]
+            if not batch:
+                return False
+            pending.add(executor.submit(_classify_batch, batch, header_size, fix_extensions, return_exceptions))
+            return True
+
+        while len(pending) < max_pending and submit_next():
+            pass
+
+        while pending:
+            done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.remove(future)
+                submit_next()
+                yield from future.result()
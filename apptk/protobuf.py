@@ -1,6 +1,26 @@
-from dataclasses import dataclass, field
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
 from enum import Enum
-from typing import Any, Optional
+from functools import wraps
+import mmap
+import os
+import struct
+from typing import Any, Callable, Iterable, Iterator, Optional, Sequence, Union
+
+BufferType = Union[bytes, bytearray, memoryview]
+
+# How many levels of nested sub-messages decode_buffer() will try to decode by default.
+DEFAULT_MAX_DEPTH = 32
+
+# A 64-bit value needs at most 10 bytes as a varint. Anything longer is malformed.
+MAX_VARINT_LENGTH = 10
+_UINT64_MASK = (1 << 64) - 1
+
+# gRPC frames are a 1 byte flags field followed by a 4 byte big-endian length, then the message.
+GRPC_FRAME_HEADER_LENGTH = 5
+GRPC_COMPRESSED_FLAG = 0x01
+GRPC_TRAILER_FLAG = 0x80
 
 
 class ValueTypes(Enum):
@@ -11,40 +31,212 @@ class ValueTypes(Enum):
 
     @classmethod
     def from_int(cls, value: int) -> Optional["ValueTypes"]:
-        for enum_value in cls:
-            if enum_value.value == value:
-                return enum_value
-        return None
+        return _VALUE_TYPES.get(value)
+
+
+_VALUE_TYPES = {value_type.value: value_type for value_type in ValueTypes}
+
+
+def _invalidating(method):
+    """Wrap a list method so that it drops the ProtoBufFields field number index before modifying the list."""
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        self._index = None
+        return method(self, *args, **kwargs)
+
+    return wrapper
 
 
 class ProtoBufFields(list):
-    def __init__(self, *args, **kwargs) -> None:
-        super().__init__(*args, **kwargs)
-        assert all(isinstance(item, Data) for item in self)
+    """
+    A list of decoded fields, in wire order, with constant time lookups by field number.
+
+    The field number -> positions index is built on the first lookup. Appending keeps it up to date, any other change
+    to the list throws it away so that it gets rebuilt on the next lookup.
+    """
+
+    _index: Optional[dict[int, list[int]]] = None
+
+    def _get_index(self) -> dict[int, list[int]]:
+        index = self._index
+        if index is None:
+            index = {}
+            for position, item in enumerate(self):
+                positions = index.get(item.field_no)
+                if positions is None:
+                    index[item.field_no] = [position]
+                else:
+                    positions.append(position)
+            self._index = index
+        return index
+
+    def get_fields(self, field_no: int) -> list["Data"]:
+        positions = self._get_index().get(field_no)
+        return [self[position] for position in positions] if positions else []
+
+    def get_field(self, field_no: int) -> Optional["Data"]:
+        positions = self._get_index().get(field_no)
+        return self[positions[0]] if positions else None
+
+    def get_path(
+        self, path: Union[str, Sequence[int]], default: Any = None, path_separator: str = "."
+    ) -> Union["Data", Any]:
+        """
+        Return the field found by following a path of field numbers through nested sub-messages.
+
+        Each step takes the first field with that field number, the same as get_field().
+
+        Examples::
+            >>> fields = decode_buffer(buffer)
+            >>> assert fields.get_path("3.1.7") is fields.get_field(3).sub_fields.get_field(1).sub_fields.get_field(7)
+            >>> assert fields.get_path([3, 1, 7]) is fields.get_path("3.1.7")
+
+        :param path: A string of field numbers separated by path_separator, or a sequence of field numbers.
+        :param default: (optional) The value to return if there is no field at path. (Defaults to None)
+        :param path_separator: (optional) The separator used in a string path. (Defaults to '.')
+        """
+        if isinstance(path, str):
+            path = [int(part) for part in path.split(path_separator)]
+
+        fields = self
+        item = default
+        for field_no in path:
+            if fields is None:
+                return default
+            item = fields.get_field(field_no)
+            if item is None:
+                return default
+            fields = item.sub_fields
+
+        return item
+
+    def append(self, item: "Data") -> None:
+        super().append(item)
+        if self._index is not None:
+            positions = self._index.get(item.field_no)
+            if positions is None:
+                self._index[item.field_no] = [len(self) - 1]
+            else:
+                positions.append(len(self) - 1)
+
+    def __copy__(self) -> "ProtoBufFields":
+        return type(self)(self)
 
-    def get_fields(self, field_no: int):
-        return [item for item in self if item.field_no == field_no]
+    def __reduce_ex__(self, protocol):
+        # The default reduction would carry self._index over (shared by copy.copy(), stale after a deepcopy()). It's
+        # only a cache, so copies and pickles leave it out and rebuild it on their first lookup.
+        return type(self), (list(self),)
 
-    def get_field(self, field_no: int):
-        for item in self:
-            if item.field_no == field_no:
-                return item
+    __setitem__ = _invalidating(list.__setitem__)
+    __delitem__ = _invalidating(list.__delitem__)
+    __iadd__ = _invalidating(list.__iadd__)
+    __imul__ = _invalidating(list.__imul__)
+    extend = _invalidating(list.extend)
+    insert = _invalidating(list.insert)
+    pop = _invalidating(list.pop)
+    remove = _invalidating(list.remove)
+    clear = _invalidating(list.clear)
+    sort = _invalidating(list.sort)
+    reverse = _invalidating(list.reverse)
+
+
+class _EmptyProtoBufFields(ProtoBufFields):
+    """
+    The shared, read-only sub_fields of every Data that isn't a sub-message.
+
+    Assign a new ProtoBufFields to Data.sub_fields instead of modifying this.
+    """
+
+    def __reduce_ex__(self, protocol):
+        return "EMPTY_FIELDS"
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("EMPTY_FIELDS is shared and cannot be modified. Assign a new ProtoBufFields instead.")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+    append = extend = insert = pop = remove = clear = sort = reverse = _read_only
+
+
+EMPTY_FIELDS = _EmptyProtoBufFields()
 
 
-@dataclass
 class Data:
+    """
+    A decoded field.
+
+    Data uses __slots__ and leaf fields all share EMPTY_FIELDS as their sub_fields, since a large message can decode
+    into millions of these.
+    """
+
+    __slots__ = ("field_no", "value", "value_type", "sub_fields", "_decoded_value")
+
     field_no: int
     value: Any
     value_type: ValueTypes
-    sub_fields: ProtoBufFields = field(default_factory=ProtoBufFields)
+    sub_fields: ProtoBufFields
+
+    def __init__(
+        self, field_no: int, value: Any, value_type: ValueTypes, sub_fields: Optional[ProtoBufFields] = None
+    ) -> None:
+        self.field_no = field_no
+        self.value = value
+        self.value_type = value_type
+        self.sub_fields = EMPTY_FIELDS if sub_fields is None else sub_fields
+        # The value sub_fields were decoded from, if they were. See encode_buffer().
+        self._decoded_value = None
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}(field_no={self.field_no!r}, value={self.value!r}, "
+            f"value_type={self.value_type!r}, sub_fields={self.sub_fields!r})"
+        )
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return (self.field_no, self.value, self.value_type, self.sub_fields) == (
+            other.field_no,
+            other.value,
+            other.value_type,
+            other.sub_fields,
+        )
+
+    __hash__ = None
+
+    def as_bytes(self) -> Any:
+        """
+        Return the value, materializing it as bytes if it is a view into the decoded buffer.
+
+        Values decoded with zero_copy=True are memoryview slices of the original buffer. Nothing is copied until this
+        is called.
+        """
+        return bytes(self.value) if isinstance(self.value, memoryview) else self.value
 
 
 class BufferReader:
     checkpoint: int
     offset: int
-    buffer: bytes
+    buffer: BufferType
 
-    def __init__(self, buffer: bytes) -> None:
+    def __init__(self, buffer: BufferType, zero_copy: bool = False) -> None:
+        """
+        Wrap a buffer for sequential reads.
+
+        :param buffer: The buffer to read from.
+        :param zero_copy: (optional) If True, wrap buffer in a memoryview so that read_buffer() returns views into the
+                          original buffer instead of copies. (Defaults to False)
+        """
+        if zero_copy:
+            buffer = buffer if isinstance(buffer, memoryview) else memoryview(buffer)
+            if buffer.format != "B" or buffer.ndim != 1:
+                buffer = buffer.cast("B")
         self.buffer = buffer
         self.offset = 0
 
@@ -80,78 +272,779 @@ class BufferReader:
                 self.offset = _offset
 
 
-def decode_varint(buffer: bytes, offset: int) -> tuple[int, int]:
-    shift: int = 0
-    result = 0
-    byte = None
+def _py_decode_varint(buffer: BufferType, offset: int) -> tuple[int, int]:
+    """
+    Decode a single varint.
 
-    while byte is None or byte >= 0x80:
-        if offset >= len(buffer):
-            raise OverflowError()
+    :param buffer: The buffer to decode from.
+    :param offset: The offset of the first byte of the varint.
+    :return: A tuple of the decoded value and the number of bytes it took up.
+    :raises OverflowError: If the buffer ends before the varint does.
+    :raises ValueError: If the varint is longer than MAX_VARINT_LENGTH bytes.
+    """
+    try:
         byte = buffer[offset]
-        offset += 1
-        multiplier = 2**shift
-        this_byte_value = (byte & 0x7F) * multiplier
-        shift += 7
-        result = result + this_byte_value
+        if byte < 0x80:
+            return byte, 1
+
+        # Two byte varints cover everything below 16384, which is most tags and length prefixes.
+        next_byte = buffer[offset + 1]
+        result = (byte & 0x7F) | ((next_byte & 0x7F) << 7)
+        if next_byte < 0x80:
+            return result, 2
+
+        shift = 14
+        position = offset + 2
+        end = offset + MAX_VARINT_LENGTH
+        while position < end:
+            byte = buffer[position]
+            position += 1
+            result |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return result, position - offset
+            shift += 7
+
+    except IndexError:
+        raise OverflowError() from None
 
-    return result, int(shift / 7)  # note: shift will always be a multiple of 7
+    raise ValueError(f"Varint is longer than {MAX_VARINT_LENGTH} bytes at offset {offset}")
 
 
-def decode_buffer_segment(buffer: bytes) -> tuple[list, bytes]:
-    reader = BufferReader(buffer)
-    parts = []
+def decode_varints(buffer: BufferType, offset: int, count: int) -> tuple[list[int], int]:
+    """
+    Decode count consecutive varints.
 
-    reader.skip_grc_header()
+    :param buffer: The buffer to decode from.
+    :param offset: The offset of the first byte of the first varint.
+    :param count: The number of varints to decode.
+    :return: A tuple of the decoded values and the number of bytes they took up.
+    """
+    values = []
+    append = values.append
+    position = offset
 
+    for _ in range(count):
+        try:
+            byte = buffer[position]
+        except IndexError:
+            raise OverflowError() from None
+
+        if byte < 0x80:
+            append(byte)
+            position += 1
+        else:
+            value, length = decode_varint(buffer, position)
+            append(value)
+            position += length
+
+    return values, position - offset
+
+
+def decode_packed_varints(buffer: BufferType) -> array:
+    """
+    Decode the payload of a packed repeated varint field (e.g. `repeated int64 ids = 1 [packed=true]`).
+
+    Values are returned as signed 64-bit integers, the way int32 / int64 fields are encoded on the wire.
+
+    :param buffer: The value of the packed field (i.e. a STRING field's value).
+    :raises OverflowError: If the last varint is truncated.
+    """
+    values = array("q")
+    append = values.append
+    position = 0
+    length = len(buffer)
+
+    while position < length:
+        byte = buffer[position]
+        if byte < 0x80:
+            append(byte)
+            position += 1
+            continue
+
+        value, value_length = decode_varint(buffer, position)
+        position += value_length
+        value &= _UINT64_MASK
+        append(value - (1 << 64) if value >= (1 << 63) else value)
+
+    return values
+
+
+def decode_buffer_segment(
+    buffer: BufferType, zero_copy: bool = False, grpc_header: bool = True
+) -> tuple[list, BufferType]:
+    """
+    Decode as many fields as possible from buffer.
+
+    :param buffer: The protobuf (or gRPC-framed protobuf) message to decode.
+    :param zero_copy: (optional) If True, STRING / FIXED32 / FIXED64 values and the leftovers are memoryview slices of
+                      buffer instead of bytes copies. (Defaults to False)
+    :param grpc_header: (optional) If True, skip a gRPC frame header at the start of buffer. (Defaults to True)
+    :return: A tuple of the decoded parts (as {"index", "type", "value"} dicts) and the leftover bytes that could not
+             be decoded.
+    """
+    items, leftovers = _decode_segment(buffer, zero_copy, grpc_header)
+    return [{"index": item.field_no, "type": item.value_type, "value": item.value} for item in items], leftovers
+
+
+def _decode_segment(buffer: BufferType, zero_copy: bool, grpc_header: bool) -> tuple[list[Data], BufferType]:
+    """Decode as many fields as possible from buffer straight into (leaf) Data instances."""
+    reader = BufferReader(buffer, zero_copy=zero_copy)
+    if grpc_header:
+        reader.skip_grc_header()
+
+    items, offset = _scan_segment(reader.buffer, reader.offset, Data, _VALUE_TYPES)
+    return items, reader.buffer[offset:]
+
+
+def _py_scan_segment(buffer: BufferType, offset: int, data_cls: type, value_types: dict) -> tuple[list, int]:
+    """
+    Decode fields from buffer, starting at offset, until the end of the buffer or the first undecodable field.
+
+    :return: A tuple of the decoded fields (as data_cls instances) and the offset where decoding stopped.
+    """
+    checkpoint = offset
+    end = len(buffer)
+    items = []
+    append = items.append
+    decode = _py_decode_varint
+    VARINT, STRING, FIXED32, FIXED64 = (value_types[0], value_types[2], value_types[5], value_types[1])
+
+    # This is the innermost loop of the decoder, so single byte varints (most tags, small ints and short lengths) are
+    # decoded inline instead of calling decode_varint().
     try:
-        while reader.bytes_left > 0:
-            # print(f"BytesLeft: {reader.bytes_left}")
-            reader.set_checkpoint()
-            index_type = reader.read_varint()
-            value_type_int = index_type & 0b111
-            value_type = ValueTypes.from_int(value_type_int)
-            value_index = index_type >> 3
+        while offset < end:
+            checkpoint = offset
+            tag = buffer[offset]
+            if tag < 0x80:
+                offset += 1
+            else:
+                tag, length = decode(buffer, offset)
+                offset += length
 
-            # print(f"index_type = {index_type}")
-            # print(f"value_type_int = {value_type_int}")
-            # print(f"value_type = {value_type}")
-            # print(f"value_index = {value_index}")
+            value_type = value_types.get(tag & 0b111)
 
-            if value_type == ValueTypes.VARINT:
-                value = reader.read_varint()
+            if value_type is VARINT:
+                value = buffer[offset]
+                if value < 0x80:
+                    offset += 1
+                else:
+                    value, length = decode(buffer, offset)
+                    offset += length
 
-            elif value_type == ValueTypes.STRING:
-                length = reader.read_varint()
-                value = reader.read_buffer(length)
+            elif value_type is STRING:
+                length = buffer[offset]
+                if length < 0x80:
+                    offset += 1
+                else:
+                    length, prefix_length = decode(buffer, offset)
+                    offset += prefix_length
+                if offset + length > end:
+                    raise OverflowError()
+                value = buffer[offset : offset + length]
+                offset += length
 
-            elif value_type == ValueTypes.FIXED32:
-                value = reader.read_buffer(4)
+            elif value_type is FIXED32:
+                if offset + 4 > end:
+                    raise OverflowError()
+                value = buffer[offset : offset + 4]
+                offset += 4
 
-            elif value_type == ValueTypes.FIXED64:
-                value = reader.read_buffer(8)
+            elif value_type is FIXED64:
+                if offset + 8 > end:
+                    raise OverflowError()
+                value = buffer[offset : offset + 8]
+                offset += 8
 
             else:
-                raise ValueError(f"Unknown Type: {value_type_int}")
+                raise ValueError(f"Unknown Type: {tag & 0b111}")
+
+            append(data_cls(tag >> 3, value, value_type))
+
+    except (IndexError, ValueError, OverflowError):
+        offset = checkpoint
+
+    return items, offset
+
+
+#
+# Decoder backends.
+#
+# A backend provides `decode_varint(buffer, offset)` and `scan_segment(buffer, offset, data_cls, value_types)` with
+# the exact semantics of _py_decode_varint() / _py_scan_segment(). The pure-Python backend is always available. The
+# compiled backend, `apptk._protobuf_speedups` (apptk/_protobuf_speedups.c, built by build.py where a compiler is
+# available), is registered and selected at import time if it was built.
+#
+_BACKENDS: dict[str, tuple[Callable, Callable]] = {"python": (_py_decode_varint, _py_scan_segment)}
+_backend: str = "python"
+decode_varint = _py_decode_varint
+_scan_segment = _py_scan_segment
+
+
+def register_backend(name: str, varint_decoder: Callable, segment_scanner: Callable) -> None:
+    """
+    Register a decoder backend.
+
+    :param name: The name to register the backend under.
+    :param varint_decoder: A drop-in replacement for decode_varint().
+    :param segment_scanner: A drop-in replacement for _py_scan_segment().
+    """
+    _BACKENDS[name] = (varint_decoder, segment_scanner)
+
+
+def available_backends() -> list[str]:
+    """Return the names of the registered decoder backends."""
+    return list(_BACKENDS)
+
+
+def get_backend() -> str:
+    """Return the name of the decoder backend in use."""
+    return _backend
+
+
+def set_backend(name: str) -> None:
+    """
+    Switch the decoder backend used by every decoding function in this module.
+
+    :param name: The name of a registered backend (see available_backends()).
+    :raises ValueError: If no backend is registered under name.
+    """
+    global _backend, decode_varint, _scan_segment  # pylint: disable=global-statement
+    try:
+        decode_varint, _scan_segment = _BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown protobuf backend: {name} (available: {', '.join(_BACKENDS)})") from None
+    _backend = name
+
+
+try:
+    from apptk import _protobuf_speedups
+except ImportError:
+    _protobuf_speedups = None
+else:
+    register_backend("speedups", _protobuf_speedups.decode_varint, _protobuf_speedups.scan_segment)
+    set_backend("speedups")
+
+
+def decode_buffer(
+    buffer: BufferType, zero_copy: bool = False, max_depth: int = DEFAULT_MAX_DEPTH, grpc_header: bool = True
+) -> ProtoBufFields:
+    """
+    Decode buffer into ProtoBufFields, guessing which STRING fields hold sub-messages.
+
+    A STRING field is treated as a sub-message if its value decodes cleanly (with no leftovers), in which case the
+    decoded fields end up in Data.sub_fields. Each nested payload is only parsed once.
+
+    :param buffer: The protobuf (or gRPC-framed protobuf) message to decode.
+    :param zero_copy: (optional) If True, values are memoryview slices of buffer. Use Data.as_bytes() to materialize
+                      them. (Defaults to False)
+    :param max_depth: (optional) How many levels of sub-messages to decode. 0 disables sub-message guessing.
+                      (Defaults to DEFAULT_MAX_DEPTH)
+    :param grpc_header: (optional) If True, skip a gRPC frame header at the start of buffer. (Defaults to True)
+    """
+    items, _leftovers = _decode_segment(buffer, zero_copy, grpc_header)
+    return _build_fields(items, zero_copy, max_depth)
+
+
+def _decode_sub_message(buffer: BufferType, zero_copy: bool, depth: int) -> Optional[ProtoBufFields]:
+    """Return the decoded fields if buffer is a cleanly decodable message, otherwise None."""
+    if len(buffer) == 0:
+        return None
+    items, leftovers = _decode_segment(buffer, zero_copy, False)
+    if len(leftovers) > 0:
+        return None
+    return _build_fields(items, zero_copy, depth)
+
+
+def _build_fields(items: list[Data], zero_copy: bool, depth: int) -> ProtoBufFields:
+    if depth > 0:
+        for item in items:
+            if item.value_type is ValueTypes.STRING:
+                sub_fields = _decode_sub_message(item.value, zero_copy, depth - 1)
+                if sub_fields is not None:
+                    item.sub_fields = sub_fields
+                    item._decoded_value = item.value
+
+    return ProtoBufFields(items)
+
 
-            parts.append({"index": value_index, "type": value_type, "value": value})
+class GrpcStreamDecoder:
+    """
+    Incrementally decode a stream of length-prefixed gRPC (or gRPC-web) frames.
 
-    except (ValueError, OverflowError):
-        reader.rollback_checkpoint()
+    Chunks can be split anywhere, including inside a frame header. Only the bytes of the frame currently being received
+    are kept in memory, so long server-streaming responses don't need to be buffered in full.
 
-    return parts, reader.read_buffer(reader.bytes_left)
+    Example::
+        decoder = GrpcStreamDecoder()
+        for chunk in response.iter_content(chunk_size=None):
+            for fields in decoder.feed(chunk):
+                handle(fields)
+        decoder.close()
+    """
 
+    trailers: dict[str, str]
 
-def decode_buffer(buffer):
-    parts, leftovers = decode_buffer_segment(buffer)
+    def __init__(self, zero_copy: bool = False, max_depth: int = DEFAULT_MAX_DEPTH) -> None:
+        """
+        Initialize the decoder.
+
+        :param zero_copy: (optional) Passed on to decode_buffer() for each frame. (Defaults to False)
+        :param max_depth: (optional) Passed on to decode_buffer() for each frame. (Defaults to DEFAULT_MAX_DEPTH)
+        """
+        self.zero_copy = zero_copy
+        self.max_depth = max_depth
+        self.trailers = {}
+        self._buffer = bytearray()
+
+    def feed(self, chunk: BufferType) -> list[ProtoBufFields]:
+        """
+        Add a chunk of the response body.
+
+        Trailer frames (as sent by gRPC-web) are not returned, but are parsed into self.trailers.
+
+        :param chunk: The next chunk of the body.
+        :return: The decoded messages of all frames completed by this chunk.
+        :raises ValueError: If a frame is compressed.
+        """
+        self._buffer += chunk
+        messages = []
+        offset = 0
+        buffer_length = len(self._buffer)
+
+        with memoryview(self._buffer) as view:
+            while buffer_length - offset >= GRPC_FRAME_HEADER_LENGTH:
+                flags = view[offset]
+                length = int.from_bytes(view[offset + 1 : offset + GRPC_FRAME_HEADER_LENGTH], byteorder="big")
+                start = offset + GRPC_FRAME_HEADER_LENGTH
+                if buffer_length - start < length:
+                    break
+
+                if flags & GRPC_COMPRESSED_FLAG:
+                    raise ValueError("Compressed gRPC frames are not supported.")
+
+                # The frame is copied out since the view can't outlive the next compaction of self._buffer.
+                payload = bytes(view[start : start + length])
+                offset = start + length
+
+                if flags & GRPC_TRAILER_FLAG:
+                    self._parse_trailers(payload)
+                else:
+                    messages.append(
+                        decode_buffer(payload, zero_copy=self.zero_copy, max_depth=self.max_depth, grpc_header=False)
+                    )
+
+        del self._buffer[:offset]
+        return messages
+
+    def close(self) -> None:
+        """
+        Signal the end of the stream.
+
+        :raises ValueError: If the stream ended in the middle of a frame.
+        """
+        if self._buffer:
+            raise ValueError(f"Stream ended with {len(self._buffer)} bytes of an incomplete gRPC frame.")
+
+    def _parse_trailers(self, payload: bytes) -> None:
+        for line in payload.decode("utf-8", errors="replace").split("\r\n"):
+            name, sep, value = line.partition(":")
+            if sep:
+                self.trailers[name.strip().lower()] = value.strip()
+
+
+def decode_grpc_stream(chunks: Iterable[BufferType], **kwargs) -> Iterator[ProtoBufFields]:
+    """
+    Yield the decoded message of each gRPC frame in a chunked body as soon as it is complete.
+
+    :param chunks: An iterable of body chunks, e.g. `response.iter_content(chunk_size=None)`.
+    :param kwargs: Passed on to GrpcStreamDecoder.
+    """
+    decoder = GrpcStreamDecoder(**kwargs)
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    decoder.close()
+
+
+ProjectionType = Union[Iterable[Union[str, int, Sequence[int]]], dict]
+
+
+def compile_projection(projection: ProjectionType, path_separator: str = ".") -> dict:
+    """
+    Normalize a projection into a tree of field numbers.
+
+    A projection is either an iterable of paths (e.g. `{"1", "3.1.7"}`, `[2, (3, 1, 7)]`) or a schema dict that maps
+    field numbers to a nested schema dict, or to None for a leaf (e.g. `{1: None, 3: {1: {7: None}}}`). Either way
+    the result is a schema dict.
+
+    :param projection: The projection to normalize.
+    :param path_separator: (optional) The separator used in string paths. (Defaults to '.')
+    """
+    if isinstance(projection, dict):
+        return {
+            int(field_no): None if not isinstance(sub_projection, dict) else compile_projection(sub_projection)
+            for field_no, sub_projection in projection.items()
+        }
+
+    tree: dict = {}
+    for path in projection:
+        if isinstance(path, str):
+            path = [int(part) for part in path.split(path_separator)]
+        elif isinstance(path, int):
+            path = [path]
+
+        node = tree
+        for position, field_no in enumerate(path):
+            is_leaf = position == len(path) - 1
+            if is_leaf:
+                node.setdefault(field_no, None)
+            else:
+                if node.get(field_no) is None:
+                    node[field_no] = {}
+                node = node[field_no]
+
+    return tree
+
+
+def decode_projection(
+    buffer: BufferType, projection: ProjectionType, zero_copy: bool = False, grpc_header: bool = True
+) -> ProtoBufFields:
+    """
+    Decode only the fields in projection.
+
+    Fields that aren't part of the projection are skipped over by their length without being materialized. Only the
+    STRING fields that have requested fields nested under them are decoded as sub-messages; leaf fields keep their raw
+    value and get no sub_fields.
+
+    Examples::
+        >>> fields = decode_projection(buffer, {"1", "3.1.7"})
+        >>> title = fields.get_field(1).value
+        >>> item = fields.get_path("3.1.7")
+
+    :param buffer: The protobuf (or gRPC-framed protobuf) message to decode.
+    :param projection: The fields to decode. See compile_projection().
+    :param zero_copy: (optional) If True, values are memoryview slices of buffer. (Defaults to False)
+    :param grpc_header: (optional) If True, skip a gRPC frame header at the start of buffer. (Defaults to True)
+    """
+    return _decode_projected(buffer, compile_projection(projection), zero_copy, grpc_header)
+
+
+def _decode_projected(buffer: BufferType, projection: dict, zero_copy: bool, grpc_header: bool) -> ProtoBufFields:
+    reader = BufferReader(buffer, zero_copy=zero_copy)
+    if grpc_header:
+        reader.skip_grc_header()
+
+    buffer = reader.buffer
+    offset = reader.offset
+    end = len(buffer)
     result = ProtoBufFields()
 
-    for part in parts:
-        if part["type"] == ValueTypes.STRING:
-            sub_parts, _leftovers = decode_buffer_segment(part["value"])
-            if len(part["value"]) > 0 and len(_leftovers) == 0:
-                part["sub_fields"] = decode_buffer(part["value"])
+    # Like decode_buffer_segment(), decoding stops at the first field that can't be decoded.
+    try:
+        while offset < end:
+            tag, length = decode_varint(buffer, offset)
+            offset += length
+            field_no = tag >> 3
+            value_type = _VALUE_TYPES.get(tag & 0b111)
+            wanted = field_no in projection
+
+            if value_type is ValueTypes.VARINT:
+                if wanted:
+                    value, length = decode_varint(buffer, offset)
+                    offset += length
+                else:
+                    while buffer[offset] >= 0x80:
+                        offset += 1
+                    offset += 1
+                    value = None
 
-        result.append(Data(field_no=part["index"], value=part["value"], value_type=part["type"]))
+            elif value_type is ValueTypes.STRING:
+                length, prefix_length = decode_varint(buffer, offset)
+                start = offset + prefix_length
+                offset = start + length
+                if offset > end:
+                    break
+                value = buffer[start:offset] if wanted else None
+
+            elif value_type is ValueTypes.FIXED32 or value_type is ValueTypes.FIXED64:
+                start = offset
+                offset += 4 if value_type is ValueTypes.FIXED32 else 8
+                if offset > end:
+                    break
+                value = buffer[start:offset] if wanted else None
+
+            else:
+                break
+
+            if wanted:
+                sub_projection = projection[field_no]
+                sub_fields = None
+                if sub_projection and value_type is ValueTypes.STRING:
+                    sub_fields = _decode_projected(value, sub_projection, zero_copy, False)
+                result.append(Data(field_no=field_no, value=value, value_type=value_type, sub_fields=sub_fields))
+
+    except (IndexError, ValueError, OverflowError):
+        pass
 
     return result
+
+
+def varint_size(value: int) -> int:
+    """Return the number of bytes value takes up as a varint. Negative values take up 10 bytes, like int64 fields."""
+    if value < 0:
+        return MAX_VARINT_LENGTH
+    return max(1, (value.bit_length() + 6) // 7)
+
+
+def encode_varint(value: int) -> bytes:
+    """
+    Encode value as a varint.
+
+    Negative values are encoded as their 64-bit two's complement, the way int32 / int64 fields are encoded.
+    """
+    out = bytearray(varint_size(value))
+    _write_varint(out, 0, value & _UINT64_MASK if value < 0 else value)
+    return bytes(out)
+
+
+def encode_buffer(fields: Iterable[Data], grpc_frame: bool = False) -> bytes:
+    """
+    Encode fields (e.g. from decode_buffer()) back into the protobuf wire format.
+
+    A STRING field whose sub_fields were decoded from its value is written from whichever of the two was changed: the
+    value if it was replaced, otherwise the sub_fields if anything in them differs from the value, otherwise the
+    original value (so that untouched sub-messages round-trip byte for byte). STRING fields with sub_fields built by
+    hand are encoded from their sub_fields. Otherwise the value is used as-is (str values are encoded as UTF-8). FIXED32 / FIXED64 values can be bytes, an int
+    or a float.
+
+    The size of every nested message is calculated first so that the whole message can be written into a single
+    preallocated buffer.
+
+    :param fields: The fields to encode.
+    :param grpc_frame: (optional) If True, prefix the message with a gRPC frame header. (Defaults to False)
+    """
+    sizes: list[int] = []
+    length = _measure_fields(fields, sizes)
+    offset = GRPC_FRAME_HEADER_LENGTH if grpc_frame else 0
+    out = bytearray(offset + length)
+
+    if grpc_frame:
+        out[1:GRPC_FRAME_HEADER_LENGTH] = length.to_bytes(4, byteorder="big")
+
+    _write_fields(out, offset, fields, iter(sizes))
+    return bytes(out)
+
+
+def _write_varint(out: bytearray, offset: int, value: int) -> int:
+    while value >= 0x80:
+        out[offset] = (value & 0x7F) | 0x80
+        value >>= 7
+        offset += 1
+    out[offset] = value
+    return offset + 1
+
+
+def _fixed_value(value: Any, length: int) -> BufferType:
+    if isinstance(value, float):
+        return struct.pack("<f" if length == 4 else "<d", value)
+    if isinstance(value, int):
+        return value.to_bytes(length, byteorder="little", signed=value < 0)
+    if len(value) != length:
+        raise ValueError(f"FIXED{length * 8} value must be {length} bytes long: {value!r}")
+    return value
+
+
+def _string_value(value: Any) -> BufferType:
+    return value.encode("utf-8") if isinstance(value, str) else value
+
+
+def _encode_from_sub_fields(item: Data) -> bool:
+    """Return True if the STRING field item has to be encoded from its sub_fields rather than its value."""
+    if not item.sub_fields:
+        return False
+    decoded_value = item._decoded_value
+    if decoded_value is None:
+        return True
+    return item.value is decoded_value and not _fields_match(item.sub_fields, decoded_value)
+
+
+def _fields_match(fields: ProtoBufFields, buffer: BufferType) -> bool:
+    """Return True if fields are still exactly what buffer (one level of it) decodes to."""
+    items, leftovers = _decode_segment(buffer, True, False)
+    if len(leftovers) > 0 or len(items) != len(fields):
+        return False
+    for decoded, item in zip(items, fields):
+        if decoded.field_no != item.field_no or decoded.value_type is not item.value_type:
+            return False
+        if decoded.value != item.value:
+            return False
+        if _encode_from_sub_fields(item):
+            return False
+    return True
+
+
+def _measure_fields(fields: Iterable[Data], sizes: list[int]) -> int:
+    """
+    Return the encoded length of fields.
+
+    The payload length of every STRING field is recorded in sizes, in the same (pre-)order that _write_fields()
+    visits them: as is for a field written from its sub_fields, as ~length for one written from its value. Nested
+    messages are measured before their parent's length is known, so each parent reserves its slot up front.
+    """
+    total = 0
+
+    for item in fields:
+        value_type = item.value_type
+        total += varint_size(item.field_no << 3)
+
+        if value_type is ValueTypes.VARINT:
+            total += varint_size(item.value)
+
+        elif value_type is ValueTypes.STRING:
+            slot = len(sizes)
+            sizes.append(0)
+            if _encode_from_sub_fields(item):
+                length = _measure_fields(item.sub_fields, sizes)
+                sizes[slot] = length
+            else:
+                length = len(_string_value(item.value))
+                sizes[slot] = ~length
+            total += varint_size(length) + length
+
+        elif value_type is ValueTypes.FIXED32:
+            total += 4
+
+        elif value_type is ValueTypes.FIXED64:
+            total += 8
+
+        else:
+            raise ValueError(f"Unknown Type: {value_type}")
+
+    return total
+
+
+def _write_fields(out: bytearray, offset: int, fields: Iterable[Data], sizes: Iterator[int]) -> int:
+    for item in fields:
+        value_type = item.value_type
+        offset = _write_varint(out, offset, (item.field_no << 3) | value_type.value)
+
+        if value_type is ValueTypes.VARINT:
+            value = item.value
+            offset = _write_varint(out, offset, value & _UINT64_MASK if value < 0 else value)
+
+        elif value_type is ValueTypes.STRING:
+            length = next(sizes)
+            if length >= 0:
+                offset = _write_varint(out, offset, length)
+                offset = _write_fields(out, offset, item.sub_fields, sizes)
+            else:
+                length = ~length
+                offset = _write_varint(out, offset, length)
+                out[offset : offset + length] = _string_value(item.value)
+                offset += length
+
+        else:
+            length = 4 if value_type is ValueTypes.FIXED32 else 8
+            out[offset : offset + length] = _fixed_value(item.value, length)
+            offset += length
+
+    return offset
+
+
+SourceType = Union[BufferType, str, os.PathLike]
+
+
+def decode_file(path: Union[str, os.PathLike], projection: Optional[ProjectionType] = None, **kwargs) -> ProtoBufFields:
+    """
+    Decode a file through an mmap instead of reading it into memory first.
+
+    :param path: The path of the file to decode.
+    :param projection: (optional) If given, decode with decode_projection() instead of decode_buffer().
+    :param kwargs: Passed on to decode_buffer() / decode_projection(). zero_copy is not supported since the values
+                   would be views into a mapping that is closed before this returns.
+    """
+    if kwargs.get("zero_copy"):
+        raise ValueError("decode_file() does not support zero_copy=True.")
+
+    with open(path, "rb") as fh:
+        if os.fstat(fh.fileno()).st_size == 0:
+            return ProtoBufFields()
+        with mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            if projection is not None:
+                return decode_projection(buffer, projection, **kwargs)
+            return decode_buffer(buffer, **kwargs)
+
+
+def _decode_source(source: SourceType, projection: Optional[ProjectionType], kwargs: dict) -> ProtoBufFields:
+    if isinstance(source, (str, os.PathLike)):
+        return decode_file(source, projection=projection, **kwargs)
+    if projection is not None:
+        return decode_projection(source, projection, **kwargs)
+    return decode_buffer(source, **kwargs)
+
+
+def decode_many(
+    sources: Iterable[SourceType],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    projection: Optional[ProjectionType] = None,
+    max_pending: Optional[int] = None,
+    **kwargs,
+) -> Iterator[Union[ProtoBufFields, tuple[int, ProtoBufFields]]]:
+    """
+    Decode many buffers and/or files in a process pool.
+
+    File paths are sent to the workers as-is and decoded through an mmap (see decode_file()), so the raw bytes are
+    never pickled. Only the decoded fields are sent back.
+
+    Examples::
+        >>> for fields in decode_many(pathlib.Path("captures").glob("*.bin"), workers=8):
+        ...     handle(fields)
+        >>> for index, fields in decode_many(paths, ordered=False):
+        ...     handle(paths[index], fields)
+
+    :param sources: An iterable of buffers (bytes-like) and/or file paths (str or os.PathLike).
+    :param workers: (optional) The number of worker processes. (Defaults to os.cpu_count())
+    :param ordered: (optional) If True, yield the decoded fields in the order of sources. Otherwise yield
+                    (index, fields) tuples as soon as each source is decoded. (Defaults to True)
+    :param projection: (optional) If given, decode with decode_projection() instead of decode_buffer().
+    :param max_pending: (optional) The maximum number of sources submitted to the pool at any time, which keeps memory
+                        bounded for long iterables. (Defaults to 4 * workers)
+    :param kwargs: Passed on to decode_buffer() / decode_projection(). zero_copy is not supported since memoryviews
+                   can't be sent back from the workers.
+    """
+    if kwargs.get("zero_copy"):
+        raise ValueError("decode_many() does not support zero_copy=True.")
+
+    workers = workers or os.cpu_count() or 1
+    max_pending = max_pending or 4 * workers
+    sources = enumerate(sources)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: dict[Future, int] = {}
+        queue: deque[Future] = deque()
+
+        def submit_next() -> bool:
+            for index, source in sources:
+                future = executor.submit(_decode_source, source, projection, kwargs)
+                pending[future] = index
+                if ordered:
+                    queue.append(future)
+                return True
+            return False
+
+        while len(pending) < max_pending and submit_next():
+            pass
+
+        if ordered:
+            while queue:
+                future = queue.popleft()
+                del pending[future]
+                submit_next()
+                yield future.result()
+        else:
+            while pending:
+                done, _not_done = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = pending.pop(future)
+                    submit_next()
+                    yield index, future.result()
@@ -0,0 +1,45 @@
+"""
+Build the optional compiled extensions.
+
+Poetry calls build() with the setup() keyword arguments when building a wheel (see `build` in pyproject.toml). The
+extensions are optional: if one fails to compile (no compiler, no Python headers, ...), the build carries on without
+it and apptk falls back to its pure-Python implementation.
+
+To build them in place for development, run `python build.py`.
+"""
+
+from setuptools import Extension
+from setuptools.command.build_ext import build_ext
+from setuptools.errors import CCompilerError, ExecError, PlatformError
+
+EXTENSIONS = [
+    Extension("apptk._protobuf_speedups", sources=["apptk/_protobuf_speedups.c"]),
+]
+
+
+class OptionalBuildExt(build_ext):
+    """build_ext that warns instead of failing when an extension can't be built."""
+
+    def run(self):
+        try:
+            super().run()
+        except (PlatformError, FileNotFoundError) as exc:
+            self.warn(f"Not building the optional compiled extensions: {exc}")
+
+    def build_extension(self, ext):
+        try:
+            super().build_extension(ext)
+        except (CCompilerError, ExecError, PlatformError, ValueError) as exc:
+            self.warn(f"Not building the optional extension {ext.name}: {exc}")
+
+
+def build(setup_kwargs):
+    setup_kwargs.update({"ext_modules": EXTENSIONS, "cmdclass": {"build_ext": OptionalBuildExt}})
+
+
+if __name__ == "__main__":
+    from setuptools import setup
+
+    setup_kwargs = {"name": "apptk", "script_args": ["build_ext", "--inplace"]}
+    build(setup_kwargs)
+    setup(**setup_kwargs)
@@ -0,0 +1,267 @@
+import unittest
+from unittest import TestCase, mock
+
+try:
+    from apptk import html
+except RuntimeError:
+    html = None
+
+bs4 = html.bs4 if html else None
+lxml = html.lxml if html else None
+lxml_cssselect = html.lxml_cssselect if html else None
+
+PAGE = """
+<html>
+  <body>
+    <h1 class="title">  The Title  </h1>
+    <ul id="links">
+      <li><a href="/one">One</a></li>
+      <li><a href="/two">Two</a></li>
+      <li><a class="external" href="https://example.com/">Example</a></li>
+    </ul>
+    <div class="price"><span>12.50</span> USD</div>
+  </body>
+</html>
+"""
+
+
+@unittest.skipIf(bs4 is None, "BeautifulSoup4 is not installed")
+class SelectorTestCase(TestCase):
+    def setUp(self):
+        self.soup = bs4.BeautifulSoup(PAGE, "html.parser")
+
+    def test_parse(self):
+        self.assertEqual(
+            html.Selector("#links a", attribute="href").parse(self.soup), ["/one", "/two", "https://example.com/"]
+        )
+        self.assertEqual(html.Selector(["h2", "a.external"]).parse(self.soup), ["Example"])
+
+    def test_parse_one(self):
+        self.assertEqual(html.Selector("h1").parse_one(self.soup), "The Title")
+        self.assertEqual(html.Selector(["h2", "li a"], attribute="href").parse_one(self.soup), "/one")
+        self.assertIsNone(html.Selector("h2").parse_one(self.soup))
+
+
+@unittest.skipIf(bs4 is None, "BeautifulSoup4 is not installed")
+class SelectorSetTestCase(TestCase):
+    def setUp(self):
+        self.soup = bs4.BeautifulSoup(PAGE, "html.parser")
+        self.selectors = {
+            "title": html.Selector("h1.title"),
+            "links": html.Selector(["a.external", "#links a"], attribute="href"),
+            "price": html.Selector("div.price > span"),
+            "scoped": html.Selector(":scope > ul > li"),
+            "missing": html.Selector("table td"),
+            "unkeyed": html.Selector([":is(h1, span)", "*"]),
+            "alternatives": html.Selector("h2, #links > li > A.EXTERNAL, div.price span"),
+            "same_paths": html.Selector(["a.external", "#links a"], attribute="href"),
+        }
+        self.selector_set = html.SelectorSet(self.selectors)
+
+    def test_extract_matches_parse(self):
+        body = self.soup.body
+        expected = {name: selector.parse(body) for name, selector in self.selectors.items()}
+        self.assertEqual(self.selector_set.extract(body), expected)
+
+    def test_extract_one_matches_parse_one(self):
+        body = self.soup.body
+        expected = {name: selector.parse_one(body) for name, selector in self.selectors.items()}
+        self.assertEqual(self.selector_set.extract_one(body), expected)
+        self.assertEqual(expected["links"], "https://example.com/")
+
+    def test_extract_elements(self):
+        results = self.selector_set.extract(self.soup, use_attribute=False)
+        self.assertEqual([element.name for element in results["links"]], ["a", "a", "a", "a"])
+
+
+@unittest.skipIf(lxml is None, "lxml is not installed")
+class LxmlSelectorTestCase(TestCase):
+    def setUp(self):
+        self.document = html.parse_html(PAGE, backend=html.Backend.LXML)
+
+    @unittest.skipIf(lxml_cssselect is None, "cssselect is not installed")
+    def test_css(self):
+        self.assertEqual(
+            html.Selector("#links a", attribute="href").parse(self.document), ["/one", "/two", "https://example.com/"]
+        )
+        self.assertEqual(html.Selector("h1").parse_one(self.document), "The Title")
+        self.assertEqual(html.Selector(["h2", "div.price"]).parse_one(self.document), "12.50 USD")
+        self.assertIsNone(html.Selector("h2").parse_one(self.document))
+
+    def test_xpath(self):
+        XPATH = html.Selector.PathType.XPATH
+        self.assertEqual(html.Selector("//ul/li/a/@href", path_type=XPATH).parse(self.document)[:2], ["/one", "/two"])
+        self.assertEqual(html.Selector("//a[@class='external']", path_type=XPATH).parse_one(self.document), "Example")
+        self.assertEqual(
+            html.Selector("//div[@class='price']/span/text()", path_type=XPATH).parse_one(self.document), "12.50"
+        )
+
+    @unittest.skipIf(lxml_cssselect is None, "cssselect is not installed")
+    def test_selector_set(self):
+        selectors = {
+            "title": html.Selector("h1.title"),
+            "links": html.Selector("//a/@href", path_type=html.Selector.PathType.XPATH),
+            "missing": html.Selector("table td"),
+        }
+        results = html.SelectorSet(selectors).extract_one(self.document)
+        self.assertEqual(results, {"title": "The Title", "links": "/one", "missing": None})
+
+    def test_without_cssselect(self):
+        with mock.patch.object(html, "lxml_cssselect", None):
+            XPATH = html.Selector.PathType.XPATH
+            self.assertEqual(html.Selector("//h1", path_type=XPATH).parse_one(self.document), "The Title")
+            with self.assertRaises(RuntimeError):
+                html.Selector("h1.title > em").parse_one(self.document)
+            if bs4 is not None:
+                self.assertIsInstance(html.parse_html(PAGE), bs4.BeautifulSoup)
+
+    @unittest.skipIf(bs4 is None, "BeautifulSoup4 is not installed")
+    def test_xpath_needs_lxml(self):
+        soup = html.parse_html(PAGE, backend=html.Backend.BS4)
+        with self.assertRaises(ValueError):
+            html.Selector("//a", path_type=html.Selector.PathType.XPATH).parse(soup)
+
+
+@unittest.skipIf(html is None, "BeautifulSoup4 and lxml are not installed")
+class StreamingExtractorTestCase(TestCase):
+    def test_iter_extract(self):
+        selectors = {
+            "title": html.Selector("h1.title"),
+            "links": html.Selector("#links a", attribute="href"),
+            "price": html.Selector("div.price > span"),
+            "external": html.Selector("a[class=external]"),
+        }
+        chunks = [PAGE.encode("utf-8")[i : i + 7] for i in range(0, len(PAGE), 7)]
+        self.assertEqual(
+            list(html.iter_extract(chunks, selectors)),
+            [
+                ("title", "The Title"),
+                ("links", "/one"),
+                ("links", "/two"),
+                ("links", "https://example.com/"),
+                ("external", "Example"),
+                ("price", "12.50"),
+            ],
+        )
+
+    def test_nested_and_unclosed_elements(self):
+        document = "<ul><li>one<li>two <b>bold</b><li>three</ul><div><div>inner</div>outer</div><br><p>last"
+        selectors = {"items": html.Selector("ul > li"), "divs": html.Selector("div"), "last": html.Selector("p")}
+        self.assertEqual(
+            list(html.iter_extract([document], selectors)),
+            [
+                ("items", "one"),
+                ("items", "two bold"),
+                ("items", "three"),
+                ("divs", "inner"),
+                ("divs", "innerouter"),
+                ("last", "last"),
+            ],
+        )
+
+    def test_multibyte_characters_split_across_chunks(self):
+        document = '<p title="café">café &amp; crème</p>'.encode("utf-8")
+        selectors = {"text": html.Selector("p"), "title": html.Selector("p", attribute="title")}
+        chunks = [document[i : i + 1] for i in range(len(document))]
+        self.assertEqual(list(html.iter_extract(chunks, selectors)), [("title", "café"), ("text", "café & crème")])
+
+    def test_first_text_node_split_across_chunks(self):
+        selectors = {"first": html.Selector("h1", text_mode=html.Selector.TextMode.FIRST)}
+        self.assertEqual(list(html.iter_extract(["<h1>Hel", "lo World</h1>"], selectors)), [("first", "Hello World")])
+        chunks = ["<h1> ", " <!-- x -->", "\n <b>Hel", "lo</b> World"]
+        self.assertEqual(list(html.iter_extract(chunks, selectors)), [("first", "Hello")])
+
+    def test_unsupported_selectors(self):
+        for path in ["a:first-child", "ul + li", "> a", "a >"]:
+            with self.subTest(path=path), self.assertRaises(ValueError):
+                html.StreamingExtractor({"x": html.Selector(path)})
+        with self.assertRaises(ValueError):
+            html.StreamingExtractor({"x": html.Selector("//a", path_type=html.Selector.PathType.XPATH)})
+
+
+@unittest.skipIf(html is None, "BeautifulSoup4 and lxml are not installed")
+class ExtractManyTestCase(TestCase):
+    def test_extract_many(self):
+        documents = [
+            f"<h1>Page {index}</h1><a href='/{index}/a'>a</a><a href='/{index}/b'>b</a>" for index in range(20)
+        ]
+        selectors = {"title": html.Selector("h1"), "links": html.Selector("a", attribute="href")}
+
+        results = list(html.extract_many(iter(documents), selectors, workers=2, max_pending=3))
+        self.assertEqual(
+            results, [{"title": [f"Page {i}"], "links": [f"/{i}/a", f"/{i}/b"]} for i in range(len(documents))]
+        )
+
+        results = list(html.extract_many(documents, selectors, workers=2, first_only=True))
+        self.assertEqual(results, [{"title": f"Page {i}", "links": f"/{i}/a"} for i in range(len(documents))])
+
+
+@unittest.skipIf(html is None, "BeautifulSoup4 and lxml are not installed")
+class TextModeTestCase(TestCase):
+    CELL = "<table><tr><td>\n  <b>Bold</b> direct <!-- comment --><i>italic</i> tail  </td></tr></table>"
+    EXPECTED = (
+        {
+            html.Selector.TextMode.ALL: "Bold direct italic tail",
+            html.Selector.TextMode.DIRECT: "direct  tail",
+            html.Selector.TextMode.FIRST: "Bold",
+        }
+        if html
+        else {}
+    )
+    SCRIPT = "<div>  <script>var x=1</script>text<style>p {}</style><template><b>t</b></template></div>"
+
+    def documents(self, markup=CELL):
+        backends = [html.Backend.BS4] if bs4 else []
+        if lxml_cssselect:
+            backends.append(html.Backend.LXML)
+        return [html.parse_html(markup, backend=backend) for backend in backends]
+
+    def test_text_modes(self):
+        for document in self.documents():
+            for text_mode, expected in self.EXPECTED.items():
+                with self.subTest(document=type(document), text_mode=text_mode):
+                    self.assertEqual(html.Selector("td", text_mode=text_mode).parse_one(document), expected)
+
+    def test_streaming_text_modes(self):
+        for text_mode, expected in self.EXPECTED.items():
+            with self.subTest(text_mode=text_mode):
+                results = list(html.iter_extract([self.CELL], {"cell": html.Selector("td", text_mode=text_mode)}))
+                self.assertEqual(results, [("cell", expected)])
+
+    def test_textless_elements(self):
+        for text_mode in html.Selector.TextMode:
+            with self.subTest(text_mode=text_mode):
+                for document in self.documents(self.SCRIPT):
+                    self.assertEqual(html.Selector("div", text_mode=text_mode).parse_one(document), "text")
+                    self.assertEqual(html.Selector("script", text_mode=text_mode).parse_one(document), "var x=1")
+                results = html.iter_extract(
+                    [self.SCRIPT],
+                    {
+                        "div": html.Selector("div", text_mode=text_mode),
+                        "script": html.Selector("script", text_mode=text_mode),
+                    },
+                )
+                self.assertEqual(sorted(results), [("div", "text"), ("script", "var x=1")])
+
+    def test_stripping(self):
+        for document in self.documents():
+            selector = html.Selector("td", text_mode=html.Selector.TextMode.DIRECT, strip_trailing_whitespace=False)
+            self.assertEqual(selector.parse_one(document), "direct  tail  ")
+
+    def test_iter_parse(self):
+        for document in self.documents():
+            with self.subTest(document=type(document)):
+                results = html.Selector(["td", "b", "tr > td"], text_mode=html.Selector.TextMode.FIRST).iter_parse(
+                    document
+                )
+                self.assertEqual(next(results), "Bold")
+                self.assertEqual(list(results), ["Bold", "Bold"])
+
+    def test_repeated_matches_are_memoized(self):
+        selector = html.Selector(["td", "tr > td", "table td"])
+        calls = []
+        get_text = selector.get_text
+        selector.get_text = lambda element: calls.append(element) or get_text(element)
+        for document in self.documents():
+            self.assertEqual(selector.parse(document), ["Bold direct italic tail"] * 3)
+        self.assertEqual(len(calls), len(self.documents()))
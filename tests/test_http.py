@@ -0,0 +1,788 @@
+import asyncio
+import bz2
+from contextlib import contextmanager
+import email.utils
+import gzip
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+import json
+import lzma
+import os
+import pathlib
+import tempfile
+import threading
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase, TestCase, mock
+from urllib.parse import urlsplit
+import zlib
+
+try:
+    import requests
+    import urllib3
+
+    from apptk import http
+except (ImportError, RuntimeError):
+    http = None
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+try:
+    from urllib3.contrib import socks
+except ImportError:
+    socks = None
+
+FILE_BODY = bytes(range(256)) * 40
+GZIPPED_BODY = gzip.compress(FILE_BODY)
+CACHE_HEADERS = {
+    "cached": {"Cache-Control": "max-age=60"},
+    "etag": {"Cache-Control": "no-cache", "ETag": '"v1"'},
+    "nostore": {"Cache-Control": "no-store, max-age=60"},
+}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves a few canned responses. Paths look like /<behaviour>/<anything>."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.track_request(self):
+            self.respond()
+
+    def do_HEAD(self):
+        with self.server.track_request(self):
+            self.respond(include_body=False)
+
+    def respond(self, include_body=True):
+        behaviour = self.path.strip("/").split("/")[0]
+
+        if behaviour in ("file", "norange", "weak", "noranges"):
+            self.respond_with_file(include_body, behaviour)
+            return
+
+        if behaviour in ("gzipped", "truncated"):
+            body = GZIPPED_BODY if behaviour == "gzipped" else GZIPPED_BODY[: len(GZIPPED_BODY) // 2]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/gzip")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if include_body:
+                self.wfile.write(body)
+            return
+
+        if behaviour == "slow":
+            time.sleep(0.05)
+
+        if behaviour in ("flaky", "throttled") and self.server.count_requests(self.path) <= 2:
+            self.send_response(503 if behaviour == "flaky" else 429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        if behaviour == "etag" and self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            return
+
+        status = 404 if behaviour == "missing" else 200
+        body = self.path.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        if behaviour in CACHE_HEADERS:
+            for name, value in CACHE_HEADERS[behaviour].items():
+                self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+    def respond_with_file(self, include_body, behaviour):
+        """
+        Serve FILE_BODY. "file" supports ranges, "weak" does too but has a weak ETag (so, like nginx, it ignores Range
+        requests with an If-Range), "noranges" advertises ranges but ignores Range and "norange" doesn't support them.
+        """
+        body = FILE_BODY
+        byte_range = self.headers.get("Range")
+        accept_ranges = behaviour != "norange"
+        etag = 'W/"v1"' if behaviour == "weak" else '"v1"'
+        if_range = self.headers.get("If-Range")
+        if behaviour == "noranges" or (if_range and (if_range != etag or etag.startswith("W/"))):
+            byte_range = None
+
+        if accept_ranges and byte_range:
+            start, end = byte_range.split("=")[1].split("-")
+            body = body[int(start) : int(end) + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(FILE_BODY)}")
+        else:
+            self.send_response(200)
+
+        if accept_ranges:
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if include_body:
+            self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.lock = threading.Lock()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    def count_requests(self, path):
+        with self.lock:
+            return sum(1 for _command, request_path, _headers in self.requests if request_path == path)
+
+    @contextmanager
+    def track_request(self, handler):
+        with self.lock:
+            self.requests.append((handler.command, handler.path, dict(handler.headers)))
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StandInServerMixin:
+    def start_server(self):
+        self.server = StandInServer()
+        thread = threading.Thread(target=self.server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        thread.start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+
+    def url(self, path):
+        return self.server.base_url + path
+
+
+@unittest.skipIf(http is None, "requests is not installed")
+class HttpTestCase(StandInServerMixin, TestCase):
+    def setUp(self):
+        self.start_server()
+
+
+@unittest.skipIf(http is None or http.cloudscraper is None, "cloudscraper is not installed")
+class CloudscraperTestCase(HttpTestCase):
+    def test_keeps_cloudscraper_tls_settings(self):
+        policy = http.RetryPolicy(max_retries=1)
+        client = http.HttpClient(use_cloudscraper=True, retry_policy=policy, pool_maxsize=20)
+        adapter = client.adapters["https://"]
+        self.assertIsInstance(adapter, http.cloudscraper.CipherSuiteAdapter)
+        self.assertIsInstance(adapter, http.HttpAdapter)
+        self.assertEqual(adapter.ecdhCurve, "secp384r1")
+        self.assertIs(adapter.retry_policy, policy)
+        self.assertEqual(adapter._pool_maxsize, 20)
+        self.assertIs(adapter.poolmanager.connection_pool_kw["ssl_context"], adapter.ssl_context)
+
+    def test_plain_http_requests(self):
+        response = http.HttpClient(use_cloudscraper=True).get(self.url("/ok/a"))
+        self.assertEqual(response.status_code, 200)
+
+
+class FetchManyTestCase(HttpTestCase):
+    def test_fetch_many(self):
+        client = http.HttpClient()
+        urls = [self.url(f"/ok/{index}") for index in range(20)]
+        result = dict(client.fetch_many(urls, concurrency=5))
+        self.assertEqual(set(result), set(urls))
+        self.assertTrue(all(response.text == urlsplit(url).path for url, response in result.items()))
+
+    def test_max_per_host(self):
+        client = http.HttpClient(max_per_host=2)
+        urls = [self.url(f"/slow/{index}") for index in range(8)]
+        list(client.fetch_many(urls, concurrency=8))
+        self.assertLessEqual(self.server.max_active, 2)
+
+    def test_return_exceptions(self):
+        client = http.HttpClient()
+        urls = [self.url("/ok/1"), "http://127.0.0.1:1/refused"]
+        result = dict(client.fetch_many(urls, return_exceptions=True))
+        self.assertEqual(result[urls[0]].status_code, 200)
+        self.assertIsInstance(result[urls[1]], Exception)
+
+    def test_raises_exceptions(self):
+        client = http.HttpClient()
+        with self.assertRaises(Exception):
+            list(client.fetch_many(["http://127.0.0.1:1/refused"]))
+
+
+class DownloadFileTestCase(HttpTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.filename = pathlib.Path(directory.name) / "download.bin"
+        self.state_path = pathlib.Path(f"{self.filename}{http.DOWNLOAD_STATE_SUFFIX}")
+
+    def ranges_requested(self):
+        return [headers.get("Range") for command, _path, headers in self.server.requests if command == "GET"]
+
+    def test_download_file(self):
+        result = http.HttpClient().download_file(self.url("/file/a"), self.filename, chunk_size=1000)
+        self.assertEqual(result, self.filename)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+
+    def test_download_in_parts(self):
+        http.HttpClient().download_file(self.url("/file/a"), self.filename, parts=3)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(sorted(self.ranges_requested()), ["bytes=0-3413", "bytes=3414-6827", "bytes=6828-10239"])
+        self.assertFalse(self.state_path.exists())
+
+    def test_falls_back_without_accept_ranges(self):
+        http.HttpClient().download_file(self.url("/norange/a"), self.filename, parts=3)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(self.ranges_requested(), [None])
+
+    def test_weak_etag(self):
+        http.HttpClient().download_file(self.url("/weak/a"), self.filename, parts=3)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(len(self.ranges_requested()), 3)
+        self.assertFalse(any("If-Range" in headers for _command, _path, headers in self.server.requests))
+
+        # Without a strong validator, nothing says the bytes on disk are still current.
+        self.filename.write_bytes(FILE_BODY[:100] + bytes(len(FILE_BODY) - 100))
+        state = {"url": self.url("/weak/a"), "length": len(FILE_BODY), "validator": None, "parts": [[0, 10239, 100]]}
+        self.state_path.write_text(json.dumps(state))
+        self.server.requests.clear()
+        http.HttpClient().download_file(self.url("/weak/a"), self.filename, resume=True)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(self.ranges_requested(), ["bytes=0-10239"])
+
+    def test_falls_back_when_ranges_are_ignored(self):
+        http.HttpClient().download_file(self.url("/noranges/a"), self.filename, parts=3)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertIn(None, self.ranges_requested())
+        self.assertFalse(self.state_path.exists())
+
+    def test_resume_from_state(self):
+        self.filename.write_bytes(FILE_BODY[:100] + bytes(4900) + FILE_BODY[5000:])
+        state = {"url": self.url("/file/a"), "length": len(FILE_BODY), "validator": '"v1"'}
+        state["parts"] = [[0, 4999, 100], [5000, 10239, 10240]]
+        self.state_path.write_text(json.dumps(state))
+
+        http.HttpClient().download_file(self.url("/file/a"), self.filename, resume=True)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(self.ranges_requested(), ["bytes=100-4999"])
+        self.assertFalse(self.state_path.exists())
+
+    def test_resume_restarts_without_state(self):
+        # Without a state file nothing says the bytes on disk came from the current version of the resource.
+        for stale in [FILE_BODY[:1234], bytes(len(FILE_BODY))]:
+            with self.subTest(size=len(stale)):
+                self.server.requests.clear()
+                self.filename.write_bytes(stale)
+                http.HttpClient().download_file(self.url("/file/a"), self.filename, resume=True)
+                self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+                self.assertEqual(self.ranges_requested(), ["bytes=0-10239"])
+
+    def test_headers_none(self):
+        http.HttpClient().download_file(self.url("/file/a"), self.filename, parts=2, headers=None)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+
+    def test_resume_restarts_when_resource_changed(self):
+        self.filename.write_bytes(bytes(len(FILE_BODY)))
+        state = {"url": self.url("/file/a"), "length": len(FILE_BODY), "validator": '"v0"'}
+        state["parts"] = [[0, 10239, 5000]]
+        self.state_path.write_text(json.dumps(state))
+
+        http.HttpClient().download_file(self.url("/file/a"), self.filename, resume=True)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(self.ranges_requested(), ["bytes=0-10239"])
+
+    def test_hashes(self):
+        result = http.HttpClient().download_file(self.url("/file/a"), self.filename, hashes=["sha256", "md5"])
+        self.assertEqual(result.filename, self.filename)
+        self.assertEqual(
+            result.digests,
+            {"sha256": hashlib.sha256(FILE_BODY).hexdigest(), "md5": hashlib.md5(FILE_BODY).hexdigest()},
+        )
+
+    def test_decompress(self):
+        result = http.HttpClient().download_file(
+            self.url("/gzipped/a"), self.filename, chunk_size=100, decompress="gzip", hashes=["sha256"]
+        )
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+        self.assertEqual(result.digests, {"sha256": hashlib.sha256(FILE_BODY).hexdigest()})
+
+    def test_max_size(self):
+        with self.assertRaises(http.DownloadTooLargeError):
+            http.HttpClient().download_file(self.url("/file/a"), self.filename, max_size=1000)
+        self.assertFalse(self.filename.exists())
+
+    def test_max_size_after_decompression(self):
+        with self.assertRaises(http.DownloadTooLargeError):
+            http.HttpClient().download_file(self.url("/gzipped/a"), self.filename, decompress="gzip", max_size=5000)
+        self.assertFalse(self.filename.exists())
+
+        http.HttpClient().download_file(self.url("/gzipped/a"), self.filename, decompress="gzip", max_size=10240)
+        self.assertEqual(self.filename.read_bytes(), FILE_BODY)
+
+    def test_iter_decompress_is_bounded(self):
+        body = bytes(20 * 1024 * 1024)
+        compressors = {"gzip": gzip.compress, "deflate": zlib.compress, "bz2": bz2.compress, "xz": lzma.compress}
+        if http.zstandard is not None:
+            compressors["zstd"] = http.zstandard.ZstdCompressor().compress
+        for name, compress in compressors.items():
+            with self.subTest(name=name):
+                compressed = compress(body)
+                chunks = [compressed[i : i + 1000] for i in range(0, len(compressed), 1000)]
+                sizes = [len(output) for output in http.iter_decompress(name, chunks, 65536)]
+                self.assertLessEqual(max(sizes), 65536)
+                self.assertEqual(sum(sizes), len(body))
+
+        self.assertEqual(b"".join(http.iter_decompress("gzip", [GZIPPED_BODY], 100)), FILE_BODY)
+        with self.assertRaises(ValueError):
+            http.iter_decompress("rar", [], 100)
+
+    def test_iter_decompress_truncated(self):
+        body = os.urandom(50000) * 2
+        compressed = {
+            "gzip": gzip.compress(body),
+            "deflate": zlib.compress(body),
+            "bz2": bz2.compress(body),
+            "xz": lzma.compress(body),
+        }
+        if http.zstandard is not None:
+            compressed["zstd"] = http.zstandard.ZstdCompressor().compress(body)
+            # Streamed: no content size in the frame header, and a checksum after the last block.
+            compressor = http.zstandard.ZstdCompressor(write_checksum=True).compressobj()
+            compressed["zstd streamed"] = compressor.compress(body) + compressor.flush()
+
+        for name, data in compressed.items():
+            codec = name.split()[0]
+            with self.subTest(name=name):
+                chunks = [data[i : i + 999] for i in range(0, len(data), 999)]
+                self.assertEqual(b"".join(http.iter_decompress(codec, chunks, 4096)), body)
+                for end in (len(data) // 2, len(data) - 1):
+                    with self.assertRaises(http.TruncatedStreamError):
+                        b"".join(http.iter_decompress(codec, [data[:end]], 4096))
+
+    def test_download_truncated(self):
+        with self.assertRaises(http.TruncatedStreamError):
+            http.HttpClient().download_file(self.url("/truncated/a"), self.filename, decompress="gzip", hashes=["md5"])
+        self.assertFalse(self.filename.exists())
+
+    def test_stages_with_parts(self):
+        with self.assertRaises(ValueError):
+            http.HttpClient().download_file(self.url("/file/a"), self.filename, parts=2, hashes=["sha256"])
+
+
+class HttpCacheTestCase(HttpTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = http.HttpCache(pathlib.Path(directory.name) / "cache.sqlite3")
+        self.addCleanup(self.cache.close)
+        self.client = http.HttpClient(cache=self.cache)
+
+    def get_count(self, path):
+        return sum(1 for _command, request_path, _headers in self.server.requests if request_path == path)
+
+    def test_fresh_response_served_from_cache(self):
+        first = self.client.get(self.url("/cached/a"))
+        second = self.client.get(self.url("/cached/a"))
+        self.assertEqual(second.text, first.text)
+        self.assertTrue(second.from_cache)
+        self.assertEqual(second.headers["Cache-Control"], "max-age=60")
+        self.assertEqual(self.get_count("/cached/a"), 1)
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "revalidations": 0})
+
+    def test_stale_response_revalidated(self):
+        self.client.get(self.url("/etag/a"))
+        second = self.client.get(self.url("/etag/a"))
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.text, "/etag/a")
+        self.assertEqual(self.get_count("/etag/a"), 2)
+        self.assertEqual(self.server.requests[-1][2].get("If-None-Match"), '"v1"')
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 1, "revalidations": 1})
+
+    def test_concurrent_counts(self):
+        self.client.get(self.url("/cached/a"))
+        urls = [self.url("/cached/a")] * 200
+        self.assertEqual(len(list(self.client.fetch_many(urls, concurrency=8))), len(urls))
+        self.assertEqual(self.cache.stats(), {"hits": len(urls), "misses": 1, "revalidations": 0})
+
+    def test_no_store_not_cached(self):
+        self.client.get(self.url("/nostore/a"))
+        self.client.get(self.url("/nostore/a"))
+        self.assertEqual(self.get_count("/nostore/a"), 2)
+
+    def test_response_without_freshness_not_cached(self):
+        self.client.get(self.url("/ok/a"))
+        self.client.get(self.url("/ok/a"))
+        self.assertEqual(self.get_count("/ok/a"), 2)
+
+    def test_streamed_requests_bypass_cache(self):
+        self.client.get(self.url("/cached/a"))
+        self.client.get(self.url("/cached/a"), stream=True).close()
+        self.assertEqual(self.get_count("/cached/a"), 2)
+
+    def test_expires_header(self):
+        headers = {"Date": "Sat, 17 Oct 2026 10:00:00 GMT", "Expires": "Sat, 17 Oct 2026 10:05:00 GMT"}
+        expires_at = http.get_expires_at(headers, {})
+        self.assertAlmostEqual(expires_at - time.time(), 300, delta=5)
+        self.assertEqual(http.get_expires_at(headers, {"no-cache": None}), 0)
+        self.assertEqual(http.parse_cache_control('max-age=60, no-cache, private="x"')["private"], "x")
+
+    def test_lru_eviction(self):
+        self.cache.max_size = len("/cached/a") * 2
+        self.client.get(self.url("/cached/a"))
+        self.client.get(self.url("/cached/b"))
+        self.client.get(self.url("/cached/a"))
+        self.client.get(self.url("/cached/c"))
+        self.client.get(self.url("/cached/a"))
+        self.client.get(self.url("/cached/b"))
+        self.assertEqual(self.get_count("/cached/a"), 1)
+        self.assertEqual(self.get_count("/cached/b"), 2)
+
+
+@unittest.skipIf(http is None, "requests is not installed")
+class RetryPolicyTestCase(TestCase):
+    def test_backoff(self):
+        policy = http.RetryPolicy(backoff_factor=1, max_backoff=5, jitter=0)
+        self.assertEqual([policy.get_backoff(attempt) for attempt in range(5)], [1, 2, 4, 5, 5])
+
+    def test_backoff_jitter(self):
+        policy = http.RetryPolicy(backoff_factor=1, jitter=0.5)
+        for _ in range(20):
+            self.assertTrue(2 <= policy.get_backoff(2) <= 4)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(http.parse_retry_after("120"), 120)
+        self.assertIsNone(http.parse_retry_after("soon"))
+        self.assertAlmostEqual(
+            http.parse_retry_after(email.utils.formatdate(time.time() + 60, usegmt=True)), 60, delta=2
+        )
+
+    def test_should_retry(self):
+        policy = http.RetryPolicy(max_retries=2)
+        self.assertTrue(policy.should_retry("GET", 0))
+        self.assertFalse(policy.should_retry("POST", 0))
+        self.assertFalse(policy.should_retry("GET", 2))
+
+    def test_retry_after_is_bounded(self):
+        policy = http.RetryPolicy(max_backoff=60)
+        response = requests.Response()
+        response.status_code = 503
+        response.headers["Retry-After"] = "30"
+        self.assertTrue(policy.should_retry("GET", 0, response))
+        self.assertEqual(policy.get_backoff(0, response), 30)
+
+        response.headers["Retry-After"] = "86400"
+        self.assertFalse(policy.should_retry("GET", 0, response))
+        self.assertEqual(policy.get_backoff(0, response), 60)
+
+
+class RetryTestCase(HttpTestCase):
+    def test_retries_until_success(self):
+        client = http.HttpClient(retry_policy=http.RetryPolicy(max_retries=3))
+        response = client.get(self.url("/flaky/a"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.retries, 2)
+        self.assertEqual(self.server.count_requests("/flaky/a"), 3)
+
+    def test_gives_up_after_max_retries(self):
+        client = http.HttpClient(retry_policy=http.RetryPolicy(max_retries=1))
+        response = client.get(self.url("/flaky/a"))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(self.server.count_requests("/flaky/a"), 2)
+
+    def test_rate_limiter_slows_down_on_throttling(self):
+        limiter = http.RateLimiter(rate=20, burst=1, min_rate=1)
+        client = http.HttpClient(retry_policy=http.RetryPolicy(), rate_limiter=limiter)
+        response = client.get(self.url("/throttled/a"))
+        self.assertEqual(response.status_code, 200)
+        self.assertAlmostEqual(limiter.get_rate(urlsplit(self.server.base_url).netloc), 5.1)
+
+    def test_retries_connection_errors(self):
+        client = http.HttpClient(retry_policy=http.RetryPolicy(max_retries=2, backoff_factor=0.01))
+        with self.assertRaises(requests.ConnectionError):
+            client.get("http://127.0.0.1:1/refused")
+
+
+@unittest.skipIf(http is None, "requests is not installed")
+class RateLimiterTestCase(TestCase):
+    def test_acquire_paces_requests(self):
+        limiter = http.RateLimiter(rate=50, burst=1)
+        start = time.monotonic()
+        for _ in range(6):
+            limiter.acquire("example.com")
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+    def test_hosts_are_independent(self):
+        limiter = http.RateLimiter(rate=1, burst=1)
+        start = time.monotonic()
+        limiter.acquire("a.example.com")
+        limiter.acquire("b.example.com")
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    def test_adapts_to_throttling(self):
+        limiter = http.RateLimiter(rate=10, min_rate=1, increase=1)
+        limiter.update("example.com", 429)
+        self.assertEqual(limiter.get_rate("example.com"), 5)
+        limiter.update("example.com", 503)
+        limiter.update("example.com", 503)
+        limiter.update("example.com", 503)
+        self.assertEqual(limiter.get_rate("example.com"), 1)
+        limiter.update("example.com", 200)
+        self.assertEqual(limiter.get_rate("example.com"), 2)
+        limiter.update("example.com", 500)
+        limiter.update("example.com", 404)
+        self.assertEqual(limiter.get_rate("example.com"), 2)
+        for _ in range(20):
+            limiter.update("example.com", 200)
+        self.assertEqual(limiter.get_rate("example.com"), 10)
+
+
+class RecordingInstrumentation(http.Instrumentation if http else object):
+    def __init__(self):
+        self.requests = []
+        self.downloads = []
+
+    def record_request(self, timing):
+        self.requests.append(timing)
+
+    def record_download(self, url, size, seconds):
+        self.downloads.append((url, size, seconds))
+
+
+class InstrumentationTestCase(HttpTestCase):
+    def test_records_requests(self):
+        instrumentation = RecordingInstrumentation()
+        client = http.HttpClient(instrumentation=instrumentation)
+        client.get(self.url("/ok/a"))
+        client.get(self.url("/missing/b"))
+
+        first, second = instrumentation.requests
+        self.assertEqual((first.method, first.url, first.status), ("GET", self.url("/ok/a"), 200))
+        self.assertEqual(first.host, urlsplit(self.server.base_url).netloc)
+        self.assertFalse(first.reused_connection)
+        self.assertIsNotNone(first.connect)
+        self.assertGreater(first.bytes_out, 0)
+        self.assertEqual(first.bytes_in, len("/ok/a"))
+        self.assertGreaterEqual(first.total, first.ttfb)
+        self.assertEqual(second.status, 404)
+        self.assertTrue(second.reused_connection)
+        self.assertIsNone(second.connect)
+
+    def test_records_time_to_first_byte(self):
+        instrumentation = RecordingInstrumentation()
+        client = http.HttpClient(instrumentation=instrumentation)
+        client.get(self.url("/slow/a"))
+        client.get(self.url("/slow/b"), stream=True).close()
+        for timing in instrumentation.requests:
+            self.assertGreaterEqual(timing.ttfb, 0.05)
+            self.assertGreaterEqual(timing.total, timing.ttfb)
+
+    def test_records_retries_and_errors(self):
+        instrumentation = RecordingInstrumentation()
+        client = http.HttpClient(instrumentation=instrumentation, retry_policy=http.RetryPolicy(backoff_factor=0.01))
+        client.get(self.url("/flaky/a"))
+        with self.assertRaises(requests.ConnectionError):
+            client.get("http://127.0.0.1:1/refused")
+        self.assertEqual(instrumentation.requests[0].retries, 2)
+        self.assertEqual(instrumentation.requests[1].error, "ConnectionError")
+        self.assertIsNone(instrumentation.requests[1].status)
+
+    def test_timed_connections_only_with_instrumentation(self):
+        adapter = http.HttpClient()._session.get_adapter(self.server.base_url)
+        self.assertIs(adapter.poolmanager.pool_classes_by_scheme["http"], urllib3.connectionpool.HTTPConnectionPool)
+
+        adapter = http.HttpClient(instrumentation=RecordingInstrumentation())._session.get_adapter(self.server.base_url)
+        pool_cls = adapter.poolmanager.pool_classes_by_scheme["http"]
+        self.assertTrue(issubclass(pool_cls, urllib3.connectionpool.HTTPConnectionPool))
+        self.assertTrue(issubclass(pool_cls.ConnectionCls, urllib3.connection.HTTPConnection))
+
+    @unittest.skipIf(socks is None, "PySocks is not installed")
+    def test_socks_proxy_keeps_its_connections(self):
+        instrumentation = RecordingInstrumentation()
+        client = http.HttpClient(instrumentation=instrumentation)
+        proxies = {"http": "socks5://127.0.0.1:1", "https": "socks5://127.0.0.1:1"}
+        with self.assertRaises(requests.ConnectionError):
+            client.get(self.url("/ok/a"), proxies=proxies)
+
+        manager = client._session.get_adapter(self.server.base_url).proxy_manager["socks5://127.0.0.1:1"]
+        self.assertTrue(issubclass(manager.pool_classes_by_scheme["http"].ConnectionCls, socks.SOCKSConnection))
+        self.assertEqual(instrumentation.requests[0].error, "ConnectionError")
+
+    def test_records_download_throughput(self):
+        instrumentation = RecordingInstrumentation()
+        client = http.HttpClient(instrumentation=instrumentation)
+        with tempfile.TemporaryDirectory() as directory:
+            client.download_file(self.url("/file/a"), pathlib.Path(directory) / "a.bin")
+            client.download_file(self.url("/file/b"), pathlib.Path(directory) / "b.bin", parts=2)
+        self.assertEqual(
+            [(url, size) for url, size, _seconds in instrumentation.downloads],
+            [
+                (self.url("/file/a"), len(FILE_BODY)),
+                (self.url("/file/b"), len(FILE_BODY)),
+            ],
+        )
+
+    def test_http_metrics(self):
+        metrics = http.HttpMetrics()
+        client = http.HttpClient(instrumentation=metrics)
+        for _ in range(3):
+            client.get(self.url("/ok/a"))
+        host = urlsplit(self.server.base_url).netloc
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot["counters"]["requests"][host], {"200": 3})
+        self.assertEqual(snapshot["counters"]["connections"][host], {"new": 1, "reused": 2})
+        self.assertEqual(snapshot["histograms"]["total_seconds"][host]["count"], 3)
+        self.assertEqual(snapshot["histograms"]["connect_seconds"][host]["count"], 1)
+        self.assertIn(f'apptk_http_requests_total{{host="{host}",label="200"}} 3', metrics.to_prometheus())
+
+
+@unittest.skipIf(http is None, "requests is not installed")
+class HistogramTestCase(TestCase):
+    def test_histogram(self):
+        histogram = http.Histogram([1, 2, 4])
+        for value in (0.5, 1, 1.5, 3, 10):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual(list(snapshot["buckets"].values()), [2, 1, 1, 1])
+        self.assertEqual(snapshot["count"], 5)
+        self.assertEqual(snapshot["sum"], 16)
+        self.assertEqual(histogram.quantile(0.5), 2)
+        self.assertEqual(histogram.quantile(1), float("inf"))
+
+
+COOKIE_FILE = """\
+# Netscape HTTP Cookie File
+# This is a generated file! Do not edit.
+
+127.0.0.1\tFALSE\t/\tFALSE\t0\tsession\tabc
+#HttpOnly_.example.com\tTRUE\t/\tTRUE\t4102444800\ttoken\txyz
+.example.com\tTRUE\t/\tFALSE\t1\texpired\told
+"""
+
+
+class CookieJarTestCase(HttpTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = pathlib.Path(directory.name) / "cookies.txt"
+        self.path.write_text(COOKIE_FILE)
+
+    def test_parse_cookie_file(self):
+        cookies = {cookie.name: cookie for cookie in http.parse_cookie_file(self.path)}
+        self.assertEqual(sorted(cookies), ["session", "token"])
+        self.assertEqual(cookies["session"].value, "abc")
+        self.assertTrue(cookies["session"].discard)
+        self.assertEqual(cookies["token"].domain, ".example.com")
+        self.assertTrue(cookies["token"].secure)
+        self.assertTrue(cookies["token"].has_nonstandard_attr("HttpOnly"))
+
+    def test_parse_invalid_line(self):
+        self.path.write_text("example.com\tFALSE\n")
+        with self.assertRaises(ValueError):
+            http.parse_cookie_file(self.path)
+
+    def test_load_cookie_jar_is_cached_by_mtime(self):
+        first = http.load_cookie_jar(self.path)
+        cached = http._cookie_file_cache[str(self.path)]
+        second = http.load_cookie_jar(self.path)
+        self.assertIs(http._cookie_file_cache[str(self.path)], cached)
+        self.assertEqual(len(first), 2)
+        self.assertEqual(len(second), 2)
+
+        self.path.write_text(COOKIE_FILE.replace("abc", "def"))
+        os.utime(self.path, ns=(time.time_ns() + 10**9, time.time_ns() + 10**9))
+        values = {cookie.name: cookie.value for cookie in http.load_cookie_jar(self.path)}
+        self.assertEqual(values["session"], "def")
+
+    def test_client_sends_cookies(self):
+        http.HttpClient(cookies=self.path).get(self.url("/ok/a"))
+        _command, _path, headers = self.server.requests[0]
+        self.assertEqual(headers.get("Cookie"), "session=abc")
+
+
+@unittest.skipIf(http is None or aiohttp is None, "requests and aiohttp are not installed")
+class AsyncHttpClientTestCase(StandInServerMixin, IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.start_server()
+
+    async def test_headers(self):
+        class Client(http.AsyncHttpClient):
+            _headers = {"X-Class": "class"}
+
+        async with Client(headers={"X-Instance": "instance"}) as client:
+            async with client.get(self.url("/ok/1")) as response:
+                self.assertEqual(await response.text(), "/ok/1")
+
+        headers = self.server.requests[0][2]
+        self.assertEqual(headers["User-Agent"], http.DEFAULT_HEADERS["User-Agent"])
+        self.assertEqual(headers["X-Class"], "class")
+        self.assertEqual(headers["X-Instance"], "instance")
+
+    async def test_concurrent_requests_reuse_connections(self):
+        async with http.AsyncHttpClient(limit_per_host=4) as client:
+
+            async def fetch(index):
+                async with client.get(self.url(f"/slow/{index}")) as response:
+                    return await response.text()
+
+            result = await asyncio.gather(*(fetch(index) for index in range(16)))
+
+        self.assertEqual(result, [f"/slow/{index}" for index in range(16)])
+        self.assertLessEqual(self.server.max_active, 4)
+
+    async def test_download_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = pathlib.Path(directory) / "download.txt"
+            async with http.AsyncHttpClient() as client:
+                result = await client.download_file(self.url("/ok/file"), filename, chunk_size=2)
+            self.assertEqual(result, filename)
+            self.assertEqual(filename.read_text(), "/ok/file")
+
+    async def test_download_file_writes_off_the_event_loop(self):
+        write_threads = set()
+
+        class RecordingFile(io.FileIO):
+            def write(self, data):
+                write_threads.add(threading.get_ident())
+                return super().write(data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            filename = pathlib.Path(directory) / "download.bin"
+            with mock.patch.object(http, "ASYNC_WRITE_BUFFER_SIZE", 3000), mock.patch(
+                "builtins.open", lambda path, mode: RecordingFile(path, mode.replace("b", ""))
+            ):
+                async with http.AsyncHttpClient() as client:
+                    await client.download_file(self.url("/file/a"), filename, chunk_size=1000)
+            self.assertEqual(filename.read_bytes(), FILE_BODY)
+            self.assertTrue(write_threads)
+            self.assertNotIn(threading.get_ident(), write_threads)
+
+    async def test_download_file_raises_for_status(self):
+        with tempfile.TemporaryDirectory() as directory:
+            async with http.AsyncHttpClient() as client:
+                with self.assertRaises(aiohttp.ClientResponseError):
+                    await client.download_file(self.url("/missing/file"), pathlib.Path(directory) / "missing.txt")
@@ -1,8 +1,13 @@
-from unittest import TestCase
+from concurrent.futures import ThreadPoolExecutor
+import io
+import os
+import pathlib
+import tempfile
+from unittest import TestCase, mock
 
 from apptk import images
 
-from .helpers import get_test_data
+from .helpers import TEST_DATA_DIR, get_test_data
 
 
 class FileExtensionFromMimetypeTestCase(TestCase):
@@ -60,3 +65,149 @@ class CheckIfJpegTestCase(TestCase):
     def test_rejects_mng(self):
         mng_file = get_test_data("sample.mng", use_bytes=True)
         self.assertFalse(images.check_if_jpeg(mng_file))
+
+
+class DetectImageTypeTestCase(TestCase):
+    HEADERS = {
+        "png": b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR",
+        "mng": b"\x8aMNG\r\n\x1a\n\x00\x00\x00\x1cMHDR",
+        "jpeg": b"\xff\xd8\xff\xe0\x00\x10JFIF\x00",
+        "gif": b"GIF89a\x01\x00\x01\x00",
+        "webp": b"RIFF\x24\x00\x00\x00WEBPVP8 ",
+        "bmp": b"BM\x36\x00\x00\x00",
+        "tiff": b"MM\x00*\x00\x00\x00\x08",
+        "ico": b"\x00\x00\x01\x00\x01\x00\x10\x10",
+        "jp2": b"\x00\x00\x00\x0cjP  \r\n\x87\n\x00\x00",
+        "djvu": b"AT&TFORM\x00\x00\x00\x10DJVUINFO",
+        "svg": b'\xef\xbb\xbf<?xml version="1.0"?>\n<svg xmlns="http://www.w3.org/2000/svg"/>',
+    }
+
+    def test_formats(self):
+        for format, header in self.HEADERS.items():
+            with self.subTest(format=format):
+                image_type = images.detect_image_type(header)
+                self.assertEqual(image_type.format, format)
+                self.assertEqual(image_type.extension, images.get_file_extension_for_mimetype(image_type.mimetype))
+
+    def test_covers_every_mimetype(self):
+        detected = {images.detect_image_type(header).extension for header in self.HEADERS.values()}
+        self.assertEqual(detected, set(images.MIMETYPE_TO_EXTENSION_MAP.values()))
+
+    def test_unknown(self):
+        self.assertIsNone(images.detect_image_type(b""))
+        self.assertIsNone(images.detect_image_type(b"RIFF\x24\x00\x00\x00WAVEfmt "))
+        self.assertIsNone(images.detect_image_type(b"<html><body></body></html>"))
+
+    def test_sample_files(self):
+        for filename, format in [("sample.jpg", "jpeg"), ("sample.png", "png"), ("sample.mng", "mng")]:
+            with self.subTest(filename=filename):
+                self.assertEqual(images.detect_image_type(TEST_DATA_DIR / filename).format, format)
+                self.assertEqual(images.detect_image_type(str(TEST_DATA_DIR / filename)).format, format)
+
+    def test_streams_are_not_consumed(self):
+        with (TEST_DATA_DIR / "sample.png").open("rb") as fh:
+            self.assertEqual(images.detect_image_type(fh).format, "png")
+            self.assertEqual(fh.tell(), 0)
+
+        stream = io.BytesIO(b"xx" + self.HEADERS["gif"])
+        stream.seek(2)
+        self.assertEqual(images.detect_image_type(stream).format, "gif")
+        self.assertEqual(stream.tell(), 2)
+
+
+class ClassifyImagesTestCase(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = pathlib.Path(directory.name)
+        (self.root / "nested" / "deeper").mkdir(parents=True)
+
+        self.files = {
+            "photo.jpeg": get_test_data("sample.jpg", use_bytes=True),
+            "nested/photo.png": get_test_data("sample.jpg", use_bytes=True),
+            "nested/animation.mng": get_test_data("sample.mng", use_bytes=True),
+            "nested/deeper/image": get_test_data("sample.png", use_bytes=True),
+            "nested/deeper/notes.txt": b"not an image",
+        }
+        for name, data in self.files.items():
+            (self.root / name).write_bytes(data)
+
+    def classify(self, paths, **kwargs):
+        return {
+            os.path.relpath(path, self.root): image_type.format if image_type else None
+            for path, image_type in images.classify_images(paths, **kwargs)
+        }
+
+    def test_iter_files(self):
+        found = {os.path.relpath(path, self.root) for path in images.iter_files(self.root)}
+        self.assertEqual(found, {os.path.normpath(name) for name in self.files})
+
+    def test_classify_directory(self):
+        expected = {
+            "photo.jpeg": "jpeg",
+            "nested/photo.png": "jpeg",
+            "nested/animation.mng": "mng",
+            "nested/deeper/image": "png",
+            "nested/deeper/notes.txt": None,
+        }
+        self.assertEqual(self.classify(self.root, workers=2), {os.path.normpath(k): v for k, v in expected.items()})
+
+    def test_classify_paths(self):
+        paths = [self.root / "photo.jpeg", str(self.root / "nested" / "animation.mng")]
+        self.assertEqual(self.classify(paths), {"photo.jpeg": "jpeg", os.path.join("nested", "animation.mng"): "mng"})
+
+    def test_fix_extensions(self):
+        results = self.classify(self.root, fix_extensions=True)
+        self.assertEqual(results[os.path.join("nested", "photo.jpg")], "jpeg")
+        self.assertEqual(results[os.path.join("nested", "deeper", "image.png")], "png")
+        self.assertEqual(results["photo.jpeg"], "jpeg")
+        self.assertFalse((self.root / "nested" / "photo.png").exists())
+        self.assertTrue((self.root / "nested" / "deeper" / "notes.txt").exists())
+
+    def test_fix_extension_does_not_overwrite(self):
+        (self.root / "nested" / "photo.jpg").write_bytes(b"taken")
+        path = images.fix_extension(self.root / "nested" / "photo.png", images.JPEG)
+        self.assertEqual(path, str(self.root / "nested" / "photo.png"))
+        self.assertEqual((self.root / "nested" / "photo.jpg").read_bytes(), b"taken")
+
+    def test_fix_extensions_yields_each_file_once(self):
+        directory = self.root / "many"
+        directory.mkdir()
+        for index in range(3000):
+            (directory / f"{index}.bin").write_bytes(self.files["nested/deeper/image"])
+
+        results = list(images.classify_images(directory, fix_extensions=True))
+        self.assertEqual(len(results), 3000)
+        self.assertEqual(len({path for path, _image_type in results}), 3000)
+        self.assertTrue(all(path.endswith(".png") for path, _image_type in results))
+
+    def test_fix_extension_concurrently(self):
+        names = [f"photo.{extension}" for extension in ("png", "gif", "bmp", "webp", "tiff", "mng", "jp2", "ico")]
+        for index, name in enumerate(names):
+            (self.root / name).write_bytes(str(index).encode())
+
+        with ThreadPoolExecutor(max_workers=len(names)) as executor:
+            paths = list(executor.map(lambda name: images.fix_extension(self.root / name, images.JPEG), names))
+
+        self.assertEqual(sum(1 for path in paths if path.endswith(".jpg")), 1)
+        contents = sorted(pathlib.Path(path).read_bytes() for path in paths)
+        self.assertEqual(contents, sorted(str(index).encode() for index in range(len(names))))
+
+    def test_fix_extension_without_hard_links(self):
+        with mock.patch("os.link", side_effect=PermissionError):
+            path = images.fix_extension(self.root / "nested" / "photo.png", images.JPEG)
+            self.assertEqual(path, str(self.root / "nested" / "photo.jpg"))
+            self.assertEqual(pathlib.Path(path).read_bytes(), self.files["nested/photo.png"])
+            self.assertFalse((self.root / "nested" / "photo.png").exists())
+
+            (self.root / "nested" / "photo.png").write_bytes(b"second")
+            path = images.fix_extension(self.root / "nested" / "photo.png", images.JPEG)
+            self.assertEqual(path, str(self.root / "nested" / "photo.png"))
+            self.assertEqual((self.root / "nested" / "photo.jpg").read_bytes(), self.files["nested/photo.png"])
+
+    def test_missing_files(self):
+        missing = self.root / "missing.png"
+        with self.assertRaises(FileNotFoundError):
+            self.classify([missing])
+        results = dict(images.classify_images([missing], return_exceptions=True))
+        self.assertIsInstance(results[str(missing)], FileNotFoundError)
@@ -1,7 +1,40 @@
+from array import array
 import base64
+import copy
+import pathlib
+import pickle
+import random
+import tempfile
+import unittest
 from unittest import TestCase
 
-from apptk.protobuf import Data, ValueTypes, decode_buffer, decode_buffer_segment, decode_varint
+from apptk import protobuf
+from apptk.protobuf import (
+    EMPTY_FIELDS,
+    MAX_VARINT_LENGTH,
+    BufferReader,
+    Data,
+    GrpcStreamDecoder,
+    ProtoBufFields,
+    ValueTypes,
+    available_backends,
+    compile_projection,
+    decode_buffer,
+    decode_buffer_segment,
+    decode_file,
+    decode_grpc_stream,
+    decode_many,
+    decode_packed_varints,
+    decode_projection,
+    decode_varint,
+    decode_varints,
+    encode_buffer,
+    encode_varint,
+    get_backend,
+    register_backend,
+    set_backend,
+    varint_size,
+)
 
 
 class DecodeVarIntTestCase(TestCase):
@@ -22,6 +55,35 @@ class DecodeVarIntTestCase(TestCase):
         with self.assertRaises(OverflowError):
             decode_varint(buffer, offset=1)
 
+    def test_decode_single_byte_varint(self):
+        self.assertEqual(decode_varint(b"\x08", offset=0), (8, 1))
+
+    def test_decode_max_length_varint(self):
+        buffer = b"\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\xFF\x01"
+        self.assertEqual(decode_varint(buffer, offset=0), (2**64 - 1, 10))
+
+    def test_raises_error_on_overlong_varint(self):
+        buffer = b"\xFF" * 10 + b"\x01"
+        with self.assertRaises(ValueError):
+            decode_varint(buffer, offset=0)
+
+    def test_raises_error_on_truncated_multibyte_varint(self):
+        with self.assertRaises(OverflowError):
+            decode_varint(b"\xAC\xAC\xAC", offset=0)
+
+    def test_decode_varints(self):
+        buffer = b"\x00\x03\xAC\x02\x8E\x02\x9E\xA7\x05"
+        self.assertEqual(decode_varints(buffer, offset=1, count=4), ([3, 300, 270, 86942], 8))
+
+    def test_decode_varints_raises_error_when_short(self):
+        with self.assertRaises(OverflowError):
+            decode_varints(b"\x03\x04", offset=0, count=3)
+
+    def test_decode_packed_varints(self):
+        buffer = b"\x03\x8E\x02\x9E\xA7\x05" + b"\xFF" * 9 + b"\x01"
+        result = decode_packed_varints(buffer)
+        self.assertEqual(result, array("q", [3, 270, 86942, -1]))
+
 
 class DecodeBufferSegmentTestCase(TestCase):
     def test_empty_protobuf(self):
@@ -74,3 +136,461 @@ class DecodeBufferSegmentTestCase(TestCase):
         result = decode_buffer_segment(b"\x12\x34\x56")
         expected = ([], b"\x12\x34\x56")
         self.assertEqual(result, expected)
+
+
+class ZeroCopyTestCase(TestCase):
+    def test_read_buffer_returns_view(self):
+        buffer = bytearray(b"\x01\x02\x03\x04")
+        reader = BufferReader(buffer, zero_copy=True)
+        result = reader.read_buffer(2)
+        self.assertIsInstance(result, memoryview)
+        buffer[0] = 0xFF
+        self.assertEqual(result, b"\xFF\x02")
+
+    def test_decode_string_as_view(self):
+        parts, leftovers = decode_buffer_segment(b"\x12\x07\x74\x65\x73\x74\x69\x6e\x67", zero_copy=True)
+        self.assertIsInstance(parts[0]["value"], memoryview)
+        self.assertEqual(parts[0]["value"], b"testing")
+        self.assertIsInstance(leftovers, memoryview)
+        self.assertEqual(leftovers, b"")
+
+    def test_decode_buffer_as_bytes(self):
+        result = decode_buffer(b"\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67", zero_copy=True)
+        self.assertEqual(result[0].as_bytes(), 150)
+        self.assertIsInstance(result[1].value, memoryview)
+        self.assertEqual(result[1].as_bytes(), b"testing")
+        self.assertIsInstance(result[1].as_bytes(), bytes)
+
+    def test_zero_copy_matches_copying_decode(self):
+        buffer = b"\x00\x00\x00\x00\x0c\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67"
+        self.assertEqual(decode_buffer(buffer, zero_copy=True), decode_buffer(buffer))
+
+
+class DecodeBufferTestCase(TestCase):
+    def test_decode_sub_message(self):
+        result = decode_buffer(b"\x0a\x03\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67")
+        expected = [
+            Data(
+                field_no=1,
+                value=b"\x08\x96\x01",
+                value_type=ValueTypes.STRING,
+                sub_fields=[Data(field_no=1, value=150, value_type=ValueTypes.VARINT)],
+            ),
+            Data(field_no=2, value=b"testing", value_type=ValueTypes.STRING),
+        ]
+        self.assertEqual(result, expected)
+
+    def test_decode_nested_sub_messages(self):
+        result = decode_buffer(b"\x0a\x05\x1a\x03\x08\x96\x01")
+        self.assertEqual(result.get_field(1).sub_fields.get_field(3).sub_fields.get_field(1).value, 150)
+
+    def test_max_depth(self):
+        buffer = b"\x0a\x05\x1a\x03\x08\x96\x01"
+        self.assertEqual(decode_buffer(buffer, max_depth=0).get_field(1).sub_fields, [])
+        result = decode_buffer(buffer, max_depth=1)
+        self.assertEqual(result.get_field(1).sub_fields.get_field(3).value, b"\x08\x96\x01")
+        self.assertEqual(result.get_field(1).sub_fields.get_field(3).sub_fields, [])
+
+
+class GrpcStreamDecoderTestCase(TestCase):
+    frames = (
+        b"\x00\x00\x00\x00\x03\x08\x96\x01"
+        b"\x00\x00\x00\x00\x09\x12\x07\x74\x65\x73\x74\x69\x6e\x67"
+        b"\x80\x00\x00\x00\x0fgrpc-status:0\r\n"
+    )
+
+    def test_decode_whole_body(self):
+        decoder = GrpcStreamDecoder()
+        result = decoder.feed(self.frames)
+        decoder.close()
+        expected = [
+            [Data(field_no=1, value=150, value_type=ValueTypes.VARINT)],
+            [Data(field_no=2, value=b"testing", value_type=ValueTypes.STRING)],
+        ]
+        self.assertEqual(result, expected)
+        self.assertEqual(decoder.trailers, {"grpc-status": "0"})
+
+    def test_decode_byte_at_a_time(self):
+        chunks = [self.frames[i : i + 1] for i in range(len(self.frames))]
+        result = list(decode_grpc_stream(chunks))
+        self.assertEqual(len(result), 2)
+        self.assertEqual(result[1].get_field(2).value, b"testing")
+
+    def test_yields_frames_as_they_complete(self):
+        decoder = GrpcStreamDecoder()
+        self.assertEqual(decoder.feed(self.frames[:6]), [])
+        self.assertEqual(len(decoder.feed(self.frames[6:10])), 1)
+
+    def test_empty_frame(self):
+        self.assertEqual(list(decode_grpc_stream([b"\x00\x00\x00\x00\x00"])), [[]])
+
+    def test_truncated_stream(self):
+        with self.assertRaises(ValueError):
+            list(decode_grpc_stream([self.frames[:-1]]))
+
+    def test_compressed_frame(self):
+        with self.assertRaises(ValueError):
+            GrpcStreamDecoder().feed(b"\x01\x00\x00\x00\x00")
+
+
+class ProtoBufFieldsTestCase(TestCase):
+    def setUp(self):
+        self.fields = ProtoBufFields(
+            [
+                Data(field_no=1, value=1, value_type=ValueTypes.VARINT),
+                Data(field_no=2, value=2, value_type=ValueTypes.VARINT),
+                Data(field_no=1, value=3, value_type=ValueTypes.VARINT),
+            ]
+        )
+
+    def test_get_field(self):
+        self.assertEqual(self.fields.get_field(1).value, 1)
+        self.assertIsNone(self.fields.get_field(3))
+
+    def test_get_fields(self):
+        self.assertEqual([item.value for item in self.fields.get_fields(1)], [1, 3])
+        self.assertEqual(self.fields.get_fields(3), [])
+
+    def test_append_updates_index(self):
+        self.fields.get_field(1)
+        self.fields.append(Data(field_no=3, value=4, value_type=ValueTypes.VARINT))
+        self.fields.append(Data(field_no=1, value=5, value_type=ValueTypes.VARINT))
+        self.assertEqual(self.fields.get_field(3).value, 4)
+        self.assertEqual([item.value for item in self.fields.get_fields(1)], [1, 3, 5])
+
+    def test_modification_rebuilds_index(self):
+        self.fields.get_field(1)
+        del self.fields[0]
+        self.assertEqual(self.fields.get_field(1).value, 3)
+        self.fields.insert(0, Data(field_no=2, value=6, value_type=ValueTypes.VARINT))
+        self.assertEqual(self.fields.get_field(2).value, 6)
+        self.fields.reverse()
+        self.assertEqual(self.fields.get_field(2).value, 2)
+
+    def test_copies_do_not_share_index(self):
+        self.fields.get_field(1)
+        for copied in [copy.copy(self.fields), copy.deepcopy(self.fields), pickle.loads(pickle.dumps(self.fields))]:
+            with self.subTest(copied=copied):
+                self.assertIs(type(copied), ProtoBufFields)
+                copied.append(Data(field_no=9, value=7, value_type=ValueTypes.VARINT))
+                self.assertEqual(copied.get_field(9).value, 7)
+                self.assertEqual([item.value for item in copied.get_fields(1)], [1, 3])
+                self.assertIsNone(self.fields.get_field(9))
+                self.assertEqual(len(self.fields), 3)
+
+    def test_empty_fields_copies(self):
+        self.assertIs(copy.copy(EMPTY_FIELDS), EMPTY_FIELDS)
+        self.assertIs(copy.deepcopy(EMPTY_FIELDS), EMPTY_FIELDS)
+        self.assertIs(pickle.loads(pickle.dumps(EMPTY_FIELDS)), EMPTY_FIELDS)
+
+    def test_get_path(self):
+        fields = decode_buffer(b"\x0a\x05\x1a\x03\x08\x96\x01")
+        self.assertEqual(fields.get_path("1.3.1").value, 150)
+        self.assertEqual(fields.get_path([1, 3, 1]).value, 150)
+        self.assertIs(fields.get_path("1.3"), fields.get_field(1).sub_fields.get_field(3))
+        self.assertIsNone(fields.get_path("1.2.1"))
+        self.assertEqual(fields.get_path("1.3.1.4", default=0), 0)
+
+
+class DecodeProjectionTestCase(TestCase):
+    # 1: 150, 2: "testing", 3: {1: {7: 300}, 2: 1}, 4: fixed32
+    buffer = (
+        b"\x08\x96\x01"
+        b"\x12\x07\x74\x65\x73\x74\x69\x6e\x67"
+        b"\x1a\x07\x0a\x03\x38\xac\x02\x10\x01"
+        b"\x25\xab\xaa\x20\x40"
+    )
+
+    def test_compile_paths(self):
+        self.assertEqual(compile_projection({"1", "3.1.7", (3, 2)}), {1: None, 3: {1: {7: None}, 2: None}})
+
+    def test_compile_schema(self):
+        self.assertEqual(compile_projection({1: None, "3": {1: True}}), {1: None, 3: {1: None}})
+
+    def test_compile_leaf_and_subtree(self):
+        self.assertEqual(compile_projection(["3.1", "3"]), {3: {1: None}})
+        self.assertEqual(compile_projection(["3", "3.1"]), {3: {1: None}})
+
+    def test_only_projected_fields_are_decoded(self):
+        result = decode_projection(self.buffer, {"1", "4"})
+        expected = [
+            Data(field_no=1, value=150, value_type=ValueTypes.VARINT),
+            Data(field_no=4, value=b"\xab\xaa\x20\x40", value_type=ValueTypes.FIXED32),
+        ]
+        self.assertEqual(result, expected)
+
+    def test_only_projected_sub_messages_are_decoded(self):
+        result = decode_projection(self.buffer, {"2", "3.1.7"})
+        self.assertEqual(result.get_field(2).sub_fields, [])
+        self.assertEqual(result.get_path("3.1.7").value, 300)
+        self.assertIsNone(result.get_path("3.2"))
+
+    def test_matches_decode_buffer(self):
+        result = decode_projection(self.buffer, {"3.1.7"})
+        self.assertEqual(result.get_path("3.1.7"), decode_buffer(self.buffer).get_path("3.1.7"))
+
+    def test_stops_at_truncated_field(self):
+        result = decode_projection(self.buffer[:-2], {"1", "4"})
+        self.assertEqual([item.field_no for item in result], [1])
+
+
+class DataTestCase(TestCase):
+    def test_leaf_fields_share_empty_sub_fields(self):
+        result = decode_buffer(b"\x08\x96\x01\x10\x01")
+        self.assertIs(result[0].sub_fields, EMPTY_FIELDS)
+        self.assertIs(result[1].sub_fields, EMPTY_FIELDS)
+
+    def test_empty_sub_fields_are_read_only(self):
+        with self.assertRaises(TypeError):
+            Data(field_no=1, value=1, value_type=ValueTypes.VARINT).sub_fields.append(None)
+
+    def test_no_instance_dict(self):
+        with self.assertRaises(AttributeError):
+            Data(field_no=1, value=1, value_type=ValueTypes.VARINT).extra = True
+
+    def test_pickle_round_trip(self):
+        result = decode_buffer(b"\x0a\x03\x08\x96\x01\x10\x01")
+        unpickled = pickle.loads(pickle.dumps(result))
+        self.assertEqual(unpickled, result)
+        self.assertIs(unpickled[1].sub_fields, EMPTY_FIELDS)
+
+
+class EncodeTestCase(TestCase):
+    def test_encode_varint(self):
+        self.assertEqual(encode_varint(0), b"\x00")
+        self.assertEqual(encode_varint(300), b"\xAC\x02")
+        self.assertEqual(encode_varint(-1), b"\xFF" * 9 + b"\x01")
+        self.assertEqual(decode_varint(encode_varint(2**63 + 5), offset=0), (2**63 + 5, 10))
+
+    def test_varint_size(self):
+        for value in (0, 1, 127, 128, 16383, 16384, 2**64 - 1, -1):
+            self.assertEqual(varint_size(value), len(encode_varint(value)))
+
+    def test_encode_fields(self):
+        fields = [
+            Data(field_no=1, value=150, value_type=ValueTypes.VARINT),
+            Data(field_no=2, value="testing", value_type=ValueTypes.STRING),
+            Data(field_no=2, value=1.5, value_type=ValueTypes.FIXED64),
+            Data(field_no=2, value=-2, value_type=ValueTypes.FIXED32),
+        ]
+        expected = (
+            b"\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67"
+            b"\x11\x00\x00\x00\x00\x00\x00\xf8\x3f\x15\xfe\xff\xff\xff"
+        )
+        self.assertEqual(encode_buffer(fields), expected)
+
+    def test_encode_sub_fields(self):
+        fields = decode_buffer(b"\x0a\x05\x1a\x03\x08\x96\x01")
+        fields.get_path("1.3.1").value = 2**20
+        self.assertEqual(encode_buffer(fields), b"\x0a\x06\x1a\x04\x08\x80\x80\x40")
+
+    def test_encode_edited_values_of_guessed_sub_messages(self):
+        # b"Hi" also decodes as a sub-message (field 9 = 105), but it's the value that was edited.
+        fields = decode_buffer(b"\x0a\x02Hi\x12\x04abcd")
+        self.assertTrue(fields.get_field(1).sub_fields)
+        fields.get_field(1).value = b"Hello world"
+        fields.get_field(2).value = b"xyz"
+        self.assertEqual(encode_buffer(fields), b"\x0a\x0bHello world\x12\x03xyz")
+
+        fields = decode_buffer(b"\x0a\x02Hi")
+        fields.get_path("1.9").value = 106
+        self.assertEqual(encode_buffer(fields), b"\x0a\x02Hj")
+
+    def test_untouched_sub_messages_keep_their_bytes(self):
+        # A guessed sub-message with a non-canonical (overlong) varint in it.
+        buffer = b"\x0a\x03\x08\x80\x00"
+        for zero_copy in (False, True):
+            with self.subTest(zero_copy=zero_copy):
+                fields = decode_buffer(buffer, zero_copy=zero_copy)
+                self.assertEqual(encode_buffer(fields), buffer)
+                fields.get_path("1.1").value = 5
+                self.assertEqual(encode_buffer(fields), b"\x0a\x02\x08\x05")
+        self.assertEqual(encode_buffer(copy.deepcopy(decode_buffer(buffer))), buffer)
+
+    def test_encode_grpc_frame(self):
+        fields = [Data(field_no=1, value=150, value_type=ValueTypes.VARINT)]
+        self.assertEqual(encode_buffer(fields, grpc_frame=True), b"\x00\x00\x00\x00\x03\x08\x96\x01")
+        self.assertEqual(encode_buffer([], grpc_frame=True), b"\x00\x00\x00\x00\x00")
+
+    def test_round_trip(self):
+        buffer = (
+            b"\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67"
+            b"\x1a\x07\x0a\x03\x38\xac\x02\x10\x01\x25\xab\xaa\x20\x40\x2a\x00"
+        )
+        self.assertEqual(encode_buffer(decode_buffer(buffer)), buffer)
+        self.assertEqual(encode_buffer(decode_buffer(buffer, zero_copy=True)), buffer)
+
+    def test_invalid_fixed_value(self):
+        with self.assertRaises(ValueError):
+            encode_buffer([Data(field_no=1, value=b"\x00", value_type=ValueTypes.FIXED32)])
+
+
+def _reference_decode_varint(buffer, offset):
+    result = 0
+    for length in range(1, MAX_VARINT_LENGTH + 1):
+        if offset >= len(buffer):
+            raise OverflowError()
+        byte = buffer[offset]
+        offset += 1
+        result += (byte & 0x7F) * 2 ** (7 * (length - 1))
+        if byte < 0x80:
+            return result, length
+    raise ValueError("Varint too long")
+
+
+def _reference_scan_segment(buffer, offset, data_cls, value_types):
+    reader = BufferReader(buffer)
+    reader.offset = offset
+    items = []
+
+    try:
+        while reader.bytes_left > 0:
+            reader.set_checkpoint()
+            tag = reader.read_varint()
+            value_type = value_types.get(tag & 0b111)
+            if value_type == ValueTypes.VARINT:
+                value = reader.read_varint()
+            elif value_type == ValueTypes.STRING:
+                value = reader.read_buffer(reader.read_varint())
+            elif value_type == ValueTypes.FIXED32:
+                value = reader.read_buffer(4)
+            elif value_type == ValueTypes.FIXED64:
+                value = reader.read_buffer(8)
+            else:
+                raise ValueError()
+            items.append(data_cls(tag >> 3, value, value_type))
+    except (ValueError, OverflowError):
+        reader.rollback_checkpoint()
+
+    return items, reader.offset
+
+
+class BackendParityTestCase(TestCase):
+    """Every registered backend must decode the corpus exactly like the pure-Python backend."""
+
+    corpus = [
+        b"",
+        b"\x00\x00\x00\x00\x00",
+        b"\x08\x96\x01",
+        b"\x00\x00\x00\x00\x03\x08\x96\x01",
+        b"\x12\x07\x74\x65\x73\x74\x69\x6e\x67",
+        b"\x11\xAB\xAA\xAA\xAA\xAA\xAA\x20\x40\x15\xAB\xAA\x20\x40",
+        b"\x0a\x05\x1a\x03\x08\x96\x01",
+        b"\x08\x96\x01\x12\x07\x74\x65\x73\x74\x69\x6e\x67\x1a\x07\x0a\x03\x38\xac\x02\x10\x01\x25\xab\xaa\x20\x40",
+        b"\x08" + b"\xFF" * 9 + b"\x01",
+        b"\x08" + b"\xFF" * 10 + b"\x01",
+        b"\x80\x80\x01\x00\xF8\xFF\xFF\xFF\x0F\x00",
+        b"\x12\x34\x56",
+        b"\x08\x96",
+        b"\x0b\x01",
+        b"\x15\xAB\xAA",
+        base64.b64decode("CgZ0ZXN0ZXISFAoHbmVzdGVkMRIJCgd0ZXN0aW5nGNIJIgA="),
+    ]
+
+    def setUp(self):
+        register_backend("reference", _reference_decode_varint, _reference_scan_segment)
+        self.addCleanup(protobuf._BACKENDS.pop, "reference")
+        self.addCleanup(set_backend, get_backend())
+
+    def decode_corpus(self, backend):
+        set_backend(backend)
+        return [
+            (
+                decode_buffer_segment(buffer),
+                decode_buffer(buffer),
+                decode_buffer(buffer, zero_copy=True),
+                decode_projection(buffer, {"1", "3.1.7"}),
+            )
+            for buffer in self.corpus
+        ]
+
+    def test_backends_match_python_backend(self):
+        expected = self.decode_corpus("python")
+        for backend in available_backends():
+            with self.subTest(backend=backend):
+                self.assertEqual(self.decode_corpus(backend), expected)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            set_backend("does-not-exist")
+
+
+@unittest.skipIf(protobuf._protobuf_speedups is None, "the compiled extension isn't built (see build.py)")
+class SpeedupsTestCase(TestCase):
+    """The compiled backend must match _py_decode_varint() / _py_scan_segment() exactly, errors included."""
+
+    def call(self, func, *args):
+        try:
+            return func(*args)
+        except (OverflowError, ValueError) as exc:
+            return type(exc)
+
+    def test_selected_by_default(self):
+        self.assertEqual(get_backend(), "speedups")
+
+    def test_decode_varint(self):
+        buffers = [b"", b"\x00", b"\x96\x01", b"\x80", b"\xFF" * 9 + b"\x01", b"\xFF" * 9 + b"\x7F", b"\xFF" * 11]
+        for buffer in buffers:
+            for offset in range(len(buffer) + 1):
+                with self.subTest(buffer=buffer, offset=offset):
+                    self.assertEqual(
+                        self.call(protobuf._protobuf_speedups.decode_varint, buffer, offset),
+                        self.call(protobuf._py_decode_varint, buffer, offset),
+                    )
+
+    def test_scan_segment_random_buffers(self):
+        rng = random.Random(1234)
+        alphabet = [0x00, 0x01, 0x02, 0x05, 0x08, 0x0A, 0x0D, 0x12, 0x15, 0x19, 0x7F, 0x80, 0x96, 0xFF]
+        for _ in range(2000):
+            buffer = bytes(rng.choice(alphabet) for _ in range(rng.randrange(0, 24)))
+            for wrap in (bytes, bytearray, memoryview):
+                with self.subTest(buffer=buffer, wrap=wrap):
+                    args = (wrap(buffer), 0, Data, protobuf._VALUE_TYPES)
+                    self.assertEqual(protobuf._protobuf_speedups.scan_segment(*args), protobuf._py_scan_segment(*args))
+
+    def test_scan_segment_keeps_buffer_type(self):
+        buffer = bytearray(b"\x12\x03abc")
+        items, _offset = protobuf._protobuf_speedups.scan_segment(memoryview(buffer), 0, Data, protobuf._VALUE_TYPES)
+        self.assertIsInstance(items[0].value, memoryview)
+
+
+class DecodeManyTestCase(TestCase):
+    buffers = [
+        b"\x08\x96\x01",
+        b"\x0a\x05\x1a\x03\x08\x96\x01",
+        b"",
+        b"\x00\x00\x00\x00\x09\x12\x07\x74\x65\x73\x74\x69\x6e\x67",
+    ]
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.paths = []
+        for index, buffer in enumerate(self.buffers):
+            path = pathlib.Path(directory.name) / f"{index}.bin"
+            path.write_bytes(buffer)
+            self.paths.append(path)
+
+    def test_decode_file(self):
+        for path, buffer in zip(self.paths, self.buffers):
+            self.assertEqual(decode_file(path), decode_buffer(buffer))
+
+    def test_decode_many_in_order(self):
+        sources = self.buffers + [str(path) for path in self.paths]
+        result = list(decode_many(sources, workers=2, max_pending=3))
+        expected = [decode_buffer(buffer) for buffer in self.buffers] * 2
+        self.assertEqual(result, expected)
+
+    def test_decode_many_as_completed(self):
+        result = dict(decode_many(self.paths, workers=2, ordered=False))
+        expected = {index: decode_buffer(buffer) for index, buffer in enumerate(self.buffers)}
+        self.assertEqual(result, expected)
+
+    def test_decode_many_with_projection(self):
+        result = list(decode_many(self.paths[:2], workers=1, projection={"1.3.1"}))
+        self.assertEqual(result[0].get_field(1).value, 150)
+        self.assertEqual(result[1].get_path("1.3.1").value, 150)
+
+    def test_zero_copy_not_supported(self):
+        with self.assertRaises(ValueError):
+            list(decode_many(self.buffers, zero_copy=True))